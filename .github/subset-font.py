@@ -0,0 +1,74 @@
+"""
+面板字体子集化，收集模板、插件数据文件与插件代码中可能出现的全部字符，生成 WOFF2 格式的字体子集
+
+    pip install fonttools brotli
+    python .github/subset-font.py
+
+模板中子集字体缺失的字符（如伤害计算接口返回的说明文字）会回退至完整字体
+"""
+
+import ast
+import json
+from pathlib import Path
+
+from fontTools import subset
+
+ROOT = Path(__file__).parent.parent
+DATA_DIR = ROOT / "data" / "gspanel"
+SOURCES = ["__utils__.py", "data_convert.py", "data_source.py"]
+EXTRA = "".join(chr(c) for c in range(0x20, 0x7F)) + "，。、：；！？（）「」『』《》·—…％＋－×"
+PRE, SUF = "\033[32m", "\033[0m"
+
+
+def collectJson(data, chars: set) -> None:
+    if isinstance(data, dict):
+        for k, v in data.items():
+            chars.update(str(k))
+            collectJson(v, chars)
+    elif isinstance(data, list):
+        for v in data:
+            collectJson(v, chars)
+    elif isinstance(data, str):
+        chars.update(data)
+
+
+def collectChars() -> str:
+    chars = set(EXTRA)
+    # 角色、武器、圣遗物名称、技能名称、评分规则等
+    for fn in ["char-data.json", "hash-trans.json", "calc-rule.json"]:
+        collectJson(json.loads((DATA_DIR / fn).read_text(encoding="UTF-8")), chars)
+    # 模板中的固定文字
+    for f in [*DATA_DIR.glob("*.html"), *DATA_DIR.glob("*.css")]:
+        chars.update(f.read_text(encoding="UTF-8"))
+    # 属性名称、提示信息等代码中的字符串
+    for fn in SOURCES:
+        tree = ast.parse((ROOT / "nonebot_plugin_gspanel" / fn).read_text("UTF-8"))
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                chars.update(node.value)
+    return "".join(sorted(c for c in chars if c.isprintable()))
+
+
+def subsetFont(src: Path, text: str) -> Path:
+    dst = src.with_suffix(".woff2")
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["*"]
+    options.hinting = False
+    options.desubroutinize = True
+    font = subset.load_font(str(src), options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=text)
+    subsetter.subset(font)
+    subset.save_font(font, str(dst), options)
+    return dst
+
+
+if __name__ == "__main__":
+    text = collectChars()
+    src = DATA_DIR / "font" / "HYWH-65W.ttf"
+    dst = subsetFont(src, text)
+    print(
+        f"{PRE}字体子集生成完成！{SUF}共 {len(text)} 个字符，"
+        f"{src.stat().st_size // 1024} KB -> {dst.stat().st_size // 1024} KB"
+    )
@@ -0,0 +1,113 @@
+"""
+面板缓存编解码基准测试，对比各编码方式下单个 UID 缓存的大小与编码、解码耗时
+
+    python benchmarks/bench_codec.py
+    python benchmarks/bench_codec.py --codecs json,orjson+zstd --save codec.json
+
+缓存内容由 ``fixtures`` 中录制的 Enka.Network、提瓦特小助手返回数据转换得到，未安装可选依赖的编码方式自动跳过
+"""
+
+import sys
+import json
+import asyncio
+import argparse
+from shutil import copy
+from pathlib import Path
+from tempfile import mkdtemp
+from time import perf_counter
+from typing import Any, Dict, Callable
+
+import nonebot
+
+ROOT = Path(__file__).parent.parent
+FIXTURES = Path(__file__).parent / "fixtures"
+DEFAULT_CODECS = (
+    "json,json+gzip,json+zstd,orjson,orjson+gzip,orjson+zstd,msgpack,msgpack+zstd"
+)
+
+# 离线模式：插件数据文件使用仓库内 data/gspanel 的版本
+RES_DIR = Path(mkdtemp(prefix="gspanel-codec-"))
+(RES_DIR / "gspanel").mkdir()
+for f in (ROOT / "data" / "gspanel").glob("*.json"):
+    copy(f, RES_DIR / "gspanel" / f.name)
+nonebot.init(resources_dir=str(RES_DIR), gspanel_offline=True)
+sys.path.insert(0, str(ROOT))
+nonebot.load_plugin("nonebot_plugin_gspanel")
+
+from nonebot_plugin_gspanel.data_codec import Codec  # noqa: E402
+from nonebot_plugin_gspanel.data_convert import (  # noqa: E402
+    transFromEnka,
+    simplDamageRes,
+)
+
+ENKA = json.loads((FIXTURES / "enka-100000001.json").read_text(encoding="utf-8"))
+TEYVAT_SINGLE = json.loads(
+    (FIXTURES / "teyvat-single.json").read_text(encoding="utf-8")
+)
+
+
+async def buildRecord() -> Dict:
+    """与 getAvatarData() 写入的缓存记录结构一致"""
+    now = 1672531200
+    avatars = [await transFromEnka(a, now) for a in ENKA["avatarInfoList"]]
+    for a, dmg in zip(avatars, TEYVAT_SINGLE["result"]):
+        a["damage"] = await simplDamageRes(dmg)
+    return {"avatars": avatars, "next": now + 60, "schema": 2}
+
+
+def dumpsLegacy(data: Dict) -> bytes:
+    """旧版缓存写入方式，作为对比基线"""
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def timeit(func: Callable[[], Any], rounds: int) -> float:
+    """平均单次耗时（毫秒）"""
+    func()
+    start = perf_counter()
+    for _ in range(rounds):
+        func()
+    return (perf_counter() - start) / rounds * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--rounds", type=int, default=200, help="每项测试轮数")
+    parser.add_argument("--codecs", default=DEFAULT_CODECS, help="编码方式")
+    parser.add_argument("--save", type=Path, help="保存结果至 JSON 文件")
+    args = parser.parse_args()
+
+    record = asyncio.run(buildRecord())
+    legacy = dumpsLegacy(record)
+    report = {
+        "legacy": {
+            "size": len(legacy),
+            "encode": round(timeit(lambda: dumpsLegacy(record), args.rounds), 3),
+            "decode": round(timeit(lambda: Codec.decode(legacy), args.rounds), 3),
+        }
+    }
+    for spec in filter(None, args.codecs.split(",")):
+        codec = Codec.parse(spec)
+        if codec.missing():
+            print(f"skip {spec}: {', '.join(codec.missing())} not installed")
+            continue
+        raw = codec.encode(record)
+        assert Codec.decode(raw) == record, spec
+        report[codec.name] = {
+            "size": len(raw),
+            "encode": round(timeit(lambda: codec.encode(record), args.rounds), 3),
+            "decode": round(timeit(lambda: Codec.decode(raw), args.rounds), 3),
+        }
+
+    base = report["legacy"]["size"]
+    print(f"{'codec':<16}{'KB':>8}{'ratio':>8}{'encode(ms)':>12}{'decode(ms)':>12}")
+    for name, r in report.items():
+        print(
+            f"{name:<16}{r['size'] / 1024:>8.1f}{r['size'] / base:>8.2f}"
+            f"{r['encode']:>12.3f}{r['decode']:>12.3f}"
+        )
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+面板数据转换热路径基准测试，使用 ``fixtures`` 中录制（已匿名化）的 Enka.Network、提瓦特小助手返回数据离线回放
+
+    python benchmarks/bench_convert.py                      # 打印各函数吞吐量与内存分配
+    python benchmarks/bench_convert.py --save base.json     # 保存结果作为基线
+    python benchmarks/bench_convert.py --compare base.json  # 与基线对比，退化超出阈值时返回非零状态码
+"""
+
+import sys
+import json
+import asyncio
+import argparse
+import tracemalloc
+from shutil import copy
+from pathlib import Path
+from copy import deepcopy
+from tempfile import mkdtemp
+from time import perf_counter
+from typing import Any, Dict, Callable, Awaitable
+
+import nonebot
+
+ROOT = Path(__file__).parent.parent
+FIXTURES = Path(__file__).parent / "fixtures"
+
+# 离线模式：插件数据文件使用仓库内 data/gspanel 的版本，避免结果随 CDN 更新波动
+RES_DIR = Path(mkdtemp(prefix="gspanel-bench-"))
+(RES_DIR / "gspanel").mkdir()
+for f in (ROOT / "data" / "gspanel").glob("*.json"):
+    copy(f, RES_DIR / "gspanel" / f.name)
+nonebot.init(resources_dir=str(RES_DIR), gspanel_offline=True)
+sys.path.insert(0, str(ROOT))
+nonebot.load_plugin("nonebot_plugin_gspanel")
+
+from nonebot_plugin_gspanel.__utils__ import POS, PROP  # noqa: E402
+from nonebot_plugin_gspanel.data_convert import (  # noqa: E402
+    calcRelicMark,
+    transFromEnka,
+    transToTeyvat,
+    getRelicConfig,
+    simplDamageRes,
+    simplFightProp,
+    simplTeamDamageRes,
+)
+
+ENKA = json.loads((FIXTURES / "enka-100000001.json").read_text(encoding="utf-8"))
+TEYVAT_SINGLE = json.loads(
+    (FIXTURES / "teyvat-single.json").read_text(encoding="utf-8")
+)
+TEYVAT_TEAM = json.loads((FIXTURES / "teyvat-team.json").read_text(encoding="utf-8"))
+
+
+async def measure(func: Callable[[], Awaitable[Any]], rounds: int) -> Dict[str, float]:
+    """重复执行 ``func`` 并统计每秒调用次数、单次调用内存分配峰值（字节）"""
+    await func()  # 预热
+    start = perf_counter()
+    for _ in range(rounds):
+        await func()
+    elapsed = perf_counter() - start
+
+    # tracemalloc 开启后执行速度明显下降，内存分配单独统计
+    peaks = []
+    tracemalloc.start()
+    for _ in range(min(rounds, 50)):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        await func()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return {
+        "ops": round(rounds / elapsed, 1),
+        "alloc": round(sum(peaks) / len(peaks)),
+    }
+
+
+async def runBenchmarks(rounds: int) -> Dict[str, Dict[str, float]]:
+    uid, now = ENKA["uid"], 1672531200
+    avatarInfoList = ENKA["avatarInfoList"]
+    avatars = [await transFromEnka(a, now) for a in avatarInfoList]
+    rolesData = {a["name"]: a for a in avatars}
+
+    # 与 transFromEnka() 中传入 calcRelicMark() 的中间格式一致
+    relicCases = []
+    for avatarInfo, a in zip(avatarInfoList, avatars):
+        weights = await getRelicConfig(a["name"], a["baseProp"])
+        for equip in avatarInfo["equipList"]:
+            if equip["flat"]["itemType"] != "ITEM_RELIQUARY":
+                continue
+            mainProp = equip["flat"]["reliquaryMainstat"]
+            relicData = {
+                "pos": list(POS).index(equip["flat"]["equipType"]) + 1,
+                "level": equip["reliquary"]["level"] - 1,
+                "main": {
+                    "prop": PROP[mainProp["mainPropId"]],
+                    "value": mainProp["statValue"],
+                },
+                "sub": [
+                    {"prop": PROP[s["appendPropId"]], "value": s["statValue"]}
+                    for s in equip["flat"].get("reliquarySubstats", [])
+                ],
+                "_appendPropIdList": equip["reliquary"].get("appendPropIdList", []),
+            }
+            relicCases.append((relicData, a["element"], *weights))
+
+    async def _transFromEnka():
+        for a in avatarInfoList:
+            await transFromEnka(a, now)
+
+    async def _calcRelicMark():
+        for case in relicCases:
+            await calcRelicMark(*case)
+
+    async def _simplFightProp():
+        for a in avatars:
+            await simplFightProp(
+                dict(a["fightProp"]), a["baseProp"], a["name"], a["element"]
+            )
+
+    async def _transToTeyvat():
+        await transToTeyvat(deepcopy(avatars), uid)
+
+    async def _simplDamageRes():
+        for dmg in TEYVAT_SINGLE["result"]:
+            await simplDamageRes(dmg)
+
+    async def _simplTeamDamageRes():
+        await simplTeamDamageRes(TEYVAT_TEAM["result"], rolesData)
+
+    cases = {
+        "transFromEnka": _transFromEnka,
+        "calcRelicMark": _calcRelicMark,
+        "simplFightProp": _simplFightProp,
+        "transToTeyvat": _transToTeyvat,
+        "simplDamageRes": _simplDamageRes,
+        "simplTeamDamageRes": _simplTeamDamageRes,
+    }
+    return {name: await measure(func, rounds) for name, func in cases.items()}
+
+
+def compare(
+    result: Dict[str, Dict[str, float]], base: Dict[str, Dict[str, float]], tol: float
+) -> bool:
+    """对比基线，吞吐量下降或内存分配上升超过 ``tol`` 比例时视为退化"""
+    passed = True
+    for name, now in result.items():
+        if name not in base:
+            continue
+        opsDelta = now["ops"] / base[name]["ops"] - 1
+        allocDelta = now["alloc"] / max(base[name]["alloc"], 1) - 1
+        regress = opsDelta < -tol or allocDelta > tol
+        passed = passed and not regress
+        print(
+            f"{'!!' if regress else 'ok'} {name:<20}"
+            f" ops {opsDelta:+.1%}  alloc {allocDelta:+.1%}"
+        )
+    return passed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--rounds", type=int, default=500, help="每项测试轮数")
+    parser.add_argument("--save", type=Path, help="保存结果至 JSON 文件")
+    parser.add_argument("--compare", type=Path, help="与指定 JSON 基线对比")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的退化比例")
+    args = parser.parse_args()
+
+    result = asyncio.run(runBenchmarks(args.rounds))
+    print(f"{'function':<20}{'ops/s':>12}{'alloc/op(B)':>14}")
+    for name, r in result.items():
+        print(f"{name:<20}{r['ops']:>12}{r['alloc']:>14}")
+    if args.save:
+        args.save.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    if args.compare:
+        base = json.loads(args.compare.read_text(encoding="utf-8"))
+        return 0 if compare(result, base, args.tolerance) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
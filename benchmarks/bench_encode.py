@@ -0,0 +1,112 @@
+"""
+渲染图片编码基准测试，对比各模板在不同图片格式、质量、大小预算下的图片大小与耗时
+
+    python benchmarks/bench_encode.py
+    python benchmarks/bench_encode.py --variants jpeg:100,jpeg:85,webp:80,webp:100@300
+
+渲染使用本地上游替身服务回放 ``fixtures`` 数据，需要已安装 Playwright 浏览器与 Pillow
+"""
+
+import sys
+import json
+import asyncio
+import argparse
+from pathlib import Path
+from shutil import copytree
+from tempfile import mkdtemp
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+import nonebot
+
+sys.path.insert(0, str(Path(__file__).parent))
+from fake_upstream import startServer  # noqa: E402
+
+ROOT = Path(__file__).parent.parent
+DEFAULT_VARIANTS = "jpeg:100,jpeg:90,jpeg:80,webp:90,webp:80,webp:100@300,png:0"
+
+
+def parseVariants(raw: str) -> List[Tuple[str, int, int]]:
+    """解析 ``格式:质量@预算KB`` 格式的编码方案，如 ``webp:100@300``"""
+    variants = []
+    for item in filter(None, raw.split(",")):
+        spec, _, budget = item.partition("@")
+        fmt, _, quality = spec.partition(":")
+        variants.append((fmt, int(quality or 100), int(budget or 0) * 1024))
+    return variants
+
+
+async def screenshots(rounds: int) -> Dict[str, Tuple[bytes, float]]:
+    """各模板渲染为无损 PNG 截图，返回截图与平均渲染耗时（秒）"""
+    from nonebot_plugin_gspanel.data_source import getTeam, getPanel, getAvatarData
+
+    uid = "100000001"
+    names = [a["name"] for a in (await getAvatarData(uid))["avatars"]]
+    jobs = {
+        "list": lambda: getPanel(uid),
+        "panel": lambda: getPanel(uid, names[0]),
+        "team": lambda: getTeam(uid, names[:4]),
+    }
+    result = {}
+    for mode, job in jobs.items():
+        img = await job()  # 预热常驻页面与素材
+        assert isinstance(img, bytes), img
+        start = perf_counter()
+        for _ in range(rounds):
+            img = await job()
+        result[mode] = (img, (perf_counter() - start) / rounds)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--rounds", type=int, default=5, help="每项测试轮数")
+    parser.add_argument("--variants", default=DEFAULT_VARIANTS, help="编码方案")
+    parser.add_argument("--save", type=Path, help="保存结果至 JSON 文件")
+    args = parser.parse_args()
+
+    server = startServer()
+    resDir = Path(mkdtemp(prefix="gspanel-encode-"))
+    copytree(ROOT / "data" / "gspanel", resDir / "gspanel")
+    # 截图保持无损 PNG 且不缓存渲染结果，编码单独在下方计时
+    nonebot.init(
+        resources_dir=str(resDir),
+        resources_mirror=f"{server.url}/ui/",
+        gspanel_offline=True,
+        gspanel_enka_mirrors=[f"{server.url}/enka"],
+        gspanel_teyvat_api=f"{server.url}/teyvat",
+        gspanel_image_format="png",
+        gspanel_render_cache=0,
+        gspanel_render_cache_disk=0,
+    )
+    sys.path.insert(0, str(ROOT))
+    nonebot.load_plugin("nonebot_plugin_gspanel")
+    from nonebot_plugin_gspanel.render_encode import encodeImage
+
+    shots = asyncio.run(screenshots(args.rounds))
+    server.shutdown()
+
+    report = {}
+    print(f"{'template':<8}{'variant':<16}{'KB':>8}{'encode(s)':>11}{'total(s)':>10}")
+    for mode, (raw, renderTime) in shots.items():
+        report[mode] = {"render": round(renderTime, 3), "variants": {}}
+        for fmt, quality, budget in parseVariants(args.variants):
+            start = perf_counter()
+            for _ in range(args.rounds):
+                img = encodeImage(raw, fmt, quality, budget)
+            encodeTime = (perf_counter() - start) / args.rounds
+            name = f"{fmt}:{quality}" + (f"@{budget // 1024}" if budget else "")
+            report[mode]["variants"][name] = {
+                "size": len(img),
+                "encode": round(encodeTime, 3),
+            }
+            print(
+                f"{mode:<8}{name:<16}{len(img) / 1024:>8.1f}"
+                f"{encodeTime:>11.3f}{renderTime + encodeTime:>10.3f}"
+            )
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+角色列表卡片绘制基准测试，对比浏览器渲染与 Pillow 绘制的耗时，并计算两者的像素差异
+
+    python benchmarks/bench_list.py
+    python benchmarks/bench_list.py -n 20 --max-diff 12 --save-images /tmp/list
+
+渲染使用本地上游替身服务回放 ``fixtures`` 数据，需要已安装 Playwright 浏览器与 Pillow
+像素差异超出 ``--max-diff``（平均每通道差异，默认为 ``MAX_DIFF``）时以非零状态退出，
+用于检查模板改动后 Pillow 绘制是否需要同步，``tests/test_render_list.py`` 以同样的方式检查
+"""
+
+import sys
+import json
+import asyncio
+import argparse
+from io import BytesIO
+from pathlib import Path
+from shutil import copytree
+from tempfile import mkdtemp
+from time import perf_counter
+from typing import Any, Dict, Tuple
+
+import nonebot
+from PIL import Image, ImageStat, ImageChops
+
+sys.path.insert(0, str(Path(__file__).parent))
+from fake_upstream import startServer  # noqa: E402
+
+ROOT = Path(__file__).parent.parent
+# Pillow 绘制与浏览器渲染允许的平均每通道像素差异
+MAX_DIFF = 12.0
+
+
+def setup() -> Tuple[Any, Path]:
+    """启动上游替身服务并以离线模式加载插件，返回替身服务与插件资源目录"""
+    server = startServer()
+    resDir = Path(mkdtemp(prefix="gspanel-list-"))
+    copytree(ROOT / "data" / "gspanel", resDir / "gspanel")
+    # 截图保持无损 PNG 且不缓存渲染结果
+    nonebot.init(
+        resources_dir=str(resDir),
+        resources_mirror=f"{server.url}/ui/",
+        gspanel_offline=True,
+        gspanel_enka_mirrors=[f"{server.url}/enka"],
+        gspanel_teyvat_api=f"{server.url}/teyvat",
+        gspanel_image_format="png",
+        gspanel_list_renderer="browser",
+        gspanel_render_cache=0,
+        gspanel_render_cache_disk=0,
+    )
+    sys.path.insert(0, str(ROOT))
+    nonebot.load_plugin("nonebot_plugin_gspanel")
+    return server, resDir
+
+
+async def render(resDir: Path, rounds: int) -> Tuple[Dict, Image.Image, Image.Image]:
+    """分别以浏览器与 Pillow 绘制角色列表，返回平均耗时（秒）与最后一次绘制结果"""
+    from nonebot_plugin_gspanel.render_list import drawList
+    from nonebot_plugin_gspanel.__utils__ import SCALE_FACTOR
+    from nonebot_plugin_gspanel.data_source import getPanel, getAvatarData
+
+    uid = "100000001"
+    # 预热常驻页面与素材，之后处于刷新冷却中，两种方式的刷新提示一致
+    assert isinstance(await getPanel(uid), bytes)
+    data = await getAvatarData(uid, "全部", summary=True)
+    root, scale = resDir / "gspanel", SCALE_FACTOR
+
+    start = perf_counter()
+    for _ in range(rounds):
+        raw = await getPanel(uid)
+    browserTime = (perf_counter() - start) / rounds
+    assert isinstance(raw, bytes), raw
+
+    drawList(root, scale, uid, data)  # 预热字体与图标
+    start = perf_counter()
+    for _ in range(rounds):
+        img = drawList(root, scale, uid, data)
+    pillowTime = (perf_counter() - start) / rounds
+
+    times = {"browser": round(browserTime, 4), "pillow": round(pillowTime, 4)}
+    return times, Image.open(BytesIO(raw)).convert("RGB"), img.convert("RGB")
+
+
+def pixelDiff(a: Image.Image, b: Image.Image) -> Dict:
+    """比较两张图片的公共区域，返回平均每通道差异、明显差异（>32）像素占比与高度差"""
+    w, h = min(a.width, b.width), min(a.height, b.height)
+    diff = ImageChops.difference(a.crop((0, 0, w, h)), b.crop((0, 0, w, h)))
+    mean = sum(ImageStat.Stat(diff).mean) / 3
+    mask = diff.convert("L").point(lambda v: 255 if v > 32 else 0)
+    changed = ImageStat.Stat(mask).mean[0] / 255 * 100
+    return {
+        "mean": round(mean, 2),
+        "changed": round(changed, 2),
+        "height": b.height - a.height,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--rounds", type=int, default=10, help="每项测试轮数")
+    parser.add_argument("--max-diff", type=float, default=MAX_DIFF, help="允许的平均每通道像素差异")
+    parser.add_argument("--save", type=Path, help="保存结果至 JSON 文件")
+    parser.add_argument("--save-images", type=Path, help="保存两种方式的绘制结果至目录")
+    args = parser.parse_args()
+
+    server, resDir = setup()
+    times, browser, pillow = asyncio.run(render(resDir, args.rounds))
+    server.shutdown()
+
+    diff = pixelDiff(browser, pillow)
+    print(f"{'renderer':<10}{'time(s)':>10}{'cards/s':>10}")
+    for name, t in times.items():
+        print(f"{name:<10}{t:>10.4f}{1 / t:>10.1f}")
+    print(
+        f"pixel diff: mean {diff['mean']}, changed {diff['changed']}%, "
+        f"height {diff['height']:+d}px"
+    )
+    if args.save_images:
+        args.save_images.mkdir(parents=True, exist_ok=True)
+        browser.save(args.save_images / "list-browser.png")
+        pillow.save(args.save_images / "list-pillow.png")
+    if args.save:
+        report = {"time": times, "diff": diff}
+        args.save.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if diff["mean"] > args.max_diff:
+        print(f"pixel diff {diff['mean']} exceeds {args.max_diff}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+面板缓存存储后端一致性检查，对各存储后端进行相同的读写、绑定与租约操作，结果不一致时以非零状态退出
+
+    python benchmarks/check_store.py
+    python benchmarks/check_store.py --redis redis://127.0.0.1:6379/15
+
+未指定 ``--redis`` 时 Redis 存储使用 fakeredis 提供的本地替身，两者均不可用时跳过。
+指定的 Redis 服务中 ``gspanel:`` 开头的键会被清除，请使用单独的数据库
+"""
+
+import sys
+import asyncio
+import argparse
+from shutil import copy
+from pathlib import Path
+from tempfile import mkdtemp
+from typing import Any, List, Callable, Awaitable
+
+import nonebot
+
+ROOT = Path(__file__).parent.parent
+
+# 离线模式：插件数据文件使用仓库内 data/gspanel 的版本
+RES_DIR = Path(mkdtemp(prefix="gspanel-store-"))
+(RES_DIR / "gspanel").mkdir()
+for f in (ROOT / "data" / "gspanel").glob("*.json"):
+    copy(f, RES_DIR / "gspanel" / f.name)
+nonebot.init(resources_dir=str(RES_DIR), gspanel_offline=True)
+sys.path.insert(0, str(ROOT))
+nonebot.load_plugin("nonebot_plugin_gspanel")
+
+from nonebot_plugin_gspanel.data_codec import Codec  # noqa: E402
+from nonebot_plugin_gspanel.data_io import writeBuffer  # noqa: E402
+from nonebot_plugin_gspanel.data_store import (  # noqa: E402
+    Lease,
+    Store,
+    FileStore,
+    RedisStore,
+    SqliteStore,
+)
+
+
+async def checkKv(a: Store, b: Store) -> None:
+    await a.put("panel", "100000001", b"panel")
+    await a.put("list", "100000001", b"list")
+    assert await b.get("panel", "100000001") == b"panel"
+    assert await b.get("list", "100000001") == b"list"
+    assert await b.get("panel", "100000002") is None
+    assert await b.keys("panel") == ["100000001"]
+    assert await b.exists("panel", "100000001")
+    await b.delete("panel", "100000001")
+    assert not await a.exists("panel", "100000001")
+    assert await a.keys("list") == ["100000001"]
+    await a.delete("list", "100000001")
+
+
+async def checkCodec(a: Store, b: Store) -> None:
+    data = {"next": 1, "avatars": [{"id": 10000002, "name": "神里绫华"}]}
+    await a.save("panel", "100000003", data, Codec().encode)
+    await writeBuffer.wait(("panel", "100000003"))
+    assert await b.load("panel", "100000003") == data
+    await a.delete("panel", "100000003")
+
+
+async def checkBinding(a: Store, b: Store) -> None:
+    await a.setBinding("10001", "100000001")
+    await b.setBinding("10002", "100000002")
+    assert await a.getBinding("10002") == "100000002"
+    assert await b.getBinding("10001") == "100000001"
+    assert await a.getBinding("10003") == ""
+
+
+async def checkLease(a: Store, b: Store) -> None:
+    la, lb = Lease(a, "check", 1), Lease(b, "check", 1)
+    assert await la.acquire(wait=False)
+    assert not await lb.acquire(wait=False)
+    # 未持有租约时释放不影响持有者
+    await lb.release()
+    assert not await lb.acquire(wait=False)
+    await la.release()
+    assert await lb.acquire(wait=False)
+    await lb.release()
+
+
+async def checkRenew(a: Store, b: Store) -> None:
+    la, lb = Lease(a, "check", 1), Lease(b, "check", 1)
+    assert await la.acquire(wait=False)
+    # 持有者续期后原到期时间不再生效
+    await asyncio.sleep(0.6)
+    assert await la.acquire(wait=False)
+    await asyncio.sleep(0.6)
+    assert not await lb.acquire(wait=False)
+    # 租约到期后其他实例可获取，原持有者不能再续期
+    await asyncio.sleep(0.6)
+    assert await lb.acquire(wait=False)
+    assert not await la.acquire(wait=False)
+    await lb.release()
+
+
+async def checkWait(a: Store, b: Store) -> None:
+    la, lb = Lease(a, "check", 1), Lease(b, "check", 1)
+    assert await la.acquire(wait=False)
+
+    async def releaseLater() -> None:
+        await asyncio.sleep(0.3)
+        await la.release()
+
+    # 等待至持有者释放
+    task = asyncio.create_task(releaseLater())
+    assert await lb.acquire()
+    await task
+    await lb.release()
+
+
+CHECKS: List[Callable[[Store, Store], Awaitable[None]]] = [
+    checkKv,
+    checkCodec,
+    checkBinding,
+    checkLease,
+    checkRenew,
+    checkWait,
+]
+
+
+def openRedis(url: str) -> Any:
+    if url:
+        return RedisStore(url), RedisStore(url)
+    try:
+        from fakeredis import FakeServer
+        from fakeredis.aioredis import FakeRedis
+    except ImportError:
+        return None
+    server = FakeServer()
+    return (
+        RedisStore("", FakeRedis(server=server)),
+        RedisStore("", FakeRedis(server=server)),
+    )
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="面板缓存存储后端一致性检查")
+    parser.add_argument("--redis", default="", help="Redis 服务地址，默认使用 fakeredis")
+    args = parser.parse_args()
+
+    # 每个后端打开两次，模拟两个实例；本地文件的租约仅在本进程内有效，两个实例共用同一存储
+    tmp = Path(mkdtemp(prefix="gspanel-store-data-"))
+    fileStore = FileStore(tmp / "file")
+    backends = {
+        "file": (fileStore, fileStore),
+        "sqlite": (SqliteStore(tmp / "gspanel.db"), SqliteStore(tmp / "gspanel.db")),
+        "redis": openRedis(args.redis),
+    }
+    failed = 0
+    for name, pair in backends.items():
+        if pair is None:
+            print(f"{name:<8} 跳过：未安装 redis 或 fakeredis")
+            continue
+        a, b = pair
+        if name == "redis":
+            for ns in ["panel", "list", "bind", "lease"]:
+                for key in await a.keys(ns):
+                    await a.delete(ns, key)
+        for check in CHECKS:
+            try:
+                await check(a, b)
+            except Exception as e:
+                failed += 1
+                print(f"{name:<8} {check.__name__:<14} 失败：{e!r}")
+            else:
+                print(f"{name:<8} {check.__name__:<14} 通过")
+        await a.close()
+        if b is not a:
+            await b.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,217 @@
+"""
+Enka.Network / MicroGG / 提瓦特小助手 / 素材图片镜像的本地替身服务，回放 ``fixtures`` 中录制的数据
+
+    python benchmarks/fake_upstream.py --port 8765 --latency 0.2 \\
+        --errors 429:0.05,503:0.01 --rate 50
+
+插件配置指向替身服务即可离线压测完整指令流程：
+
+    GSPANEL_ENKA_MIRRORS=["http://127.0.0.1:8765/enka", "http://127.0.0.1:8765/microgg"]
+    GSPANEL_TEYVAT_API=http://127.0.0.1:8765/teyvat
+    RESOURCES_MIRROR=http://127.0.0.1:8765/ui/
+
+访问 ``/_stats`` 获取各上游的调用次数，``/_reset`` 清空计数
+"""
+
+import json
+import base64
+import random
+import argparse
+import threading
+from pathlib import Path
+from copy import deepcopy
+from time import sleep, monotonic
+from urllib.parse import urlparse
+from typing import Dict, List, Tuple, Optional
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+FIXTURES = Path(__file__).parent / "fixtures"
+ERROR_CODES = [400, 404, 424, 429, 500, 503]
+# 1x1 透明 PNG，用于素材图片下载
+BLANK_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR4"
+    "2mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+)
+
+
+class TokenBucket:
+    """简单令牌桶，``rate`` 为每秒请求数上限，为 0 时不限流"""
+
+    def __init__(self, rate: float) -> None:
+        self.rate, self.tokens, self.last = rate, rate, monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        if not self.rate:
+            return True
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class FakeUpstream(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        addr: Tuple[str, int],
+        latency: float = 0.0,
+        errors: Optional[Dict[int, float]] = None,
+        rate: float = 0.0,
+    ) -> None:
+        super().__init__(addr, FakeHandler)
+        self.latency = latency
+        self.errors = errors or {}
+        self.buckets: Dict[str, TokenBucket] = {
+            u: TokenBucket(rate) for u in ["enka", "microgg", "teyvat"]
+        }
+        self.stats: Dict[str, int] = {}
+        self.statsLock = threading.Lock()
+        self.enka = json.loads(
+            (FIXTURES / "enka-100000001.json").read_text(encoding="utf-8")
+        )
+        self.single = json.loads(
+            (FIXTURES / "teyvat-single.json").read_text(encoding="utf-8")
+        )
+        self.team = json.loads(
+            (FIXTURES / "teyvat-team.json").read_text(encoding="utf-8")
+        )
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def count(self, key: str) -> None:
+        with self.statsLock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def pickError(self) -> int:
+        roll = random.random()
+        for code, prob in self.errors.items():
+            if roll < prob:
+                return code
+            roll -= prob
+        return 0
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    server: FakeUpstream
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def reply(self, status: int, body: bytes, ctype: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def replyJson(self, data, status: int = 200) -> None:
+        self.reply(status, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    def upstream(self) -> Tuple[str, List[str]]:
+        parts = urlparse(self.path).path.strip("/").split("/")
+        return parts[0], parts[1:]
+
+    def guard(self, name: str) -> bool:
+        """模拟延迟、随机错误与限流，返回 ``False`` 时已响应错误"""
+        self.server.count(name)
+        if self.server.latency:
+            sleep(self.server.latency * random.uniform(0.5, 1.5))
+        if not self.server.buckets[name].acquire():
+            self.server.count(f"{name}:429")
+            self.replyJson({"error": "rate limited"}, 429)
+            return False
+        code = self.server.pickError()
+        if code:
+            self.server.count(f"{name}:{code}")
+            self.replyJson({"error": f"fake {code}"}, code)
+            return False
+        return True
+
+    def do_GET(self) -> None:
+        name, rest = self.upstream()
+        if name == "_stats":
+            return self.replyJson(self.server.stats)
+        if name == "_reset":
+            with self.server.statsLock:
+                self.server.stats.clear()
+            return self.replyJson({})
+        if name == "ui":
+            self.server.count("ui")
+            return self.reply(200, BLANK_PNG, "image/png")
+        if name in ["enka", "microgg"] and rest[:2] == ["api", "uid"]:
+            if not self.guard(name):
+                return
+            data = deepcopy(self.server.enka)
+            data["uid"] = rest[2]
+            return self.replyJson(data)
+        self.replyJson({"error": "not found"}, 404)
+
+    def do_POST(self) -> None:
+        name, rest = self.upstream()
+        if name != "teyvat" or not rest:
+            return self.replyJson({"error": "not found"}, 404)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if not self.guard("teyvat"):
+            return
+        if rest[0] == "getTeamResult.php":
+            data = deepcopy(self.server.team)
+            data["result"]["uid"] = body.get("uid", "")
+            return self.replyJson(data)
+        # 单角色伤害按请求角色数量循环返回录制结果
+        results = self.server.single["result"]
+        self.replyJson(
+            {
+                "code": 200,
+                "result": [
+                    results[i % len(results)]
+                    for i in range(len(body.get("role_data", [])))
+                ],
+            }
+        )
+
+
+def parseErrors(raw: str) -> Dict[int, float]:
+    """解析 ``429:0.05,503:0.01`` 格式的错误概率配置"""
+    errors = {}
+    for item in filter(None, raw.split(",")):
+        code, prob = item.split(":")
+        if int(code) not in ERROR_CODES:
+            raise ValueError(f"不支持模拟的错误码 {code}，可选 {ERROR_CODES}")
+        errors[int(code)] = float(prob)
+    return errors
+
+
+def startServer(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency: float = 0.0,
+    errors: Optional[Dict[int, float]] = None,
+    rate: float = 0.0,
+) -> FakeUpstream:
+    """在后台线程中启动替身服务，``port`` 为 0 时自动分配端口"""
+    server = FakeUpstream((host, port), latency, errors, rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="平均响应延迟（秒）")
+    parser.add_argument("--errors", default="", help="错误码概率，如 429:0.05,500:0.01")
+    parser.add_argument("--rate", type=float, default=0.0, help="各上游每秒请求上限")
+    args = parser.parse_args()
+    server = FakeUpstream(
+        (args.host, args.port), args.latency, parseErrors(args.errors), args.rate
+    )
+    print(f"Fake upstream listening on {server.url}")
+    server.serve_forever()
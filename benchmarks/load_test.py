@@ -0,0 +1,109 @@
+"""
+指令流程压测，启动本地上游替身服务后以 N 个 UID 并发驱动 ``getPanel`` / ``getTeam``
+
+    python benchmarks/load_test.py --uids 50 --concurrency 10 --target panel
+    python benchmarks/load_test.py --uids 200 --target data --latency 0.3 \\
+        --errors 429:0.05
+
+``--target`` 可选 ``data``（仅 ``getAvatarData``，不启动浏览器）、``list``、``panel``、``team``
+"""
+
+import sys
+import json
+import asyncio
+import argparse
+from pathlib import Path
+from shutil import copytree
+from tempfile import mkdtemp
+from time import perf_counter
+from typing import Dict, List
+from urllib.request import urlopen
+
+import nonebot
+
+sys.path.insert(0, str(Path(__file__).parent))
+from fake_upstream import FakeUpstream, parseErrors, startServer  # noqa: E402
+
+ROOT = Path(__file__).parent.parent
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def drive(args: argparse.Namespace, server: FakeUpstream) -> Dict:
+    from nonebot_plugin_gspanel.data_source import getTeam, getPanel, getAvatarData
+
+    uids = [str(100000001 + i) for i in range(args.uids)]
+    # 预热数据与素材下载
+    names = [a["name"] for a in (await getAvatarData(uids[0]))["avatars"]]
+    urlopen(f"{server.url}/_reset").read()
+
+    async def one(uid: str) -> float:
+        start = perf_counter()
+        if args.target == "data":
+            await getAvatarData(uid)
+        elif args.target == "list":
+            await getPanel(uid)
+        elif args.target == "panel":
+            await getPanel(uid, names[0])
+        else:
+            await getTeam(uid, names[:4])
+        return perf_counter() - start
+
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def limited(uid: str) -> float:
+        async with sem:
+            return await one(uid)
+
+    start = perf_counter()
+    latencies = await asyncio.gather(*[limited(uid) for uid in uids])
+    total = perf_counter() - start
+    stats = json.loads(urlopen(f"{server.url}/_stats").read())
+    return {
+        "requests": len(latencies),
+        "elapsed": round(total, 3),
+        "throughput": round(len(latencies) / total, 2),
+        "p50": round(percentile(latencies, 50), 3),
+        "p90": round(percentile(latencies, 90), 3),
+        "p99": round(percentile(latencies, 99), 3),
+        "max": round(max(latencies), 3),
+        "upstream": stats,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--uids", type=int, default=20, help="参与压测的 UID 数量")
+    parser.add_argument("--concurrency", type=int, default=10, help="最大并发指令数")
+    parser.add_argument(
+        "--target", choices=["data", "list", "panel", "team"], default="data"
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="上游平均响应延迟（秒）")
+    parser.add_argument("--errors", default="", help="上游错误码概率，如 429:0.05,500:0.01")
+    parser.add_argument("--rate", type=float, default=0.0, help="各上游每秒请求上限")
+    args = parser.parse_args()
+
+    server = startServer(
+        latency=args.latency, errors=parseErrors(args.errors), rate=args.rate
+    )
+    resDir = Path(mkdtemp(prefix="gspanel-load-"))
+    copytree(ROOT / "data" / "gspanel", resDir / "gspanel")
+    nonebot.init(
+        resources_dir=str(resDir),
+        resources_mirror=f"{server.url}/ui/",
+        gspanel_offline=True,
+        gspanel_enka_mirrors=[f"{server.url}/enka", f"{server.url}/microgg"],
+        gspanel_teyvat_api=f"{server.url}/teyvat",
+    )
+    sys.path.insert(0, str(ROOT))
+    nonebot.load_plugin("nonebot_plugin_gspanel")
+
+    print(json.dumps(asyncio.run(drive(args, server)), ensure_ascii=False, indent=2))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
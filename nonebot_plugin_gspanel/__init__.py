@@ -3,20 +3,49 @@ from nonebot.log import logger
 from nonebot.adapters import Message
 from nonebot.params import CommandArg
 from nonebot.plugin import on_command
+from nonebot.permission import SUPERUSER
 from nonebot.adapters.onebot.v11 import Bot
 from nonebot.adapters.onebot.v11.event import MessageEvent
 from nonebot.adapters.onebot.v11.message import MessageSegment
 
+from .data_send import sendImage
+from .data_warm import startWarm
+from .data_deadline import deadline
+from .data_trace import span, trace
 from .data_updater import updateCache
 from .data_source import getTeam, getPanel
-from .__utils__ import GSPANEL_ALIAS, uidHelper, formatTeam, formatInput, fetchInitRes
+from .data_render import stopRenderProcesses
+from .data_metrics import REQUEST_SECONDS, mountMetrics, metricsReport
+from .data_cache import flushCache, cacheReport, runMaintenance, startMaintenance
+from .__utils__ import (
+    SLOW_COMMAND,
+    GSPANEL_ALIAS,
+    GSPANEL_METRICS,
+    COMMAND_DEADLINE,
+    uidHelper,
+    formatTeam,
+    formatInput,
+    fetchInitRes,
+)
 
 driver = get_driver()
 driver.on_startup(fetchInitRes)
-driver.on_bot_connect(updateCache)
+driver.on_startup(updateCache)
+driver.on_startup(startMaintenance)
+driver.on_startup(startWarm)
+driver.on_shutdown(flushCache)
+driver.on_shutdown(stopRenderProcesses)
+if GSPANEL_METRICS and not mountMetrics(driver):
+    logger.warning(f"当前驱动器 {driver.type} 不支持 HTTP 服务，面板统计接口未启用")
 
 showPanel = on_command("panel", aliases=GSPANEL_ALIAS, priority=13, block=True)
 showTeam = on_command("teamdmg", aliases={"队伍伤害"}, priority=13, block=True)
+showCache = on_command(
+    "gspanel_cache", aliases={"面板缓存"}, permission=SUPERUSER, priority=12, block=True
+)
+showMetrics = on_command(
+    "gspanel_metrics", aliases={"面板统计"}, permission=SUPERUSER, priority=12, block=True
+)
 
 uidStart = ["1", "2", "5", "6", "7", "8", "9"]
 
@@ -41,18 +70,24 @@ async def panel_handle(bot: Bot, event: MessageEvent, arg: Message = CommandArg(
         elif uid[0] not in uidStart or len(uid) != 9:
             await showPanel.finish(f"UID 是「{uid}」吗？好像不对劲呢..", at_sender=True)
         await showPanel.finish(await uidHelper(opqq, uid))
-    # 尝试从输入中理解 UID、角色名
-    uid, char = await formatInput(argsMsg, qq, opqq)
-    if not uid:
-        await showPanel.finish("要查询角色面板的 UID 捏？", at_sender=True)
-    elif not uid.isdigit() or uid[0] not in uidStart or len(uid) != 9:
-        await showPanel.finish(f"UID 是「{uid}」吗？好像不对劲呢..", at_sender=True)
-    logger.info(f"正在查找 UID{uid} 的「{char}」角色面板..")
-    rt = await getPanel(uid, char)
+    with trace("panel", SLOW_COMMAND, qq=qq) as tr:
+        # 尝试从输入中理解 UID、角色名
+        with span("parse"):
+            uid, char = await formatInput(argsMsg, qq, opqq)
+        if not uid:
+            await showPanel.finish("要查询角色面板的 UID 捏？", at_sender=True)
+        elif not uid.isdigit() or uid[0] not in uidStart or len(uid) != 9:
+            await showPanel.finish(f"UID 是「{uid}」吗？好像不对劲呢..", at_sender=True)
+        tr.attrs.update(uid=uid, char=char)
+        logger.info(f"正在查找 UID{uid} 的「{char}」角色面板..")
+        mode = "list" if char == "全部" else "panel"
+        with deadline(COMMAND_DEADLINE), REQUEST_SECONDS.time(mode=mode):
+            rt = await getPanel(uid, char)
     if isinstance(rt, str):
         await showPanel.finish(MessageSegment.text(rt))
     elif isinstance(rt, bytes):
-        await showPanel.finish(MessageSegment.image(rt))
+        await sendImage(bot, event, rt)
+        await showPanel.finish()
 
 
 @showTeam.handle()
@@ -67,17 +102,39 @@ async def team_handle(bot: Bot, event: MessageEvent, arg: Message = CommandArg()
         showDetail = True
         for word in keywords:
             argsMsg = argsMsg.lstrip(word).strip()
-    # 尝试从输入中理解 UID、角色名
-    uid, chars = await formatTeam(argsMsg, qq, opqq)
-    if not uid:
-        await showTeam.finish("要查询队伍伤害的 UID 捏？", at_sender=True)
-    elif not uid.isdigit() or uid[0] not in uidStart or len(uid) != 9:
-        await showTeam.finish(f"UID 是「{uid}」吗？好像不对劲呢..", at_sender=True)
-    if not chars:
-        logger.info(f"QQ{qq} 的输入「{argsMsg}」似乎未指定队伍角色！")
-    logger.info(f"正在查找 UID{uid} 的「{'/'.join(chars) or '展柜前 4 角色'}」队伍伤害面板..")
-    rt = await getTeam(uid, chars, showDetail)
+    with trace("team", SLOW_COMMAND, qq=qq) as tr:
+        # 尝试从输入中理解 UID、角色名
+        with span("parse"):
+            uid, chars = await formatTeam(argsMsg, qq, opqq)
+        if not uid:
+            await showTeam.finish("要查询队伍伤害的 UID 捏？", at_sender=True)
+        elif not uid.isdigit() or uid[0] not in uidStart or len(uid) != 9:
+            await showTeam.finish(f"UID 是「{uid}」吗？好像不对劲呢..", at_sender=True)
+        if not chars:
+            logger.info(f"QQ{qq} 的输入「{argsMsg}」似乎未指定队伍角色！")
+        tr.attrs.update(uid=uid, chars=chars)
+        logger.info(f"正在查找 UID{uid} 的「{'/'.join(chars) or '展柜前 4 角色'}」队伍伤害面板..")
+        with deadline(COMMAND_DEADLINE), REQUEST_SECONDS.time(mode="team"):
+            rt = await getTeam(uid, chars, showDetail)
     if isinstance(rt, str):
         await showTeam.finish(MessageSegment.text(rt))
     elif isinstance(rt, bytes):
-        await showTeam.finish(MessageSegment.image(rt))
+        await sendImage(bot, event, rt)
+        await showTeam.finish()
+
+
+@showCache.handle()
+async def cache_handle(arg: Message = CommandArg()):
+    if arg.extract_plain_text().strip().startswith("清理"):
+        result = await runMaintenance()
+        await showCache.send(
+            "缓存维护完成：清除 {} 个 UID，移除 {} 位角色，整理 {} 个文件".format(
+                result["evicted"], result["trimmed"], result["compacted"]
+            )
+        )
+    await showCache.finish(await cacheReport())
+
+
+@showMetrics.handle()
+async def metrics_handle():
+    await showMetrics.finish(metricsReport())
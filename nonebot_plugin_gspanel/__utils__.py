@@ -2,13 +2,18 @@ import json
 import asyncio
 from pathlib import Path
 from re import IGNORECASE, sub, findall
-from typing import Set, List, Tuple, Union
+from typing import Set, Dict, List, Tuple, Union
 
 from nonebot import get_driver
 from nonebot.log import logger
 from nonebot.drivers import Driver
 from httpx import Client, AsyncClient
 
+from .data_trace import span
+from .data_store import openStore
+from .data_metrics import ASSET_TOTAL
+from .render_encode import hasPillow, resizeImage
+from .data_deadline import RENDER_RESERVE, expired, remaining
 from .__version__ import CHAR_TPL_VER, LIST_TPL_VER, TEAM_TPL_VER
 
 GROW_VALUE = {  # 理论最高档（4档）词条成长值
@@ -120,39 +125,214 @@ DOWNLOAD_MIRROR = (
     if hasattr(driver.config, "resources_mirror")
     else "https://enka.network/ui/"
 )
+RENDER_TIMEOUT = (
+    float(driver.config.gspanel_render_timeout)
+    if hasattr(driver.config, "gspanel_render_timeout")
+    else 10.0
+)
+# 至少保留一个渲染任务，否则排队的任务永远不会执行
+RENDER_WORKERS = (
+    max(int(driver.config.gspanel_render_workers), 1)
+    if hasattr(driver.config, "gspanel_render_workers")
+    else 2
+)
+RENDER_QUEUE = (
+    int(driver.config.gspanel_render_queue)
+    if hasattr(driver.config, "gspanel_render_queue")
+    else 20
+)
+RENDER_PROCESSES = (
+    int(driver.config.gspanel_render_processes)
+    if hasattr(driver.config, "gspanel_render_processes")
+    else 0
+)
+PAGE_POOL_SIZE = (
+    int(driver.config.gspanel_page_pool)
+    if hasattr(driver.config, "gspanel_page_pool")
+    else 2
+)
+PAGE_POOL_RECYCLE = (
+    int(driver.config.gspanel_page_recycle)
+    if hasattr(driver.config, "gspanel_page_recycle")
+    else 50
+)
+ASSET_CACHE_SIZE = (
+    int(float(driver.config.gspanel_asset_cache) * 1024 * 1024)
+    if hasattr(driver.config, "gspanel_asset_cache")
+    else 64 * 1024 * 1024
+)
+IMAGE_FORMAT = (
+    str(driver.config.gspanel_image_format).lower().replace("jpg", "jpeg")
+    if hasattr(driver.config, "gspanel_image_format")
+    else "jpeg"
+)
+IMAGE_QUALITY = (
+    int(driver.config.gspanel_image_quality)
+    if hasattr(driver.config, "gspanel_image_quality")
+    else 100
+)
+IMAGE_BUDGET = (
+    int(float(driver.config.gspanel_image_budget) * 1024)
+    if hasattr(driver.config, "gspanel_image_budget")
+    else 0
+)
+SEND_MODE = (
+    str(driver.config.gspanel_send_mode).lower()
+    if hasattr(driver.config, "gspanel_send_mode")
+    else "bytes"
+)
+SEND_URL = (
+    str(driver.config.gspanel_send_url).rstrip("/")
+    if hasattr(driver.config, "gspanel_send_url")
+    else ""
+)
+SEND_TTL = (
+    int(driver.config.gspanel_send_ttl)
+    if hasattr(driver.config, "gspanel_send_ttl")
+    else 600
+)
+RENDER_CACHE_SIZE = (
+    int(driver.config.gspanel_render_cache)
+    if hasattr(driver.config, "gspanel_render_cache")
+    else 32
+)
+RENDER_CACHE_DISK = (
+    int(driver.config.gspanel_render_cache_disk)
+    if hasattr(driver.config, "gspanel_render_cache_disk")
+    else 256
+)
+LIST_RENDERER = (
+    str(driver.config.gspanel_list_renderer).lower()
+    if hasattr(driver.config, "gspanel_list_renderer")
+    else "browser"
+)
+PRERENDER = (
+    bool(driver.config.gspanel_prerender)
+    if hasattr(driver.config, "gspanel_prerender")
+    else False
+)
+THUMBNAIL = (
+    bool(driver.config.gspanel_thumbnail)
+    if hasattr(driver.config, "gspanel_thumbnail")
+    else True
+)
+ENKA_MIRRORS = (
+    [str(m).rstrip("/") for m in driver.config.gspanel_enka_mirrors]
+    if hasattr(driver.config, "gspanel_enka_mirrors")
+    else ["https://enka.network", "http://profile.microgg.cn"]
+)
+TEYVAT_API = (
+    str(driver.config.gspanel_teyvat_api).rstrip("/")
+    if hasattr(driver.config, "gspanel_teyvat_api")
+    else "https://api.lelaer.com/ys"
+)
+OFFLINE_MODE = (
+    bool(driver.config.gspanel_offline)
+    if hasattr(driver.config, "gspanel_offline")
+    else False
+)
+MIGRATE_WORKERS = (
+    int(driver.config.gspanel_migrate_workers)
+    if hasattr(driver.config, "gspanel_migrate_workers")
+    else 4
+)
+MIGRATE_INTERVAL = (
+    float(driver.config.gspanel_migrate_interval)
+    if hasattr(driver.config, "gspanel_migrate_interval")
+    else 1.0
+)
+CACHE_CODEC = (
+    str(driver.config.gspanel_cache_codec)
+    if hasattr(driver.config, "gspanel_cache_codec")
+    else "json"
+)
+CACHE_TTL = (
+    float(driver.config.gspanel_cache_ttl)
+    if hasattr(driver.config, "gspanel_cache_ttl")
+    else 90.0
+)
+AVATAR_TTL = (
+    float(driver.config.gspanel_avatar_ttl)
+    if hasattr(driver.config, "gspanel_avatar_ttl")
+    else 0.0
+)
+MAINTAIN_INTERVAL = (
+    float(driver.config.gspanel_maintain_interval)
+    if hasattr(driver.config, "gspanel_maintain_interval")
+    else 24.0
+)
+CACHE_STORE = (
+    str(driver.config.gspanel_cache_store)
+    if hasattr(driver.config, "gspanel_cache_store")
+    else ""
+)
+LEASE_TTL = (
+    float(driver.config.gspanel_lease_ttl)
+    if hasattr(driver.config, "gspanel_lease_ttl")
+    else 60.0
+)
+WARM_UIDS = (
+    int(driver.config.gspanel_warm_uids)
+    if hasattr(driver.config, "gspanel_warm_uids")
+    else 0
+)
+WARM_HOURS = (
+    str(driver.config.gspanel_warm_hours)
+    if hasattr(driver.config, "gspanel_warm_hours")
+    else "2-8"
+)
+WARM_BUDGET = (
+    int(driver.config.gspanel_warm_budget)
+    if hasattr(driver.config, "gspanel_warm_budget")
+    else 120
+)
+COMMAND_DEADLINE = (
+    float(driver.config.gspanel_deadline)
+    if hasattr(driver.config, "gspanel_deadline")
+    else 30.0
+)
+GSPANEL_METRICS = (
+    bool(driver.config.gspanel_metrics)
+    if hasattr(driver.config, "gspanel_metrics")
+    else False
+)
+SLOW_COMMAND = (
+    float(driver.config.gspanel_slow_command)
+    if hasattr(driver.config, "gspanel_slow_command")
+    else 10.0
+)
 if not LOCAL_DIR.exists():
     LOCAL_DIR.mkdir(parents=True, exist_ok=True)
 if not (LOCAL_DIR / "cache").exists():
     (LOCAL_DIR / "cache").mkdir(parents=True, exist_ok=True)
 if not (LOCAL_DIR / "qq-uid.json").exists():
     (LOCAL_DIR / "qq-uid.json").write_text("{}", encoding="UTF-8")
+# 面板缓存、UID 绑定与刷新冷却的存储后端，多个实例可共享
+STORE = openStore(CACHE_STORE, LOCAL_DIR)
 _client = Client(verify=False)
-CALC_RULES = _client.get("https://cdn.monsterx.cn/bot/gspanel/calc-rule.json").json()
-(LOCAL_DIR / "calc-rule.json").write_text(
-    json.dumps(CALC_RULES, ensure_ascii=False, indent=2), encoding="utf-8"
-)
-CHAR_DATA = _client.get("https://cdn.monsterx.cn/bot/gspanel/char-data.json").json()
-(LOCAL_DIR / "char-data.json").write_text(
-    json.dumps(CHAR_DATA, ensure_ascii=False, indent=2), encoding="utf-8"
-)
-CHAR_ALIAS = _client.get("https://cdn.monsterx.cn/bot/gspanel/char-alias.json").json()
-(LOCAL_DIR / "char-alias.json").write_text(
-    json.dumps(CHAR_ALIAS, ensure_ascii=False, indent=2), encoding="utf-8"
-)
-TEAM_ALIAS = _client.get("https://cdn.monsterx.cn/bot/gspanel/team-alias.json").json()
-(LOCAL_DIR / "team-alias.json").write_text(
-    json.dumps(TEAM_ALIAS, ensure_ascii=False, indent=2), encoding="utf-8"
-)
-HASH_TRANS = _client.get("https://cdn.monsterx.cn/bot/gspanel/hash-trans.json").json()
-(LOCAL_DIR / "hash-trans.json").write_text(
-    json.dumps(HASH_TRANS, ensure_ascii=False, indent=2), encoding="utf-8"
-)
-RELIC_APPEND = _client.get(
-    "https://cdn.monsterx.cn/bot/gspanel/relic-append.json"
-).json()
-(LOCAL_DIR / "relic-append.json").write_text(
-    json.dumps(RELIC_APPEND, ensure_ascii=False, indent=2), encoding="utf-8"
-)
+
+
+def loadResJson(name: str) -> Dict:
+    """
+    插件数据文件加载，默认从阿里云 CDN 获取最新版本并写入本地，离线模式下直接读取本地文件
+
+    * ``param name: str`` 数据文件名，如 ``char-data.json``
+    - ``return: Dict`` 数据文件内容
+    """
+    local = LOCAL_DIR / name
+    if OFFLINE_MODE and local.exists():
+        return json.loads(local.read_text(encoding="utf-8"))
+    res = _client.get(f"https://cdn.monsterx.cn/bot/gspanel/{name}").json()
+    local.write_text(json.dumps(res, ensure_ascii=False, indent=2), encoding="utf-8")
+    return res
+
+
+CALC_RULES = loadResJson("calc-rule.json")
+CHAR_DATA = loadResJson("char-data.json")
+CHAR_ALIAS = loadResJson("char-alias.json")
+TEAM_ALIAS = loadResJson("team-alias.json")
+HASH_TRANS = loadResJson("hash-trans.json")
+RELIC_APPEND = loadResJson("relic-append.json")
 
 
 def kStr(prop: str, reverse: bool = False) -> str:
@@ -218,7 +398,9 @@ async def formatInput(msg: str, qq: str, atqq: str = "") -> Tuple[str, str]:
             tmp = s.lower()
         elif not s.isdigit() and not char:
             char = tmp + s
-    uid = uid or await uidHelper(atqq or qq)
+    if not uid:
+        with span("binding"):
+            uid = await uidHelper(atqq or qq)
     char = await aliasWho(char or tmp or "全部")
     return uid, char
 
@@ -270,7 +452,6 @@ async def fetchInitRes() -> None:
         "https://cdn.monsterx.cn/bot/gspanel/imgs/talent-geo.png",
         "https://cdn.monsterx.cn/bot/gspanel/imgs/talent-hydro.png",
         "https://cdn.monsterx.cn/bot/gspanel/imgs/talent-pyro.png",
-        "https://cdn.monsterx.cn/bot/gspanel/g2plot.min.js",
         f"https://cdn.monsterx.cn/bot/gspanel/team-{TEAM_TPL_VER}.css",
         f"https://cdn.monsterx.cn/bot/gspanel/team-{TEAM_TPL_VER}.html",
         f"https://cdn.monsterx.cn/bot/gspanel/panel-{CHAR_TPL_VER}.css",
@@ -278,17 +459,58 @@ async def fetchInitRes() -> None:
         f"https://cdn.monsterx.cn/bot/gspanel/list-{LIST_TPL_VER}.css",
         f"https://cdn.monsterx.cn/bot/gspanel/list-{LIST_TPL_VER}.html",
     ]
+    # 随插件数据文件重新生成的文件，与插件数据文件一样每次启动时更新，离线模式下本地已有时不更新
+    updateRes = [
+        "https://cdn.monsterx.cn/bot/gspanel/font/HYWH-65W.woff2",
+    ]
     tasks = []
-    for r in initRes:
+    for r in [*initRes, *updateRes]:
         d = r.replace("https://cdn.monsterx.cn/bot/gspanel/", "").split("/")[0]
-        tasks.append(download(r, local=("" if "." in d else d)))
+        refresh = r in updateRes and not OFFLINE_MODE
+        tasks.append(download(r, local=("" if "." in d else d), refresh=refresh))
     await asyncio.gather(*tasks)
     tasks.clear()
     logger.info("面板插件所需资源检查完毕！")
 
 
+def thumbPath(f: Path, size: int) -> Path:
+    """素材图片缩略图路径，缩略图按缩放比例换算后的像素宽度区分，保存于原图所在文件夹的 thumb 子文件夹"""
+    return f.parent / "thumb" / f"{f.stem}-{round(size * SCALE_FACTOR)}.webp"
+
+
+def thumbUrl(path: str, size: int) -> str:
+    """
+    模板图片地址，已生成对应尺寸的缩略图时返回缩略图地址，否则返回原图地址
+
+    * ``param path: str`` 原图相对插件资源目录的路径，如 ``weapon/UI_EquipIcon_Sword_Blunt.png``
+    * ``param size: int`` 图片在模板中的显示宽度（CSS 像素）
+    - ``return: str`` 模板中使用的图片相对地址
+    """
+    thumb = thumbPath(LOCAL_DIR / path, size)
+    if THUMBNAIL and thumb.exists():
+        return f"./{thumb.relative_to(LOCAL_DIR).as_posix()}"
+    return f"./{path}"
+
+
+async def thumbnail(f: Path, size: int) -> None:
+    """素材图片缩略图生成，未安装 Pillow 或缩略图已存在时跳过"""
+    thumb = thumbPath(f, size)
+    if not THUMBNAIL or not hasPillow() or thumb.exists():
+        return
+    try:
+        await asyncio.get_running_loop().run_in_executor(
+            None, resizeImage, f, thumb, round(size * SCALE_FACTOR)
+        )
+    except Exception as e:
+        logger.warning(f"面板资源 {f.name} 缩略图生成出错 {type(e)}：{e}")
+
+
 async def download(
-    url: str, local: Union[Path, str] = "", retry: int = 3
+    url: str,
+    local: Union[Path, str] = "",
+    retry: int = 3,
+    thumb: int = 0,
+    refresh: bool = False,
 ) -> Union[Path, None]:
     """
     一般文件下载，通常是即用即下的角色命座图片、技能图片、抽卡大图、圣遗物图片等
@@ -296,6 +518,8 @@ async def download(
     * ``param url: str`` 下载链接
     * ``param local: Union[Path, str] = ""`` 下载路径，传入类型为 ``Path`` 时视为保存文件完整路径，传入类型为 ``str`` 时视为保存文件子文件夹名（默认下载至插件资源根目录）
     * ``param retry: int = 3`` 下载失败重试次数
+    * ``param thumb: int = 0`` 图片在模板中的显示宽度（CSS 像素），不为 0 时额外生成对应尺寸的缩略图
+    * ``param refresh: bool = False`` 本地文件存在时是否仍然下载更新，更新失败时保留旧文件
     - ``return: Union[Path, None]`` 本地文件路径，出错时返回空
     """  # noqa: E501
     if not url.startswith("http"):
@@ -309,25 +533,50 @@ async def download(
         if not local.parent.exists():
             local.parent.mkdir(parents=True, exist_ok=True)
         f = local
-    # 本地文件存在时便不再下载，JSON 文件除外
-    if f.exists() and ".json" not in f.name:
+    # 本地文件存在时便不再下载，JSON 文件与指定更新的文件除外
+    if f.exists() and ".json" not in f.name and not refresh:
+        ASSET_TOTAL.inc(result="hit")
+        if thumb:
+            await thumbnail(f, thumb)
         return f
-    client, retry = AsyncClient(), 3
-    while retry:
-        try:
-            async with client.stream(
-                "GET", url, headers={"user-agent": "NoneBot-GsPanel"}
-            ) as res:
-                with open(f, "wb") as fb:
-                    async for chunk in res.aiter_bytes():
-                        fb.write(chunk)
-            return f
-        except Exception as e:
-            retry -= 1
-            if retry:
-                await asyncio.sleep(2)
-            else:
-                logger.opt(exception=e).error(f"面板资源 {f.name} 下载出错")
+    # 下载耗时计入命令处理追踪，素材缓存命中时不记录
+    with span("download", file=f.name):
+        # 先下载至临时文件，完整下载后再替换，JSON 文件更新失败时不影响旧文件
+        client, retry, part = AsyncClient(), 3, f.with_name(f"{f.name}.part")
+        while retry:
+            # 命令处理期限已到时不再下载，模板中以透明占位图代替
+            if expired(RENDER_RESERVE):
+                logger.warning(f"面板资源 {f.name} 下载超出命令处理期限，已跳过")
+                ASSET_TOTAL.inc(result="skipped")
+                return None
+            try:
+                async with client.stream(
+                    "GET",
+                    url,
+                    headers={"user-agent": "NoneBot-GsPanel"},
+                    timeout=remaining(5.0, RENDER_RESERVE),
+                ) as res:
+                    # 错误页面（如 CDN 尚未同步新版模板时的 404）不能保存为素材
+                    res.raise_for_status()
+                    with open(part, "wb") as fb:
+                        async for chunk in res.aiter_bytes():
+                            fb.write(chunk)
+                part.replace(f)
+                ASSET_TOTAL.inc(result="miss")
+                if thumb:
+                    await thumbnail(f, thumb)
+                return f
+            except Exception as e:
+                # 下载中断时保留已有的旧文件
+                part.unlink(missing_ok=True)
+                retry -= 1
+                # 剩余时间不足以等待重试时直接放弃
+                if retry and remaining(2.0, RENDER_RESERVE) >= 2.0:
+                    await asyncio.sleep(2)
+                else:
+                    retry = 0
+                    ASSET_TOTAL.inc(result="error")
+                    logger.opt(exception=e).error(f"面板资源 {f.name} 下载出错")
     return None
 
 
@@ -340,15 +589,11 @@ async def uidHelper(qq: Union[str, int], uid: str = "") -> str:
     - ``return: str``指定 QQ 绑定的原神 UID，绑定/更新时返回操作结果
     """
     qq = str(qq)
-    cfgFile = LOCAL_DIR / "qq-uid.json"
-    uidCfg = json.loads(cfgFile.read_text(encoding="utf-8"))
+    bound = await STORE.getBinding(qq)
     if uid:
-        uidCfg[qq] = uid
-        cfgFile.write_text(
-            json.dumps(uidCfg, ensure_ascii=False, indent=2), encoding="utf-8"
-        )
-        return "已{} QQ{} 的 UID 为 {}".format("更新" if qq in uidCfg else "绑定", qq, uid)
-    return uidCfg.get(qq, "")
+        await STORE.setBinding(qq, uid)
+        return "已{} QQ{} 的 UID 为 {}".format("更新" if bound else "绑定", qq, uid)
+    return bound
 
 
 async def aliasWho(input: str) -> str:
@@ -1,4 +1,4 @@
 PLUGIN_VERSION = "0.2.20"
-LIST_TPL_VER = "0.2.7"
-CHAR_TPL_VER = "0.2.7"
-TEAM_TPL_VER = "0.2.20"
+LIST_TPL_VER = "0.2.26"
+CHAR_TPL_VER = "0.2.26"
+TEAM_TPL_VER = "0.2.26"
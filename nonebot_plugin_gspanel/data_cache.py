@@ -0,0 +1,395 @@
+"""
+角色面板数据缓存读写，每条缓存记录带有格式版本号，旧版本记录由 ``data_updater`` 迁移
+
+缓存记录保存在 ``gspanel_cache_store`` 配置的存储后端中，本地文件以外的存储可由多个实例共享
+"""
+
+import asyncio
+from pathlib import Path
+from time import time, monotonic
+from contextlib import asynccontextmanager
+from typing import Dict, List, Tuple, Optional, AsyncIterator
+
+from nonebot.log import logger
+
+from .data_codec import Codec
+from .data_store import Lease
+from .data_render import RENDER_DIR
+from .data_io import runIo, writeBuffer
+from .__utils__ import (
+    STORE,
+    CACHE_TTL,
+    LEASE_TTL,
+    LOCAL_DIR,
+    AVATAR_TTL,
+    CACHE_CODEC,
+    MAINTAIN_INTERVAL,
+)
+
+# 本地缓存文件夹，共享存储模式下仅用于迁移本地已有的缓存
+CACHE_DIR = LOCAL_DIR / "cache"
+# 角色列表只需要的角色概要，与完整缓存记录同时写入
+SUMMARY_KEYS = ["id", "name", "icon", "rarity", "element", "level", "cons", "relicCalc"]
+# 缓存格式版本：0 为旧版 Enka.Network 原始数据（``{uid}__data.json``），1 为未标记版本的插件内部格式，3 起带有角色概要
+CACHE_SCHEMA = 3
+# 全部本地缓存记录迁移至当前格式版本（共享存储模式下为导入共享存储）后写入的标记文件，存在时启动无需重新扫描缓存
+SCHEMA_MARK = CACHE_DIR / ".schema"
+# UID 最近查询时间，定期维护时合并写入
+_access: Dict[str, int] = {}
+# UID 查询热度，每次查询加 1 并按半衰期衰减，记录为（热度, 计算时间），保存时累加至已保存的热度
+HIT_HALFLIFE = 7 * 86400
+_hits: Dict[str, Tuple[float, float]] = {}
+try:
+    CODEC = Codec.parse(CACHE_CODEC)
+except ValueError as e:
+    logger.warning(f"{e}，已改为 json")
+    CODEC = Codec()
+if CODEC.missing():
+    logger.warning(f"缓存编码方式 {CODEC.name} 需要安装 {'、'.join(CODEC.missing())}，已改为 json")
+    CODEC = Codec()
+_maintainLock: Optional[asyncio.Lock] = None
+_maintainTask: Optional[asyncio.Task] = None
+
+
+def summarize(data: Dict) -> Dict:
+    """
+    角色列表所需的角色概要，包括刷新冷却时间与每个角色的名称、图标、稀有度、元素、等级、命座与圣遗物评分
+
+    * ``param data: Dict`` 缓存记录，也可以是角色概要
+    - ``return: Dict`` 角色概要
+    """
+    return {
+        "next": data.get("next", 0),
+        "avatars": [{k: a[k] for k in SUMMARY_KEYS} for a in data.get("avatars", [])],
+    }
+
+
+def schemaOf(data: Dict) -> int:
+    """缓存记录格式版本，未标记版本的记录视为版本 1"""
+    return int(data.get("schema", 1))
+
+
+async def readCache(uid: str, background: bool = False) -> Dict:
+    """
+    角色面板缓存读取，读取与解码不阻塞事件循环
+
+    * ``param uid: str`` 查询用户 UID
+    * ``param background: bool = False`` 是否为后台刷新读取，后台刷新不计入查询时间
+    - ``return: Dict`` 缓存记录，不存在时返回空
+    """
+    if not background:
+        _access[uid] = int(time())
+    return await STORE.load("panel", uid) or {}
+
+
+async def readSummary(uid: str, background: bool = False) -> Dict:
+    """
+    角色概要读取，角色列表在刷新冷却期间无需读取完整缓存记录
+
+    * ``param uid: str`` 查询用户 UID
+    * ``param background: bool = False`` 是否为后台刷新读取，后台刷新不计入查询时间
+    - ``return: Dict`` 角色概要，不存在时返回空
+    """
+    if not background:
+        _access[uid] = int(time())
+    return await STORE.load("list", uid) or {}
+
+
+async def writeCache(uid: str, data: Dict) -> None:
+    """
+    角色面板缓存写入，记录标记为当前格式版本。编码完成后即返回，同一 UID 的连续写入合并为最后一次
+
+    * ``param uid: str`` 查询用户 UID
+    * ``param data: Dict`` 缓存记录
+    """
+    await STORE.save("panel", uid, {**data, "schema": CACHE_SCHEMA}, CODEC.encode)
+    await STORE.save("list", uid, summarize(data), CODEC.encode)
+
+
+def pendingCache(uid: str) -> bool:
+    """该 UID 是否有尚未写入存储的缓存记录"""
+    return writeBuffer.get(("panel", uid)) is not None
+
+
+async def flushUid(uid: str) -> None:
+    """等待该 UID 的缓存记录与角色概要写入存储"""
+    await writeBuffer.wait(("panel", uid))
+    await writeBuffer.wait(("list", uid))
+
+
+@asynccontextmanager
+async def refreshLease(
+    uid: str, cacheData: Dict, background: bool = False
+) -> AsyncIterator[Dict]:
+    """
+    刷新冷却已结束时获取该 UID 的刷新租约，同一时间只有一个实例刷新同一 UID。获取租约后重新读取缓存记录，等待期间其他实例已完成刷新时即处于刷新冷却中
+
+    租约等待超时时不进行刷新：已有缓存时返回现有的缓存记录，刷新冷却时间推迟至租约到期后；没有缓存时返回错误信息
+
+    * ``param uid: str`` 查询用户 UID
+    * ``param cacheData: Dict`` 已读取的缓存记录
+    * ``param background: bool = False`` 是否为后台刷新，后台刷新不计入查询时间
+    - ``return: AsyncIterator[Dict]`` 最新的缓存记录，退出时等待缓存写入存储后再释放租约
+    """
+    if int(time()) <= cacheData.get("next", 0):
+        yield cacheData
+        return
+    lease = Lease(STORE, f"refresh:{uid}", LEASE_TTL)
+    if not await lease.acquire():
+        logger.warning(f"UID{uid} 的刷新租约等待超时，其他实例正在刷新，本次不再刷新")
+        latest = await readCache(uid, background)
+        if not latest:
+            yield {"error": f"UID{uid} 的角色展柜数据正在刷新，请稍后再试！"}
+            return
+        retry = int(time() + LEASE_TTL)
+        yield {**latest, "next": max(latest.get("next", 0), retry)}
+        return
+    try:
+        yield await readCache(uid, background)
+    finally:
+        await flushUid(uid)
+        await lease.release()
+
+
+def listCacheFiles() -> List[Path]:
+    """本地全部缓存文件，包括待迁移的旧版缓存"""
+    return sorted(CACHE_DIR.glob("*.json"))
+
+
+def schemaTag() -> str:
+    # 更换存储后端后需要重新导入本地缓存
+    return str(CACHE_SCHEMA) if not STORE.shared else f"{CACHE_SCHEMA} {STORE.name}"
+
+
+def schemaMarked() -> bool:
+    """全部本地缓存记录是否已迁移至当前格式版本"""
+    return SCHEMA_MARK.exists() and SCHEMA_MARK.read_text().strip() == schemaTag()
+
+
+def markSchema() -> None:
+    SCHEMA_MARK.write_text(schemaTag())
+
+
+async def loadAccess() -> Dict[str, int]:
+    """UID 最近查询时间，合并已保存的记录（包括其他实例保存的记录）与本次运行期间的查询"""
+    saved: Dict[str, int] = await STORE.load("meta", "access") or {}
+    return {**saved, **{u: max(t, saved.get(u, 0)) for u, t in _access.items()}}
+
+
+async def saveAccess(access: Dict[str, int]) -> None:
+    await STORE.put("meta", "access", Codec().encode(access))
+
+
+def decayHit(hit: Tuple[float, float], now: float) -> float:
+    """热度衰减至指定时间"""
+    score, at = hit
+    return score * 0.5 ** (max(now - at, 0) / HIT_HALFLIFE)
+
+
+def recordHit(uid: str) -> None:
+    """记录一次用户查询，后台刷新、预渲染不计入"""
+    now = time()
+    _hits[uid] = (decayHit(_hits.get(uid, (0.0, now)), now) + 1, now)
+
+
+async def saveHits() -> Dict[str, float]:
+    """
+    本次运行期间的查询热度累加至已保存的热度（包括其他实例保存的热度）并保存，热度过低的 UID 不再保存
+
+    - ``return: Dict[str, float]`` 累加后各 UID 当前的热度
+    """
+    lease = Lease(STORE, "hits", 10)
+    await lease.acquire()
+    try:
+        now = time()
+        saved: Dict = await STORE.load("meta", "hits") or {}
+        factor = 0.5 ** (max(now - saved.get("time", now), 0) / HIT_HALFLIFE)
+        merged = {u: s * factor for u, s in saved.get("hits", {}).items()}
+        for uid, hit in list(_hits.items()):
+            merged[uid] = merged.get(uid, 0.0) + decayHit(hit, now)
+            del _hits[uid]
+        merged = {u: round(s, 4) for u, s in merged.items() if s >= 0.01}
+        await STORE.put("meta", "hits", Codec().encode({"time": now, "hits": merged}))
+    finally:
+        await lease.release()
+    return merged
+
+
+async def compactEntry(uid: str, raw: bytes) -> Tuple[int, bool]:
+    """
+    单个缓存记录维护：移除该 UID 最近一次刷新前已超过 ``gspanel_avatar_ttl`` 天未出现在展柜中的角色，并将非当前编码方式的缓存重新编码
+
+    * ``param uid: str`` 查询用户 UID
+    * ``param raw: bytes`` 缓存记录原始内容
+    - ``return: Tuple[int, bool]`` 移除的角色数量、是否重写了缓存记录
+    """
+    recode = not CODEC.isCurrent(raw[:64])
+    if not AVATAR_TTL and not recode:
+        return 0, False
+    data = await runIo(Codec.decode, raw)
+    if schemaOf(data) < CACHE_SCHEMA:
+        # 等待迁移的记录不在此处重写，避免跳过迁移步骤
+        return 0, False
+    avatars = data.get("avatars", [])
+    keep = avatars
+    if AVATAR_TTL and avatars:
+        latest = max(a["time"] for a in avatars)
+        keep = [a for a in avatars if latest - a["time"] <= AVATAR_TTL * 86400]
+    if len(keep) == len(avatars) and not recode:
+        return 0, False
+    await writeCache(uid, {**data, "avatars": keep})
+    await flushUid(uid)
+    return len(avatars) - len(keep), True
+
+
+async def maintainEntry(
+    uid: str, access: Dict[str, int], result: Dict[str, int]
+) -> None:
+    """持有刷新租约时维护单个 UID 的缓存，正在刷新的 UID 下次维护再处理"""
+    lease = Lease(STORE, f"refresh:{uid}", LEASE_TTL)
+    if not await lease.acquire(wait=False):
+        return
+    try:
+        raw = await STORE.get("panel", uid)
+        if raw is None:
+            return
+        if uid not in access:
+            # 没有查询记录时以最近写入时间作为查询时间
+            access[uid] = int(await STORE.modified("panel", uid) or time())
+        if CACHE_TTL and time() - access[uid] > CACHE_TTL * 86400:
+            summary = await STORE.get("list", uid) or b""
+            await STORE.delete("panel", uid)
+            await STORE.delete("list", uid)
+            access.pop(uid)
+            result["evicted"] += 1
+            result["reclaimed"] += len(raw) + len(summary)
+            return
+        trimmed, rewritten = await compactEntry(uid, raw)
+        if rewritten:
+            result["trimmed"] += trimmed
+            result["compacted"] += 1
+            newRaw = await STORE.get("panel", uid) or b""
+            result["reclaimed"] += max(len(raw) - len(newRaw), 0)
+    finally:
+        await lease.release()
+
+
+async def maintainCache() -> Dict[str, int]:
+    """
+    面板缓存维护：清除长期未查询的 UID、移除长期未出现在展柜中的角色、重新编码缓存、整理存储空间
+
+    - ``return: Dict[str, int]`` 维护结果，包括清除的 UID 数量、移除的角色数量、整理的记录数量与释放的空间（字节）
+    """
+    access = await loadAccess()
+    result = {"evicted": 0, "trimmed": 0, "compacted": 0, "reclaimed": 0}
+    uids = await STORE.keys("panel")
+    for uid in uids:
+        await maintainEntry(uid, access, result)
+    result["reclaimed"] += await STORE.compact()
+    await saveAccess({uid: t for uid, t in access.items() if uid in uids})
+    await saveHits()
+    return result
+
+
+async def runMaintenance() -> Dict[str, int]:
+    """
+    面板缓存维护，同一时间只进行一次维护，共享存储模式下其他实例正在维护时跳过
+
+    - ``return: Dict[str, int]`` 维护结果
+    """
+    global _maintainLock
+    if _maintainLock is None:
+        _maintainLock = asyncio.Lock()
+    async with _maintainLock:
+        lease = Lease(STORE, "maintain", 3600)
+        if not await lease.acquire(wait=False):
+            logger.info("其他实例正在维护面板缓存，跳过本次维护")
+            return {"evicted": 0, "trimmed": 0, "compacted": 0, "reclaimed": 0}
+        try:
+            start = monotonic()
+            result = await maintainCache()
+        finally:
+            await lease.release()
+        logger.info(
+            "面板缓存维护完成，耗时 {:.1f} 秒：清除 {} 个 UID，移除 {} 位角色，整理 {} 条记录，释放 {}".format(
+                monotonic() - start,
+                result["evicted"],
+                result["trimmed"],
+                result["compacted"],
+                formatSize(result["reclaimed"]),
+            )
+        )
+        return result
+
+
+async def maintainLoop() -> None:
+    while True:
+        await asyncio.sleep(MAINTAIN_INTERVAL * 3600)
+        try:
+            await runMaintenance()
+        except Exception as e:
+            logger.opt(exception=e).error("面板缓存维护出错")
+
+
+async def startMaintenance() -> None:
+    """启动面板缓存定期维护后台任务"""
+    global _maintainTask
+    if MAINTAIN_INTERVAL > 0 and _maintainTask is None:
+        _maintainTask = asyncio.create_task(maintainLoop())
+
+
+async def flushCache() -> None:
+    """等待缓存写入完成并保存本次运行期间的 UID 查询时间，关闭插件前调用"""
+    await writeBuffer.drain()
+    if _access:
+        await saveAccess(await loadAccess())
+    if _hits:
+        await saveHits()
+    await STORE.close()
+
+
+def formatSize(size: float) -> str:
+    for unit in ["B", "KB", "MB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def dirStats(path: Path) -> Tuple[int, int]:
+    """文件夹中的文件数量与总大小（字节）"""
+    files = [f for f in path.iterdir() if f.is_file()] if path.exists() else []
+    return len(files), sum(f.stat().st_size for f in files)
+
+
+async def cacheStats() -> Dict[str, int]:
+    """面板缓存与渲染图片缓存统计，角色数量由角色概要统计"""
+    uids = await STORE.keys("panel")
+    avatars = 0
+    for uid in uids:
+        avatars += len((await STORE.load("list", uid) or {}).get("avatars", []))
+    legacy = await runIo(
+        lambda: len([f for f in listCacheFiles() if f.name.endswith("__data.json")])
+    )
+    renders, renderBytes = await runIo(dirStats, RENDER_DIR)
+    return {
+        "entries": len(uids),
+        "avatars": avatars,
+        "legacy": legacy,
+        "bytes": await STORE.size(),
+        "renders": renders,
+        "render_bytes": renderBytes,
+    }
+
+
+async def cacheReport() -> str:
+    """面板缓存统计信息，用于超级用户查看"""
+    stats = await cacheStats()
+    lines = [
+        f"面板缓存（{STORE.name}）：{stats['entries']} 个 UID，{stats['avatars']} 位角色，"
+        f"占用 {formatSize(stats['bytes'])}",
+        f"渲染缓存：{stats['renders']} 张图片，占用 {formatSize(stats['render_bytes'])}",
+    ]
+    if stats["legacy"]:
+        lines.insert(1, f"待迁移旧版缓存：{stats['legacy']} 个")
+    return "\n".join(lines)
@@ -0,0 +1,123 @@
+"""
+面板缓存编解码，默认使用紧凑 JSON，可选 orjson / msgpack 序列化与 gzip / zstd 压缩，
+orjson、msgpack、zstandard 为可选依赖
+
+非默认编码的缓存以 ``GSPC`` 文件头标记序列化与压缩方式，读取时根据文件头解码，没有文件头的视为 JSON（包括旧版缩进格式），更换编码方式后已有缓存仍可读取
+"""
+
+import gzip
+import json
+from typing import Any, List
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"GSPC"
+# 文件头中以序号标记，只能在末尾追加
+SERIALIZERS = ["json", "orjson", "msgpack"]
+COMPRESSIONS = ["none", "gzip", "zstd"]
+
+
+def _dumps(serializer: str, data: Any) -> bytes:
+    if serializer == "orjson":
+        return orjson.dumps(data)
+    if serializer == "msgpack":
+        return msgpack.packb(data, use_bin_type=True)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(serializer: str, raw: bytes) -> Any:
+    if serializer == "msgpack":
+        assert msgpack is not None, "读取 msgpack 编码的缓存需要安装 msgpack"
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+    # orjson 输出即为标准 JSON，未安装 orjson 时同样可以读取
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def _compress(compression: str, raw: bytes) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(raw, compresslevel=6)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(raw)
+    return raw
+
+
+def _decompress(compression: str, raw: bytes) -> bytes:
+    if compression == "gzip":
+        return gzip.decompress(raw)
+    if compression == "zstd":
+        assert zstandard is not None, "读取 zstd 压缩的缓存需要安装 zstandard"
+        return zstandard.ZstdDecompressor().decompress(raw)
+    return raw
+
+
+class Codec:
+    """
+    缓存编码方式，由序列化方式与压缩方式组成，如 ``orjson+zstd``
+    """
+
+    def __init__(self, serializer: str = "json", compression: str = "none") -> None:
+        if serializer not in SERIALIZERS or compression not in COMPRESSIONS:
+            raise ValueError(f"不支持的缓存编码方式 {serializer}+{compression}")
+        self.serializer, self.compression = serializer, compression
+
+    @classmethod
+    def parse(cls, spec: str) -> "Codec":
+        serializer, _, compression = spec.lower().partition("+")
+        return cls(serializer or "json", compression or "none")
+
+    @property
+    def name(self) -> str:
+        if self.compression == "none":
+            return self.serializer
+        return f"{self.serializer}+{self.compression}"
+
+    @property
+    def header(self) -> bytes:
+        """编码结果的文件头，紧凑 JSON 不带文件头"""
+        if self.serializer == "json" and self.compression == "none":
+            return b""
+        return MAGIC + bytes(
+            [SERIALIZERS.index(self.serializer), COMPRESSIONS.index(self.compression)]
+        )
+
+    def missing(self) -> List[str]:
+        """使用该编码方式需要但尚未安装的依赖"""
+        required = {"orjson": orjson, "msgpack": msgpack, "zstd": zstandard}
+        return [
+            "zstandard" if name == "zstd" else name
+            for name, mod in required.items()
+            if mod is None and name in [self.serializer, self.compression]
+        ]
+
+    def encode(self, data: Any) -> bytes:
+        return self.header + _compress(self.compression, _dumps(self.serializer, data))
+
+    def isCurrent(self, head: bytes) -> bool:
+        """
+        根据编码结果开头判断是否为该编码方式，用于维护时找出需要重新编码的缓存
+
+        * ``param head: bytes`` 编码结果的前 64 字节
+        """
+        if self.header:
+            return head.startswith(self.header)
+        # 紧凑 JSON 开头没有换行，旧版缩进格式第二个字符即为换行
+        return not head.startswith(MAGIC) and b"\n" not in head
+
+    @staticmethod
+    def decode(raw: bytes) -> Any:
+        """根据文件头解码任意编码方式的缓存"""
+        if raw.startswith(MAGIC):
+            serializer, compression = SERIALIZERS[raw[4]], COMPRESSIONS[raw[5]]
+            return _loads(serializer, _decompress(compression, raw[6:]))
+        return _loads("json", raw)
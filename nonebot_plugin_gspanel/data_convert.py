@@ -1,5 +1,6 @@
-import json
 from time import time
+from html import escape
+from math import pi, cos, sin
 from typing import Dict, List, Tuple
 
 from nonebot.log import logger
@@ -592,6 +593,53 @@ async def simplFightProp(
     return res
 
 
+def drawPieSvg(pieData: List[Dict], pieColor: List[str], size: int = 280) -> str:
+    """
+    队伍伤害占比饼图绘制，生成可直接嵌入模板的 SVG，取代页面中的 G2Plot 图表
+
+    * ``param pieData: List[Dict]`` 各伤害来源数据，已按伤害从高到低排序
+    * ``param pieColor: List[str]`` 扇区颜色，按 ``pieData`` 顺序依次取用
+    * ``param size: int = 280`` 图表宽高
+    - ``return: str`` SVG 字符串
+    """
+    total = sum(x["damage"] for x in pieData) or 1
+    # 与原 G2Plot 图表一致：绘图区域上边距 -10、下边距 20，半径为绘图区域的 80%
+    cx, cy, r = size / 2, size / 2 - 15, (size - 10) / 2 * 0.8
+    slices, labels, start = [], [], -pi / 2
+    for idx, x in enumerate(pieData):
+        color = pieColor[idx % len(pieColor)] if pieColor else "#999"
+        angle = 2 * pi * x["damage"] / total
+        if angle >= 2 * pi - 1e-6:
+            slices.append(
+                f'<circle cx="{cx:.2f}" cy="{cy:.2f}" r="{r:.2f}" fill="{color}"/>'
+            )
+        elif angle > 0:
+            end = start + angle
+            x0, y0 = cx + r * cos(start), cy + r * sin(start)
+            x1, y1 = cx + r * cos(end), cy + r * sin(end)
+            slices.append(
+                f'<path d="M{cx:.2f},{cy:.2f} L{x0:.2f},{y0:.2f} '
+                f'A{r:.2f},{r:.2f} 0 {int(angle > pi)} 1 {x1:.2f},{y1:.2f} Z" '
+                f'fill="{color}" stroke="#fff" stroke-width="1"/>'
+            )
+        # 占比不超过 6% 的扇区不显示标签
+        if round(x["damage"] / total * 100) > 6:
+            mid = start + angle / 2
+            lx, ly = cx + r * 0.6 * cos(mid), cy + r * 0.6 * sin(mid)
+            labels.append(
+                f'<text x="{lx:.2f}" y="{ly:.2f}">'
+                f'<tspan x="{lx:.2f}" dy="-0.2em">{escape(x["char"])}</tspan>'
+                f'<tspan x="{lx:.2f}" dy="1.2em">{x["damage"]:g}W</tspan></text>'
+            )
+        start += angle
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+        f'viewBox="0 0 {size} {size}">{"".join(slices)}'
+        '<g font-family="PanelNumFont" font-size="20" fill="#000" '
+        f'text-anchor="middle">{"".join(labels)}</g></svg>'
+    )
+
+
 async def simplTeamDamageRes(raw: Dict, rolesData: Dict) -> Dict:
     """
     转换队伍伤害计算请求数据为精简格式
@@ -706,8 +754,7 @@ async def simplTeamDamageRes(raw: Dict, rolesData: Dict) -> Dict:
         "dps": raw["zdl_result"],
         "tm": tm,
         "total": total,
-        "pie_data": json.dumps(pieData, ensure_ascii=False),
-        "pie_color": json.dumps(pieColor),
+        "pie_svg": drawPieSvg(pieData, pieColor),
         "avatars": avatars,
         "actions": raw["combo_intro"].split(","),
         "damages": damages,
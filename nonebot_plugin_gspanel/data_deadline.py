@@ -0,0 +1,68 @@
+"""
+命令处理期限，由命令入口设置并随上下文传递至数据请求、素材下载与图片渲染，各阶段只使用剩余时间，超时后降级处理而不是继续等待
+
+期限保存在 ``contextvars`` 中，命令处理过程中创建的任务同样受期限约束；预渲染等后台任务开始时需要清除期限
+"""
+
+from time import monotonic
+from contextvars import ContextVar
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# 数据请求与素材下载为图片渲染保留的时间（秒）
+RENDER_RESERVE = 5.0
+_deadline: ContextVar[Optional[float]] = ContextVar("gspanel_deadline", default=None)
+
+
+def currentDeadline() -> Optional[float]:
+    """当前期限（``monotonic()`` 时间），没有期限时返回空"""
+    return _deadline.get()
+
+
+def remaining(cap: float, reserve: float = 0.0) -> float:
+    """
+    本阶段可用的时间
+
+    * ``param cap: float`` 本阶段原有的超时时间（秒）
+    * ``param reserve: float = 0.0`` 为之后的阶段保留的时间（秒）
+    - ``return: float`` 不超过原有超时时间的剩余时间，没有期限时返回原有超时时间
+    """
+    at = _deadline.get()
+    return cap if at is None else max(min(cap, at - reserve - monotonic()), 0.0)
+
+
+def expired(reserve: float = 0.0) -> bool:
+    """期限是否已到，``reserve`` 为之后的阶段保留的时间（秒）"""
+    at = _deadline.get()
+    return at is not None and monotonic() >= at - reserve
+
+
+@contextmanager
+def deadlineAt(at: Optional[float]) -> Iterator[None]:
+    """在指定期限下执行，用于将提交者的期限带入渲染队列等长期运行的任务"""
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """
+    设置命令处理期限，已有更早的期限时保持不变
+
+    * ``param seconds: float`` 期限（秒），不大于 0 时不设置期限
+    """
+    at, current = monotonic() + seconds, _deadline.get()
+    if seconds <= 0:
+        at = current
+    elif current is not None:
+        at = min(at, current)
+    with deadlineAt(at):
+        yield
+
+
+def clearDeadline() -> None:
+    """清除当前任务的期限，仅影响当前任务及其之后创建的任务"""
+    _deadline.set(None)
@@ -0,0 +1,73 @@
+"""
+缓存异步读写，文件读写与编解码在线程池中进行，不阻塞事件循环
+
+同一缓存键的写入按顺序进行，前一次写入未完成时到达的多次写入只保留最后一次；写入完成前读取该键直接返回待写入的内容
+"""
+
+import asyncio
+from uuid import uuid4
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Tuple, TypeVar, Callable, Hashable, Optional, Awaitable
+
+from nonebot.log import logger
+
+T = TypeVar("T")
+Writer = Callable[[bytes], Awaitable[None]]
+_ioPool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="gspanel-io")
+
+
+async def runIo(func: Callable[..., T], *args: Any) -> T:
+    """在文件读写线程池中执行"""
+    return await asyncio.get_running_loop().run_in_executor(_ioPool, func, *args)
+
+
+def writeAtomic(f: Path, raw: bytes) -> None:
+    """先写入临时文件再替换，读取时不会遇到写入一半的文件"""
+    tmp = f.with_name(f"{f.stem}.{uuid4().hex[:8]}.tmp")
+    tmp.write_bytes(raw)
+    tmp.replace(f)
+
+
+class WriteBuffer:
+    """
+    待写入的缓存内容，每个键同时只有一个写入任务，写入期间到达的新内容覆盖尚未写入的旧内容
+    """
+
+    def __init__(self) -> None:
+        self._pending: Dict[Hashable, Tuple[bytes, Writer]] = {}
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        return self._pending[key][0] if key in self._pending else None
+
+    def put(self, key: Hashable, raw: bytes, writer: Writer) -> None:
+        self._pending[key] = (raw, writer)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._flush(key))
+
+    async def _flush(self, key: Hashable) -> None:
+        try:
+            while key in self._pending:
+                raw, writer = self._pending[key]
+                try:
+                    await writer(raw)
+                except Exception as e:
+                    logger.error(f"缓存 {key} 写入出错：{e}")
+                if self.get(key) is raw:
+                    del self._pending[key]
+        finally:
+            self._tasks.pop(key, None)
+
+    async def wait(self, key: Hashable) -> None:
+        """等待该键的待写入内容写入完成"""
+        while key in self._tasks:
+            await asyncio.wait({self._tasks[key]})
+
+    async def drain(self) -> None:
+        """等待全部待写入内容写入完成"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+writeBuffer = WriteBuffer()
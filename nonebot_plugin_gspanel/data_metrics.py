@@ -0,0 +1,202 @@
+"""
+面板生成各阶段的计数与耗时统计，以 Prometheus 文本格式导出，也可整理为文本发送给超级用户
+
+统计仅保存在内存中，每个进程单独统计，重启后清零
+"""
+
+from threading import Lock
+from time import monotonic
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple, Iterator, Optional
+
+# 默认耗时分桶（秒），覆盖素材下载到接口超时的范围
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+METRICS_PATH = "/gspanel/metrics"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    """Prometheus 文本格式的标签值转义"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmtLabels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [*labels, *([extra] if extra else [])]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    """
+    计数器，按标签分别计数
+
+    * ``param name: str`` 指标名称
+    * ``param desc: str`` 指标说明
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, desc: str) -> None:
+        self.name, self.desc = name, desc
+        self._values: Dict[Labels, float] = {}
+        self._lock = Lock()
+
+    def inc(self, value: float = 1, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self) -> List[Tuple[Labels, float]]:
+        with self._lock:
+            return sorted(self._values.items())
+
+    def expose(self) -> List[str]:
+        return [f"{self.name}{_fmtLabels(k)} {v:g}" for k, v in self.samples()]
+
+
+class Histogram:
+    """
+    耗时分布，按标签分别统计各分桶内的次数与总耗时
+
+    * ``param name: str`` 指标名称
+    * ``param desc: str`` 指标说明
+    * ``param buckets: Tuple[float, ...] = BUCKETS`` 分桶上限（秒）
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, desc: str, buckets: Tuple[float, ...] = BUCKETS
+    ) -> None:
+        self.name, self.desc, self.buckets = name, desc, buckets
+        # 各分桶次数（最后一个为超出全部分桶的次数）、总次数、总耗时
+        self._values: Dict[Labels, Tuple[List[int], int, float]] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            counts, total, acc = self._values.get(
+                key, ([0] * (len(self.buckets) + 1), 0, 0.0)
+            )
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + 1, acc + value)
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[Dict[str, Any]]:
+        """
+        统计代码块耗时，代码块中可修改返回的标签，如根据结果补充 ``outcome`` 标签
+
+        - ``return: Iterator[Dict[str, Any]]`` 本次统计使用的标签
+        """
+        start = monotonic()
+        try:
+            yield labels
+        finally:
+            self.observe(monotonic() - start, **labels)
+
+    def samples(self) -> List[Tuple[Labels, List[int], int, float]]:
+        with self._lock:
+            return [(k, list(c), t, a) for k, (c, t, a) in sorted(self._values.items())]
+
+    def quantile(self, counts: List[int], total: int, q: float) -> float:
+        """由分桶估算分位数，取所在分桶的上限"""
+        rank, seen = q * total, 0
+        for idx, c in enumerate(counts[:-1]):
+            seen += c
+            if seen >= rank:
+                return self.buckets[idx]
+        return float("inf")
+
+    def expose(self) -> List[str]:
+        lines = []
+        for key, counts, total, acc in self.samples():
+            cum = 0
+            for bound, c in zip(self.buckets, counts):
+                cum += c
+                le = _fmtLabels(key, ("le", f"{bound:g}"))
+                lines.append(f"{self.name}_bucket{le} {cum}")
+            le = _fmtLabels(key, ("le", "+Inf"))
+            lines.append(f"{self.name}_bucket{le} {total}")
+            lines.append(f"{self.name}_sum{_fmtLabels(key)} {acc:.6f}")
+            lines.append(f"{self.name}_count{_fmtLabels(key)} {total}")
+        return lines
+
+
+ENKA_SECONDS = Histogram("gspanel_enka_seconds", "角色展柜数据接口各镜像请求耗时")
+TEYVAT_SECONDS = Histogram("gspanel_teyvat_seconds", "提瓦特小助手伤害计算接口请求耗时")
+CONVERT_SECONDS = Histogram("gspanel_convert_seconds", "单个角色 Enka.Network 数据转换耗时")
+REFRESH_TOTAL = Counter("gspanel_refresh_total", "角色展柜数据刷新次数")
+ASSET_TOTAL = Counter("gspanel_asset_total", "面板素材请求次数")
+RENDER_SECONDS = Histogram("gspanel_render_seconds", "模板渲染耗时（不含排队）")
+RENDER_WAIT_SECONDS = Histogram("gspanel_render_wait_seconds", "渲染任务排队等待耗时")
+RENDER_TOTAL = Counter("gspanel_render_total", "渲染请求次数")
+REQUEST_SECONDS = Histogram("gspanel_request_seconds", "面板、角色列表、队伍伤害查询总耗时")
+REGISTRY: List[Any] = [
+    ENKA_SECONDS,
+    TEYVAT_SECONDS,
+    CONVERT_SECONDS,
+    REFRESH_TOTAL,
+    ASSET_TOTAL,
+    RENDER_SECONDS,
+    RENDER_WAIT_SECONDS,
+    RENDER_TOTAL,
+    REQUEST_SECONDS,
+]
+
+
+def exposition() -> str:
+    """Prometheus 文本格式的全部统计"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.desc}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+def metricsReport() -> str:
+    """超级用户查看的统计摘要，耗时分位数由分桶估算"""
+    lines = []
+    for metric in REGISTRY:
+        if isinstance(metric, Counter):
+            for key, value in metric.samples():
+                tag = " ".join([metric.desc, *(v for _, v in key)])
+                lines.append(f"{tag}：{value:g} 次")
+            continue
+        for key, counts, total, acc in metric.samples():
+            tag = " ".join([metric.desc, *(v for _, v in key)])
+            lines.append(
+                f"{tag}：{total} 次，平均 {acc / total:.3f}s，"
+                f"P50≤{metric.quantile(counts, total, 0.5):g}s，"
+                f"P95≤{metric.quantile(counts, total, 0.95):g}s"
+            )
+    return "\n".join(lines) or "暂无统计数据"
+
+
+def mountMetrics(driver: Any) -> bool:
+    """
+    在 NoneBot 的 FastAPI 服务上提供 Prometheus 统计接口
+
+    * ``param driver: Driver`` NoneBot 驱动器
+    - ``return: bool`` 是否成功提供接口，非 FastAPI 驱动器无法提供
+    """
+    # 组合驱动器的类型为各驱动器类型以 + 连接，如 fastapi+httpx+websockets
+    if driver.type.split("+")[0] != "fastapi":
+        return False
+    from fastapi.responses import PlainTextResponse
+
+    async def metrics() -> PlainTextResponse:
+        return PlainTextResponse(
+            exposition(), media_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+    driver.server_app.add_api_route(METRICS_PATH, metrics, methods=["GET"])
+    return True
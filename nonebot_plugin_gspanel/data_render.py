@@ -0,0 +1,481 @@
+import sys
+import json
+import struct
+import asyncio
+from hashlib import sha1
+from pathlib import Path
+from time import monotonic
+from itertools import count
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Union, Literal, Callable, Optional, Awaitable
+
+from nonebot import require
+from nonebot.log import logger
+from jinja2 import Environment, FileSystemLoader
+
+from .data_io import runIo, writeAtomic
+from .render_browser import PagePool, AssetCache, capture
+from .render_encode import IMAGE_EXT, hasPillow, encodeImage
+from .data_trace import span, traceIn, clearTrace, currentTrace
+from .data_metrics import RENDER_TOTAL, RENDER_SECONDS, RENDER_WAIT_SECONDS
+from .data_deadline import remaining, deadlineAt, clearDeadline, currentDeadline
+from .__utils__ import (
+    LOCAL_DIR,
+    IMAGE_BUDGET,
+    IMAGE_FORMAT,
+    RENDER_QUEUE,
+    SCALE_FACTOR,
+    IMAGE_QUALITY,
+    LIST_RENDERER,
+    PAGE_POOL_SIZE,
+    RENDER_TIMEOUT,
+    RENDER_WORKERS,
+    ASSET_CACHE_SIZE,
+    RENDER_PROCESSES,
+    PAGE_POOL_RECYCLE,
+    RENDER_CACHE_DISK,
+    RENDER_CACHE_SIZE,
+    thumbUrl,
+)
+
+require("nonebot_plugin_htmlrender")
+from nonebot_plugin_htmlrender import get_browser  # noqa: E402
+
+RENDER_DIR = LOCAL_DIR / "render"
+# 磁盘渲染缓存每写入多少次淘汰一次，避免每次写入都遍历缓存目录
+TRIM_INTERVAL = 20
+# 独立渲染进程在就绪等待结束后截图、传输图片的最长时间（秒），超出后视为无响应并重启进程
+PROCESS_GRACE = 5.0
+# 渲染开销 list < panel < team，队列中开销小的任务优先执行
+RENDER_PRIORITY = {"list": 0, "panel": 1, "team": 2}
+# 后台预渲染任务排在全部用户请求之后
+BACKGROUND_PRIORITY = len(RENDER_PRIORITY)
+# 输出 WebP 或限制图片大小时需要 Pillow 重新编码，此时浏览器截图输出无损 PNG
+OUTPUT_FORMAT, OUTPUT_BUDGET = IMAGE_FORMAT, IMAGE_BUDGET
+if OUTPUT_FORMAT not in IMAGE_EXT:
+    logger.warning(f"不支持的图片格式 {OUTPUT_FORMAT}，已改为 jpeg")
+    OUTPUT_FORMAT = "jpeg"
+if (OUTPUT_FORMAT == "webp" or OUTPUT_BUDGET) and not hasPillow():
+    logger.warning("输出 WebP 图片或限制图片大小需要安装 Pillow，已改为直接输出 JPEG 图片")
+    OUTPUT_FORMAT, OUTPUT_BUDGET = "jpeg", 0
+POST_ENCODE = hasPillow() and (OUTPUT_FORMAT == "webp" or OUTPUT_BUDGET > 0)
+SHOT_TYPE = "png" if POST_ENCODE or OUTPUT_FORMAT == "png" else "jpeg"
+if LIST_RENDERER == "pillow" and not hasPillow():
+    logger.warning("使用 Pillow 绘制角色列表需要安装 Pillow，已改为使用浏览器渲染")
+PILLOW_LIST = LIST_RENDERER == "pillow" and hasPillow()
+# 启用独立渲染进程时同时进行的渲染数量不少于进程数量，每个进程均可分到渲染任务
+RENDER_CONCURRENCY = max(RENDER_WORKERS, RENDER_PROCESSES)
+_tplEnv = Environment(loader=FileSystemLoader(str(LOCAL_DIR)), enable_async=True)
+_tplEnv.globals["thumb"] = thumbUrl
+_memCache: "OrderedDict[str, bytes]" = OrderedDict()
+_diskWrites = 0
+_encodePool = ThreadPoolExecutor(
+    max_workers=RENDER_CONCURRENCY, thread_name_prefix="gspanel-encode"
+)
+_pagePool = PagePool(
+    get_browser,
+    AssetCache(LOCAL_DIR, ASSET_CACHE_SIZE),
+    SCALE_FACTOR,
+    PAGE_POOL_SIZE,
+    PAGE_POOL_RECYCLE,
+)
+
+
+def renderKey(mode: str, ident: str, tplVer: str, templates: Dict) -> str:
+    """
+    渲染结果缓存键生成，模板上下文、模板版本、缩放比例、图片格式任一变化都会生成新的键
+
+    * ``param mode: str`` 模板类型
+    * ``param ident: str`` 查询标识，如 UID 与角色名
+    * ``param tplVer: str`` 模板版本
+    * ``param templates: Dict`` 模板上下文
+    - ``return: str`` 缓存键，同时用作磁盘缓存文件名
+    """
+    digest = sha1(
+        json.dumps(
+            [
+                tplVer,
+                SCALE_FACTOR,
+                OUTPUT_FORMAT,
+                IMAGE_QUALITY,
+                OUTPUT_BUDGET,
+                templates,
+            ],
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str,
+        ).encode("utf-8")
+    ).hexdigest()
+    return f"{mode}-{ident}-{digest[:20]}"
+
+
+async def readRenderCache(key: str) -> Optional[bytes]:
+    """渲染结果缓存读取，内存中未命中时尝试读取磁盘缓存"""
+    if key in _memCache:
+        _memCache.move_to_end(key)
+        return _memCache[key]
+    if not RENDER_CACHE_DISK:
+        return None
+    img = await runIo(_readDisk, RENDER_DIR / f"{key}.{IMAGE_EXT[OUTPUT_FORMAT]}")
+    if img is not None:
+        _saveMemCache(key, img)
+    return img
+
+
+async def writeRenderCache(key: str, img: bytes) -> None:
+    """渲染结果缓存写入，每写入 ``TRIM_INTERVAL`` 次磁盘缓存淘汰一次最久未使用的缓存"""
+    global _diskWrites
+    _saveMemCache(key, img)
+    if not RENDER_CACHE_DISK:
+        return
+    await runIo(_writeDisk, RENDER_DIR / f"{key}.{IMAGE_EXT[OUTPUT_FORMAT]}", img)
+    _diskWrites += 1
+    if _diskWrites % TRIM_INTERVAL == 1:
+        await runIo(_trimDisk, RENDER_CACHE_DISK)
+
+
+def _readDisk(f: Path) -> Optional[bytes]:
+    try:
+        img = f.read_bytes()
+    except FileNotFoundError:
+        return None
+    f.touch()
+    return img
+
+
+def _writeDisk(f: Path, img: bytes) -> None:
+    f.parent.mkdir(parents=True, exist_ok=True)
+    writeAtomic(f, img)
+
+
+def _trimDisk(limit: int) -> None:
+    cached = sorted(
+        (f for f in RENDER_DIR.iterdir() if f.is_file()),
+        key=lambda f: f.stat().st_mtime,
+    )
+    for f in cached[: max(len(cached) - limit, 0)]:
+        f.unlink(missing_ok=True)
+
+
+def _saveMemCache(key: str, img: bytes) -> None:
+    if not RENDER_CACHE_SIZE:
+        return
+    _memCache[key] = img
+    _memCache.move_to_end(key)
+    while len(_memCache) > RENDER_CACHE_SIZE:
+        _memCache.popitem(last=False)
+
+
+class RenderQueue:
+    """
+    渲染任务队列，最多同时执行 ``workers`` 个渲染，排队任务超过 ``maxDepth`` 时拒绝新任务
+    """
+
+    def __init__(self, workers: int, maxDepth: int) -> None:
+        self.workers, self.maxDepth = workers, maxDepth
+        self.served, self.shed, self.expired = 0, 0, 0
+        self.waits: "deque[float]" = deque(maxlen=200)
+        self._seq = count()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def stats(self) -> Dict[str, float]:
+        """队列状态与最近 200 个任务的排队等待时间统计（秒）"""
+        waits = sorted(self.waits)
+        return {
+            "depth": self.depth,
+            "served": self.served,
+            "shed": self.shed,
+            "expired": self.expired,
+            "wait_avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            "wait_p95": round(waits[int(len(waits) * 0.95)], 3) if waits else 0.0,
+            "wait_max": round(waits[-1], 3) if waits else 0.0,
+        }
+
+    async def _worker(self) -> None:
+        assert self._queue
+        # 工作任务由首个提交者创建，每个任务改为在各自提交者的期限下执行
+        clearDeadline()
+        clearTrace()
+        while True:
+            _, _, enqueued, job, fut, at = await self._queue.get()
+            if fut.cancelled():
+                continue
+            self.waits.append(monotonic() - enqueued)
+            RENDER_WAIT_SECONDS.observe(self.waits[-1])
+            try:
+                with deadlineAt(at):
+                    img = await job()
+                if not fut.done():
+                    fut.set_result(img)
+            except Exception as e:
+                if not fut.done():
+                    fut.set_exception(e)
+            self.served += 1
+
+    async def submit(
+        self, priority: int, job: Callable[[], Awaitable[bytes]]
+    ) -> Optional[bytes]:
+        """
+        提交渲染任务并等待结果，最多等待至命令处理期限，超时后仍在排队的任务不再执行
+
+        * ``param priority: int`` 任务优先级，数值越小越先执行
+        * ``param job: Callable[[], Awaitable[bytes]]`` 渲染任务
+        - ``return: Optional[bytes]`` 图片字节，队列已满时返回空，超出命令处理期限时抛出 ``asyncio.TimeoutError``
+        """
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._tasks = [
+                asyncio.create_task(self._worker()) for _ in range(self.workers)
+            ]
+        if self.depth >= self.maxDepth:
+            self.shed += 1
+            logger.warning(f"渲染队列已满（{self.depth} 个任务排队中），拒绝新的渲染任务")
+            return None
+        fut = asyncio.get_running_loop().create_future()
+        at = currentDeadline()
+        self._queue.put_nowait((priority, next(self._seq), monotonic(), job, fut, at))
+        if at is None:
+            return await fut
+        try:
+            return await asyncio.wait_for(fut, max(at - monotonic(), 0.0))
+        except asyncio.TimeoutError:
+            self.expired += 1
+            raise
+
+
+_renderQueue = RenderQueue(RENDER_CONCURRENCY, RENDER_QUEUE)
+
+
+class RenderProcess:
+    """
+    独立渲染进程（``render_worker.py``），进程意外退出时在下次渲染前自动重启
+    """
+
+    def __init__(self) -> None:
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # 延迟创建，确保绑定至 NoneBot 实际运行的事件循环
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def start(self) -> None:
+        self.proc = await asyncio.create_subprocess_exec(
+            sys.executable,
+            str(Path(__file__).parent / "render_worker.py"),
+            f"--root={LOCAL_DIR.resolve()}",
+            f"--scale={SCALE_FACTOR}",
+            f"--timeout={RENDER_TIMEOUT}",
+            f"--pool={max(PAGE_POOL_SIZE, 1)}",
+            f"--recycle={PAGE_POOL_RECYCLE}",
+            f"--asset-cache={ASSET_CACHE_SIZE}",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=2**26,
+        )
+        logger.info(f"独立渲染进程 {self.proc.pid} 已启动")
+
+    async def stop(self) -> None:
+        if self.proc and self.proc.returncode is None:
+            self.proc.kill()
+            await self.proc.wait()
+        self.proc = None
+
+    async def render(self, tplName: str, html: str) -> Tuple[bytes, bool]:
+        """发送模板 HTML 至渲染进程并等待图片返回，同时返回是否在超时前就绪"""
+        async with self.lock:
+            if self.proc is None or self.proc.returncode is not None:
+                await self.start()
+            proc = self.proc
+            assert proc and proc.stdin and proc.stdout
+            timeout = remaining(RENDER_TIMEOUT)
+            try:
+                req = json.dumps(
+                    {
+                        "tpl": tplName,
+                        "html": html,
+                        "type": SHOT_TYPE,
+                        "quality": IMAGE_QUALITY,
+                        "timeout": timeout,
+                    }
+                ).encode("utf-8")
+                proc.stdin.write(struct.pack(">I", len(req)) + req)
+                await proc.stdin.drain()
+                frames = await asyncio.wait_for(
+                    self._readFrames(proc.stdout), timeout + PROCESS_GRACE
+                )
+            except BaseException:
+                # 通信中断或超时后无法确定输出帧边界，直接结束进程等待下次重启
+                if proc.returncode is None:
+                    proc.kill()
+                self.proc = None
+                raise
+        header = json.loads(frames[0])
+        if not header["ok"]:
+            raise RuntimeError(header["error"])
+        if not header["ready"]:
+            logger.warning(f"{tplName} 模板 {timeout:.1f} 秒内未就绪，可能存在未加载的素材")
+        return frames[1], header["ready"]
+
+    @staticmethod
+    async def _readFrames(reader: asyncio.StreamReader) -> List[bytes]:
+        frames = []
+        for _ in range(2):
+            (size,) = struct.unpack(">I", await reader.readexactly(4))
+            frames.append(await reader.readexactly(size))
+        return frames
+
+
+_renderProcs = [RenderProcess() for _ in range(RENDER_PROCESSES)]
+
+
+async def stopRenderProcesses() -> None:
+    """关闭全部独立渲染进程"""
+    for proc in _renderProcs:
+        await proc.stop()
+
+
+async def renderHtml(mode: str, tplName: str, html: str) -> Tuple[bytes, bool]:
+    """渲染模板 HTML 并截图，需要时在线程池中将截图重新编码为配置的图片格式，同时返回是否在超时前就绪"""
+    img, ready = await _screenshot(mode, tplName, html)
+    if not POST_ENCODE:
+        return img, ready
+    start = monotonic()
+    encoded = await asyncio.get_running_loop().run_in_executor(
+        _encodePool, encodeImage, img, OUTPUT_FORMAT, IMAGE_QUALITY, OUTPUT_BUDGET
+    )
+    logger.debug(
+        f"{mode} 模板图片编码为 {OUTPUT_FORMAT}：{len(img) // 1024} KB -> "
+        f"{len(encoded) // 1024} KB，耗时 {monotonic() - start:.3f} 秒"
+    )
+    return encoded, ready
+
+
+async def _screenshot(mode: str, tplName: str, html: str) -> Tuple[bytes, bool]:
+    """模板截图，启用独立渲染进程时交由空闲进程处理，否则优先使用常驻页面。页面载入与素材等待时间不超过命令处理期限，每次重试时重新计算"""
+    if _renderProcs:
+        proc = min(_renderProcs, key=lambda p: p.lock.locked())
+        try:
+            return await proc.render(tplName, html)
+        except Exception as e:
+            logger.opt(exception=e).warning(f"{mode} 模板独立渲染进程出错，正在使用插件进程重试")
+    img, ready, timeout = b"", True, 0.0
+    if PAGE_POOL_SIZE:
+        try:
+            async with _pagePool.page(tplName, html, remaining(RENDER_TIMEOUT)) as page:
+                timeout = remaining(RENDER_TIMEOUT)
+                img, ready = await capture(page, timeout, SHOT_TYPE, IMAGE_QUALITY)
+        except Exception as e:
+            logger.opt(exception=e).warning(f"{mode} 模板常驻页面渲染出错，正在使用新页面重试")
+    if not img:
+        async with _pagePool.fresh(html, remaining(RENDER_TIMEOUT)) as page:
+            timeout = remaining(RENDER_TIMEOUT)
+            img, ready = await capture(page, timeout, SHOT_TYPE, IMAGE_QUALITY)
+    if not ready:
+        logger.warning(f"{mode} 模板 {timeout:.1f} 秒内未就绪，可能存在未加载的素材")
+    return img, ready
+
+
+def _drawList(templates: Dict) -> bytes:
+    from .render_list import drawList
+
+    img = drawList(LOCAL_DIR, SCALE_FACTOR, templates["uid"], templates["data"])
+    return encodeImage(img, OUTPUT_FORMAT, IMAGE_QUALITY, OUTPUT_BUDGET)
+
+
+async def renderList(tplVer: str, templates: Dict) -> Tuple[bytes, bool]:
+    """角色列表卡片 Pillow 绘制，不经过浏览器，出错时改用浏览器渲染。Pillow 绘制无需等待素材，总是视为就绪"""
+    try:
+        img = await asyncio.get_running_loop().run_in_executor(
+            _encodePool, _drawList, templates
+        )
+        return img, True
+    except Exception as e:
+        logger.opt(exception=e).warning("list 模板 Pillow 绘制出错，正在使用浏览器重试")
+    tplName = f"list-{tplVer}.html"
+    html = await _tplEnv.get_template(tplName).render_async(**templates)
+    return await renderHtml("list", tplName, html)
+
+
+async def renderPic(
+    mode: Literal["list", "panel", "team"],
+    ident: str,
+    tplVer: str,
+    templates: Dict,
+    background: bool = False,
+    complete: bool = True,
+) -> Union[bytes, str]:
+    """
+    模板渲染截图，相同模板上下文的渲染结果直接从缓存返回，否则进入渲染队列排队
+
+    * ``param mode: Literal["list", "panel", "team"]`` 模板类型
+    * ``param ident: str`` 查询标识，如 UID 与角色名，仅用于区分缓存文件
+    * ``param tplVer: str`` 模板版本
+    * ``param templates: Dict`` 模板上下文
+    * ``param background: bool = False`` 是否为后台预渲染。以最低优先级排队，渲染队列中已有任务等待时直接跳过
+    * ``param complete: bool = True`` 模板所需素材是否全部下载完成。未完成或截图前素材未就绪时，缺失的素材以占位图代替，渲染结果不写入缓存
+    - ``return: Union[bytes, str]`` 图片字节，渲染队列已满或超出命令处理期限时返回提示信息，后台预渲染跳过时返回空
+    """
+    pillow = mode == "list" and PILLOW_LIST
+    key = renderKey(mode, ident, f"{tplVer}-pillow" if pillow else tplVer, templates)
+    cached = await readRenderCache(key)
+    if cached:
+        logger.info(f"{mode} 模板渲染结果命中缓存 {key}")
+        RENDER_TOTAL.inc(mode=mode, result="cache")
+        return cached
+    if background and _renderQueue.depth:
+        logger.debug(f"渲染队列繁忙，跳过 {mode} 模板预渲染 {key}")
+        RENDER_TOTAL.inc(mode=mode, result="skipped")
+        return ""
+
+    priority = RENDER_PRIORITY[mode] + (BACKGROUND_PRIORITY if background else 0)
+    tplName = f"{mode}-{tplVer}.html"
+    html = (
+        "" if pillow else await _tplEnv.get_template(tplName).render_async(**templates)
+    )
+
+    tr = currentTrace()
+
+    async def job() -> bytes:
+        # 渲染完成即写入缓存，超出命令处理期限未能返回的图片在下次查询时直接返回。
+        # 含有占位图的图片不写入缓存，下次查询时重新渲染
+        renderer = "pillow" if pillow else "browser"
+        with traceIn(tr), span("draw", renderer=renderer), RENDER_SECONDS.time(
+            mode=mode, renderer=renderer
+        ):
+            img, ready = await (
+                renderList(tplVer, templates)
+                if pillow
+                else renderHtml(mode, tplName, html)
+            )
+        if complete and ready:
+            await writeRenderCache(key, img)
+        else:
+            logger.info(f"{mode} 模板存在未就绪的素材，渲染结果不写入缓存 {key}")
+        return img
+
+    try:
+        # 渲染阶段包括排队等待，实际渲染耗时另记为 draw 阶段
+        with span("render", mode=mode):
+            img = await _renderQueue.submit(priority, job)
+    except asyncio.TimeoutError:
+        logger.warning(f"{mode} 模板渲染超出命令处理期限 {key}")
+        RENDER_TOTAL.inc(mode=mode, result="timeout")
+        return "图片生成超时了，请稍后再试！"
+    except Exception:
+        RENDER_TOTAL.inc(mode=mode, result="error")
+        raise
+    if img is None:
+        RENDER_TOTAL.inc(mode=mode, result="rejected")
+        return "当前排队生成的图片太多啦，请稍后再试！"
+    RENDER_TOTAL.inc(mode=mode, result="rendered")
+    return img
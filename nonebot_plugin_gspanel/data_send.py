@@ -0,0 +1,91 @@
+import asyncio
+from time import time
+from uuid import uuid4
+from pathlib import Path
+from typing import Set, Union
+
+from nonebot.log import logger
+from nonebot.adapters.onebot.v11 import Bot
+from nonebot.adapters.onebot.v11.event import MessageEvent
+from nonebot.adapters.onebot.v11.exception import ActionFailed
+from nonebot.adapters.onebot.v11.message import MessageSegment
+
+from .data_io import runIo
+from .render_encode import IMAGE_EXT
+from .data_render import OUTPUT_FORMAT
+from .__utils__ import SEND_TTL, SEND_URL, LOCAL_DIR, SEND_MODE, driver
+
+OUTPUT_DIR = LOCAL_DIR / "out"
+OUTPUT_PATH = "/gspanel/out"
+# 以文件或 URL 形式发送失败的 Bot，之后直接发送图片字节
+_bytesOnly: Set[str] = set()
+
+
+def mountOutput() -> str:
+    """
+    URL 发送模式下由 NoneBot 的 FastAPI 服务提供渲染图片访问，未指定 ``gspanel_send_url`` 时使用本机地址
+
+    - ``return: str`` 图片 URL 前缀，无法提供访问时返回空
+    """
+    if SEND_URL:
+        return SEND_URL
+    # 组合驱动器的类型为各驱动器类型以 + 连接，如 fastapi+httpx+websockets
+    if driver.type.split("+")[0] != "fastapi":
+        logger.warning(f"当前驱动器 {driver.type} 无法提供渲染图片访问，请配置 gspanel_send_url")
+        return ""
+    from fastapi.staticfiles import StaticFiles
+
+    driver.server_app.mount(  # type: ignore
+        OUTPUT_PATH, StaticFiles(directory=str(OUTPUT_DIR)), name="gspanel-out"
+    )
+    host = str(driver.config.host)
+    host = "127.0.0.1" if host in ["0.0.0.0", "::"] else host
+    return f"http://{host}:{driver.config.port}{OUTPUT_PATH}"
+
+
+if SEND_MODE in ["file", "url"]:
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+OUTPUT_URL = mountOutput() if SEND_MODE == "url" else ""
+
+
+async def saveOutput(img: bytes) -> Path:
+    """渲染图片写入发送目录，到期自动删除，同时清理此前遗留的过期图片"""
+    f = OUTPUT_DIR / f"{uuid4().hex}.{IMAGE_EXT[OUTPUT_FORMAT]}"
+    await runIo(_writeOutput, f, img)
+    asyncio.get_running_loop().call_later(SEND_TTL, f.unlink, True)
+    return f
+
+
+def _writeOutput(f: Path, img: bytes) -> None:
+    expired = time() - SEND_TTL
+    for old in OUTPUT_DIR.iterdir():
+        try:
+            if old.stat().st_mtime < expired:
+                old.unlink(missing_ok=True)
+        except FileNotFoundError:
+            # 同时到期的图片已被定时删除
+            continue
+    f.write_bytes(img)
+
+
+async def sendImage(bot: Bot, event: MessageEvent, img: bytes) -> None:
+    """
+    渲染图片发送，按 ``gspanel_send_mode`` 以文件路径或 URL 引用图片，避免在消息中内联大量 base64 数据
+
+    OneBot 实现与 Bot 不在同一主机时无法读取文件路径，发送失败后改为直接发送图片字节，并对该 Bot 不再尝试
+
+    * ``param bot: Bot`` 发送消息的 Bot
+    * ``param event: MessageEvent`` 回复的消息事件
+    * ``param img: bytes`` 图片字节
+    """
+    if SEND_MODE not in ["file", "url"] or bot.self_id in _bytesOnly:
+        await bot.send(event, MessageSegment.image(img))
+        return
+    f = await saveOutput(img)
+    ref: Union[str, Path] = f"{OUTPUT_URL}/{f.name}" if OUTPUT_URL else f
+    try:
+        await bot.send(event, MessageSegment.image(ref))
+    except ActionFailed as e:
+        logger.warning(f"Bot{bot.self_id} 无法以 {SEND_MODE} 方式发送图片，改为直接发送图片：{e}")
+        _bytesOnly.add(bot.self_id)
+        await bot.send(event, MessageSegment.image(img))
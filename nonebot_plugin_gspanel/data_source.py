@@ -5,12 +5,22 @@ from copy import deepcopy
 from typing import Dict, List, Union, Literal
 from datetime import datetime, timezone, timedelta
 
-from nonebot import require
 from nonebot.log import logger
 from httpx import HTTPError, AsyncClient
 
-from .__utils__ import LOCAL_DIR, SCALE_FACTOR, download
+from .data_render import renderPic
+from .data_trace import span, clearTrace
 from .__version__ import CHAR_TPL_VER, LIST_TPL_VER, TEAM_TPL_VER
+from .data_deadline import RENDER_RESERVE, expired, remaining, clearDeadline
+from .data_metrics import ENKA_SECONDS, REFRESH_TOTAL, TEYVAT_SECONDS, CONVERT_SECONDS
+from .data_cache import (
+    readCache,
+    recordHit,
+    summarize,
+    writeCache,
+    readSummary,
+    refreshLease,
+)
 from .data_convert import (
     transFromEnka,
     transToTeyvat,
@@ -18,9 +28,20 @@ from .data_convert import (
     simplFightProp,
     simplTeamDamageRes,
 )
+from .__utils__ import (
+    PRERENDER,
+    TEYVAT_API,
+    ENKA_MIRRORS,
+    RENDER_CACHE_DISK,
+    RENDER_CACHE_SIZE,
+    download,
+)
 
-require("nonebot_plugin_htmlrender")
-from nonebot_plugin_htmlrender import template_to_pic  # noqa: E402
+if PRERENDER and not (RENDER_CACHE_SIZE or RENDER_CACHE_DISK):
+    logger.warning("预渲染需要开启渲染缓存，已关闭预渲染")
+PRERENDER_ON = PRERENDER and bool(RENDER_CACHE_SIZE or RENDER_CACHE_DISK)
+# 正在进行的后台预渲染，同一 UID 同时只进行一轮
+_prerenderTasks: Dict[str, asyncio.Task] = {}
 
 
 async def queryPanelApi(uid: str) -> Dict:
@@ -30,10 +51,7 @@ async def queryPanelApi(uid: str) -> Dict:
     * ``param uid: str`` 查询用户 UID
     - ``return: Dict`` 查询结果，出错时返回 ``{"error": "错误信息"}``
     """
-    enkaMirrors = [
-        "https://enka.network",
-        "http://profile.microgg.cn",
-    ]
+    enkaMirrors = list(ENKA_MIRRORS)
     # B 服优先从 MicroGG API 尝试
     if int(uid[0]) == 5:
         enkaMirrors.reverse()
@@ -42,20 +60,28 @@ async def queryPanelApi(uid: str) -> Dict:
         resJson = {}
         for idx, root in enumerate(enkaMirrors):
             apiName = "MicroGG API" if "microgg" in root else "Enka API"
+            # 命令处理期限已到时不再尝试其他镜像，有缓存时返回缓存数据
+            if expired(RENDER_RESERVE):
+                logger.warning(f"UID{uid} 的面板数据请求超出命令处理期限")
+                return {"error": "面板数据接口响应超时，请稍后再试.."}
             try:
-                res = await client.get(
-                    url=f"{root}/api/uid/{uid}",
-                    headers={
-                        "Accept": "application/json",
-                        "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8,en-US;q=0.7",
-                        "Cache-Control": "no-cache",
-                        "Cookie": "locale=zh-CN",
-                        "Referer": "https://enka.network/",
-                        "User-Agent": "GsPanel/0.2",
-                    },
-                    follow_redirects=True,
-                    timeout=20.0,
-                )
+                with span("enka", mirror=apiName), ENKA_SECONDS.time(
+                    mirror=root, status="error"
+                ) as labels:
+                    res = await client.get(
+                        url=f"{root}/api/uid/{uid}",
+                        headers={
+                            "Accept": "application/json",
+                            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8,en-US;q=0.7",
+                            "Cache-Control": "no-cache",
+                            "Cookie": "locale=zh-CN",
+                            "Referer": "https://enka.network/",
+                            "User-Agent": "GsPanel/0.2",
+                        },
+                        follow_redirects=True,
+                        timeout=remaining(20.0, RENDER_RESERVE),
+                    )
+                    labels["status"] = res.status_code
 
                 # 400 = Wrong UID format
                 # 404 = Player does not exist (MHY server said that)
@@ -107,131 +133,160 @@ async def queryDamageApi(
     - ``return: Dict`` 查询结果，出错时返回 ``{}``
     """  # noqa: E501
     apiMap = {
-        "single": "https://api.lelaer.com/ys/getDamageResult.php",
-        "team": "https://api.lelaer.com/ys/getTeamResult.php",
+        "single": f"{TEYVAT_API}/getDamageResult.php",
+        "team": f"{TEYVAT_API}/getTeamResult.php",
     }
+    # 命令处理期限已到时跳过伤害计算，角色面板照常返回，伤害计算在下次刷新时补充
+    if expired(RENDER_RESERVE):
+        logger.warning("提瓦特小助手接口请求超出命令处理期限，已跳过")
+        return {}
     async with AsyncClient() as client:
         try:
-            res = await client.post(
-                apiMap[mode],
-                json=body,
-                headers={
-                    "referer": "https://servicewechat.com/wx2ac9dce11213c3a8/192/page-frame.html",  # noqa: E501
-                    "user-agent": (
-                        "Mozilla/5.0 (Linux; Android 12; SM-G977N Build/SP1A.210812.016"
-                        "; wv) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 "
-                        "Chrome/86.0.4240.99 XWEB/4375 MMWEBSDK/20221011 Mobile Safari"
-                        "/537.36 MMWEBID/4357 MicroMessenger/8.0.30.2244(0x28001E44) "
-                        "WeChat/arm64 Weixin GPVersion/1 NetType/WIFI Language/zh_CN "
-                        "ABI/arm64 MiniProgramEnv/android"
-                    ),
-                },
-                timeout=20.0,
-            )
+            with span("damage", mode=mode), TEYVAT_SECONDS.time(
+                mode=mode, status="error"
+            ) as labels:
+                res = await client.post(
+                    apiMap[mode],
+                    json=body,
+                    headers={
+                        "referer": "https://servicewechat.com/wx2ac9dce11213c3a8/192/page-frame.html",  # noqa: E501
+                        "user-agent": (
+                            "Mozilla/5.0 (Linux; Android 12; SM-G977N "
+                            "Build/SP1A.210812.016; wv) AppleWebKit/537.36 "
+                            "(KHTML, like Gecko) Version/4.0 Chrome/86.0.4240.99 "
+                            "XWEB/4375 MMWEBSDK/20221011 Mobile Safari/537.36 "
+                            "MMWEBID/4357 MicroMessenger/8.0.30.2244(0x28001E44) "
+                            "WeChat/arm64 Weixin GPVersion/1 NetType/WIFI "
+                            "Language/zh_CN ABI/arm64 MiniProgramEnv/android"
+                        ),
+                    },
+                    timeout=remaining(20.0, RENDER_RESERVE),
+                )
+                labels["status"] = res.status_code
             return res.json()
         except (HTTPError, json.decoder.JSONDecodeError) as e:
             logger.opt(exception=e).error("提瓦特小助手接口无法访问或返回错误")
             return {}
 
 
-async def getAvatarData(uid: str, char: str = "全部") -> Dict:
+async def getAvatarData(
+    uid: str, char: str = "全部", summary: bool = False, background: bool = False
+) -> Dict:
     """
     角色数据获取（内部格式）
 
     * ``param uid: str`` 查询用户 UID
     * ``param char: str = "全部"`` 查询角色名
+    * ``param summary: bool = False`` 查询全部角色时是否只返回角色列表所需的角色概要
+    * ``param background: bool = False`` 是否为后台刷新，后台刷新不计入查询时间
     - ``return: Dict`` 查询结果。出错时返回 ``{"error": "错误信息"}``
     """
-    # 总是先读取一遍缓存
-    cache = LOCAL_DIR / "cache" / f"{uid}.json"
-    if cache.exists():
-        cacheData = json.loads(cache.read_text(encoding="utf-8"))
-        nextQueryTime: int = cacheData["next"]
-    else:
-        cacheData, nextQueryTime = {}, 0
-
+    # 总是先读取一遍缓存，角色列表在刷新冷却期间只需读取角色概要
+    with span("cache"):
+        cacheData = (
+            await readSummary(uid, background) if summary and char == "全部" else {}
+        )
+        if int(time()) > cacheData.get("next", 0):
+            cacheData = await readCache(uid, background)
     refreshed, _tip, _time = [], "", 0
-
-    if int(time()) <= nextQueryTime:
-        _tip, _time = "warning", nextQueryTime
-        logger.info(f"UID{uid} 的角色展柜数据刷新冷却还有 {int(nextQueryTime - time())} 秒！")
-    else:
-        logger.info(f"UID{uid} 的角色展柜数据正在刷新！")
-        newData = await queryPanelApi(uid)
-        _time = time()
-        # 没有缓存 & 本次刷新失败，返回错误信息
-        if not cacheData and newData.get("error"):
-            return newData
-        # 本次刷新成功，处理全部角色
-        elif not newData.get("error"):
-            _tip = "success"
-            avatarsCache = {str(x["id"]): x for x in cacheData.get("avatars", [])}
-            now, wait4Dmg, avatars = int(time()), {}, []
-            for newAvatar in newData["avatarInfoList"]:
-                if newAvatar["avatarId"] in [10000005, 10000007]:
-                    logger.info("旅行者面板查询暂未支持！")
-                    continue
-                tmp, gotDmg = await transFromEnka(newAvatar, now), False
-
-                if str(tmp["id"]) in avatarsCache:
-                    # 保留旧的伤害计算数据
-                    avatarsCache[str(tmp["id"])].pop("time")
-                    cacheDmg = avatarsCache[str(tmp["id"])].pop("damage")
-                    nowStat = {
-                        k: v for k, v in tmp.items() if k not in ["damage", "time"]
-                    }
-                    if cacheDmg and avatarsCache[str(tmp["id"])] == nowStat:
-                        logger.info(f"UID{uid} 的 {tmp['name']} 伤害计算结果无需刷新！")
-                        tmp["damage"], gotDmg = cacheDmg, True
-                    else:
-                        logger.debug(
-                            "UID{} 的 {} 数据变化细则：\n{}\n{}".format(
-                                uid, tmp["name"], avatarsCache[str(tmp["id"])], nowStat
+    # 刷新冷却已结束时获取刷新租约，多个实例（或同时查询的多个会话）只刷新一次
+    async with refreshLease(uid, cacheData, background) as cacheData:
+        # 其他实例正在刷新且没有缓存
+        if cacheData.get("error"):
+            return cacheData
+        nextQueryTime: int = cacheData.get("next", 0)
+        if int(time()) <= nextQueryTime:
+            _tip, _time = "warning", nextQueryTime
+            REFRESH_TOTAL.inc(result="cooldown")
+            logger.info(f"UID{uid} 的角色展柜数据刷新冷却还有 {int(nextQueryTime - time())} 秒！")
+        else:
+            logger.info(f"UID{uid} 的角色展柜数据正在刷新！")
+            newData = await queryPanelApi(uid)
+            _time = time()
+            # 没有缓存 & 本次刷新失败，返回错误信息
+            if not cacheData and newData.get("error"):
+                return newData
+            # 本次刷新成功，处理全部角色
+            elif not newData.get("error"):
+                _tip = "success"
+                REFRESH_TOTAL.inc(result="success")
+                avatarsCache = {str(x["id"]): x for x in cacheData.get("avatars", [])}
+                now, wait4Dmg, avatars = int(time()), {}, []
+                for newAvatar in newData["avatarInfoList"]:
+                    if newAvatar["avatarId"] in [10000005, 10000007]:
+                        logger.info("旅行者面板查询暂未支持！")
+                        continue
+                    with span("convert"), CONVERT_SECONDS.time():
+                        tmp, gotDmg = await transFromEnka(newAvatar, now), False
+
+                    if str(tmp["id"]) in avatarsCache:
+                        # 保留旧的伤害计算数据
+                        avatarsCache[str(tmp["id"])].pop("time")
+                        cacheDmg = avatarsCache[str(tmp["id"])].pop("damage")
+                        nowStat = {
+                            k: v for k, v in tmp.items() if k not in ["damage", "time"]
+                        }
+                        if cacheDmg and avatarsCache[str(tmp["id"])] == nowStat:
+                            logger.info(f"UID{uid} 的 {tmp['name']} 伤害计算结果无需刷新！")
+                            tmp["damage"], gotDmg = cacheDmg, True
+                        else:
+                            logger.debug(
+                                "UID{} 的 {} 数据变化细则：\n{}\n{}".format(
+                                    uid,
+                                    tmp["name"],
+                                    avatarsCache[str(tmp["id"])],
+                                    nowStat,
+                                )
                             )
+                    refreshed.append(tmp["id"])
+                    avatars.append(tmp)
+                    if not gotDmg:
+                        wait4Dmg[str(len(avatars) - 1)] = tmp
+
+                if wait4Dmg:
+                    _names = "/".join(
+                        f"[{aI}]{a['name']}" for aI, a in wait4Dmg.items()
+                    )
+                    logger.info(f"正在为 UID{uid} 的 {_names} 重新请求伤害计算接口")
+                    # 深拷贝避免转换对上下文中的 avatars 产生影响
+                    wtf = deepcopy([a for _, a in wait4Dmg.items()])
+                    teyvatBody = await transToTeyvat(wtf, uid)
+                    teyvatRaw = await queryDamageApi(teyvatBody)
+                    if teyvatRaw.get("code", "x") != 200 or len(wait4Dmg) != len(
+                        teyvatRaw.get("result", [])
+                    ):
+                        logger.error(
+                            f"UID{uid} 的 {len(wait4Dmg)} 位角色伤害计算请求失败！"
+                            f"\n>>>> [提瓦特返回] {teyvatRaw}"
                         )
-                refreshed.append(tmp["id"])
-                avatars.append(tmp)
-                if not gotDmg:
-                    wait4Dmg[str(len(avatars) - 1)] = tmp
-
-            if wait4Dmg:
-                _names = "/".join(f"[{aI}]{a['name']}" for aI, a in wait4Dmg.items())
-                logger.info(f"正在为 UID{uid} 的 {_names} 重新请求伤害计算接口")
-                # 深拷贝避免转换对上下文中的 avatars 产生影响
-                wtf = deepcopy([a for _, a in wait4Dmg.items()])
-                teyvatBody = await transToTeyvat(wtf, uid)
-                teyvatRaw = await queryDamageApi(teyvatBody)
-                if teyvatRaw.get("code", "x") != 200 or len(wait4Dmg) != len(
-                    teyvatRaw.get("result", [])
-                ):
-                    logger.error(
-                        f"UID{uid} 的 {len(wait4Dmg)} 位角色伤害计算请求失败！"
-                        f"\n>>>> [提瓦特返回] {teyvatRaw}"
+                    else:
+                        for dmgIdx, dmgData in enumerate(teyvatRaw.get("result", [])):
+                            aIdx = int(list(wait4Dmg.keys())[dmgIdx])
+                            avatars[aIdx]["damage"] = await simplDamageRes(dmgData)
+
+                cacheData["avatars"] = [
+                    *avatars,
+                    *[
+                        aData
+                        for _, aData in avatarsCache.items()
+                        if aData["id"] not in refreshed
+                    ],
+                ]
+                cacheData["next"] = now + newData["ttl"]
+                await writeCache(uid, cacheData)
+                if PRERENDER_ON:
+                    schedulePrerender(
+                        uid, [a["name"] for a in avatars], cacheData["next"]
                     )
-                else:
-                    for dmgIdx, dmgData in enumerate(teyvatRaw.get("result", [])):
-                        aIdx = int(list(wait4Dmg.keys())[dmgIdx])
-                        avatars[aIdx]["damage"] = await simplDamageRes(dmgData)
-
-            cacheData["avatars"] = [
-                *avatars,
-                *[
-                    aData
-                    for _, aData in avatarsCache.items()
-                    if aData["id"] not in refreshed
-                ],
-            ]
-            cacheData["next"] = now + newData["ttl"]
-            cache.write_text(
-                json.dumps(cacheData, ensure_ascii=False, indent=2), encoding="utf-8"
-            )
-        # 有缓存 & 本次刷新失败，打印错误信息
-        else:
-            _tip = "error"
-            logger.error(newData["error"])
+            # 有缓存 & 本次刷新失败，打印错误信息
+            else:
+                _tip = "error"
+                REFRESH_TOTAL.inc(result="error")
+                logger.error(newData["error"])
 
     # 获取所需角色数据
     if char == "全部":
+        cacheData = summarize(cacheData) if summary else cacheData
         # 为本次更新的角色添加刷新标记
         for aIdx, aData in enumerate(cacheData["avatars"]):
             cacheData["avatars"][aIdx]["refreshed"] = aData["id"] in refreshed
@@ -251,18 +306,21 @@ async def getAvatarData(uid: str, char: str = "全部") -> Dict:
     )
 
 
-async def getPanel(uid: str, char: str = "全部") -> Union[bytes, str]:
+async def getPanel(
+    uid: str, char: str = "全部", background: bool = False
+) -> Union[bytes, str]:
     """
     原神游戏内角色展柜消息生成入口
 
     * ``param uid: str`` 查询用户 UID
     * ``param char: str = "全部"`` 查询角色
+    * ``param background: bool = False`` 是否为后台预渲染
     - ``return: Union[bytes, str]`` 查询结果。一般返回图片字节，出错时返回错误信息字符串
     """
-    htmlBase = str(LOCAL_DIR.resolve())
-
-    # 获取面板数据
-    data = await getAvatarData(uid, char)
+    # 获取面板数据，用户查询计入热度
+    if not background:
+        recordHit(uid)
+    data = await getAvatarData(uid, char, summary=True)
     if data.get("error"):
         return data["error"]
 
@@ -285,9 +343,14 @@ async def getPanel(uid: str, char: str = "全部") -> Union[bytes, str]:
             ],
         ]
         if mode == "panel"
-        else [download(role["icon"], local=role["name"]) for role in data["avatars"]]
+        else [
+            download(role["icon"], local=role["name"], thumb=72)
+            for role in data["avatars"]
+        ]
     )
-    await asyncio.gather(*dlTasks)
+    with span("assets", count=len(dlTasks)):
+        # 下载失败或超出命令处理期限的素材以占位图代替
+        complete = all(await asyncio.gather(*dlTasks))
     dlTasks.clear()
 
     # 如果渲染角色面板，额外根据需要精简面板数据（缓存中仍保留全部数据）
@@ -297,21 +360,48 @@ async def getPanel(uid: str, char: str = "全部") -> Union[bytes, str]:
         )
 
     # 渲染截图
-    return await template_to_pic(
-        template_path=htmlBase,
-        template_name=f"{mode}-{tplVer}.html",
-        templates={"css": tplVer, "uid": uid, "data": data},
-        pages={
-            "viewport": {"width": 600, "height": 300},
-            "base_url": f"file://{htmlBase}",
-        },
-        wait=2,
-        type="jpeg",
-        quality=100,
-        device_scale_factor=SCALE_FACTOR,
+    return await renderPic(
+        mode,
+        f"{uid}-{char}",
+        tplVer,
+        {"css": tplVer, "uid": uid, "data": data},
+        background,
+        complete,
     )
 
 
+async def prerender(uid: str, chars: List[str], deadline: int) -> None:
+    """
+    角色展柜数据刷新后的后台预渲染，依次渲染角色列表与刷新角色的面板并写入渲染缓存
+
+    预渲染在刷新冷却期间进行，此时读取到的数据（包括刷新提示）与之后的查询一致，渲染结果可以直接命中缓存
+
+    * ``param uid: str`` 查询用户 UID
+    * ``param chars: List[str]`` 本次刷新的角色
+    * ``param deadline: int`` 刷新冷却结束时间，之后的查询会重新刷新数据，不再继续预渲染
+    """
+    # 预渲染任务由查询创建，不受该查询的命令处理期限约束，也不计入该查询的处理追踪
+    clearDeadline()
+    clearTrace()
+    for char in ["全部", *chars]:
+        if time() >= deadline:
+            break
+        try:
+            await getPanel(uid, char, background=True)
+        except Exception as e:
+            logger.opt(exception=e).warning(f"UID{uid} 的 {char} 预渲染出错")
+    logger.info(f"UID{uid} 的角色列表与 {len(chars)} 位角色面板预渲染完成")
+
+
+def schedulePrerender(uid: str, chars: List[str], deadline: int) -> None:
+    """创建后台预渲染任务，该 UID 已有预渲染进行中时跳过"""
+    if uid in _prerenderTasks:
+        return
+    task = asyncio.create_task(prerender(uid, chars, deadline))
+    _prerenderTasks[uid] = task
+    task.add_done_callback(lambda _: _prerenderTasks.pop(uid, None))
+
+
 async def getTeam(
     uid: str, chars: List[str] = [], showDetail: bool = False
 ) -> Union[bytes, str]:
@@ -324,6 +414,7 @@ async def getTeam(
     - ``return: Union[bytes, str]`` 查询结果。一般返回图片字节，出错时返回错误信息字符串
     """
     # 获取面板数据
+    recordHit(uid)
     data = await getAvatarData(uid, "全部")
     if data.get("error"):
         return data["error"]
@@ -345,24 +436,27 @@ async def getTeam(
     else:
         return f"玩家 {uid} 的面板数据甚至不足以组成一支队伍呢！"
 
-    # 图片下载任务
+    # 图片下载任务，下载失败或超出命令处理期限的素材以占位图代替
+    complete = True
     for tmp in extract:
         dlTasks = [
-            download(tmp["icon"], local=tmp["name"]),
+            download(tmp["icon"], local=tmp["name"], thumb=64),
             *[
-                download(sData["icon"], local=tmp["name"])
+                download(sData["icon"], local=tmp["name"], thumb=32)
                 for _, sData in tmp["skills"].items()
             ],
-            download(tmp["weapon"]["icon"], local="weapon"),
+            download(tmp["weapon"]["icon"], local="weapon", thumb=64),
             *[
                 download(
                     f"UI_RelicIcon_{relicData['icon'].split('_')[-2]}_4",
                     local="artifacts",
+                    thumb=64,
                 )
                 for relicData in tmp["relics"]
             ],
         ]
-        await asyncio.gather(*dlTasks)
+        with span("assets", count=len(dlTasks)):
+            complete = all(await asyncio.gather(*dlTasks)) and complete
         dlTasks.clear()
 
     teyvatBody = await transToTeyvat(deepcopy(extract), uid)
@@ -380,17 +474,10 @@ async def getTeam(
         logger.opt(exception=e).error("队伍伤害数据解析出错")
         return f"[{e.__class__.__name__}] 队伍伤害数据解析出错咯"
 
-    htmlBase = str(LOCAL_DIR.resolve())
-    return await template_to_pic(
-        template_path=htmlBase,
-        template_name=f"team-{TEAM_TPL_VER}.html",
-        templates={"css": TEAM_TPL_VER, "data": data, "detail": showDetail},
-        pages={
-            "viewport": {"width": 600, "height": 300},
-            "base_url": f"file://{htmlBase}",
-        },
-        wait=2,
-        type="jpeg",
-        quality=100,
-        device_scale_factor=SCALE_FACTOR,
+    return await renderPic(
+        "team",
+        f"{uid}-{'-'.join(data['avatars'])}",
+        TEAM_TPL_VER,
+        {"css": TEAM_TPL_VER, "data": data, "detail": showDetail},
+        complete=complete,
     )
@@ -0,0 +1,470 @@
+"""
+面板缓存存储后端，默认为本地文件，多个 NoneBot 实例共享同一批用户时可改用共享卷上的 SQLite 数据库或 Redis 协议服务，redis 为可选依赖
+
+存储内容按命名空间区分：``panel`` 完整缓存记录、``list`` 角色概要、``meta`` 查询时间等元数据、``bind`` QQ 与 UID 绑定。
+刷新冷却时间保存在缓存记录中，随缓存记录共享
+
+同一 UID 的刷新由租约保证同一时间只有一个实例进行，租约到期后自动释放，持有租约的实例意外退出时不会永久阻塞其他实例
+"""
+
+import json
+import asyncio
+import sqlite3
+import threading
+from os import getpid
+from uuid import uuid4
+from pathlib import Path
+from functools import partial
+from socket import gethostname
+from time import time, monotonic
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Tuple, Callable, Optional
+
+from nonebot.log import logger
+
+from .data_codec import Codec
+from .data_deadline import remaining
+from .data_io import runIo, writeAtomic, writeBuffer
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+# 同一进程内的租约持有者以随机后缀区分
+INSTANCE = f"{gethostname()}-{getpid()}"
+# Redis 租约续期脚本，仅持有者可延长租约
+RENEW_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class Store(ABC):
+    """
+    存储后端基类，子类实现 ``get`` / ``put`` / ``delete`` / ``keys`` 与租约的获取、释放
+    """
+
+    name = "file"
+    # 是否与其他实例共享
+    shared = False
+
+    @abstractmethod
+    async def get(self, ns: str, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def put(self, ns: str, key: str, raw: bytes) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, ns: str, key: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def keys(self, ns: str) -> List[str]:
+        raise NotImplementedError
+
+    async def exists(self, ns: str, key: str) -> bool:
+        return await self.get(ns, key) is not None
+
+    async def modified(self, ns: str, key: str) -> Optional[float]:
+        """最近写入时间，无法获取时返回空"""
+        return None
+
+    async def size(self) -> int:
+        """占用空间（字节）"""
+        return 0
+
+    async def compact(self) -> int:
+        """整理存储空间，返回释放的空间（字节）"""
+        return 0
+
+    @abstractmethod
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release(self, name: str, owner: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    async def load(self, ns: str, key: str) -> Any:
+        """
+        读取并解码，写入完成前读取直接返回待写入的内容，解码在线程池中进行
+
+        * ``param ns: str`` 命名空间
+        * ``param key: str`` 键
+        - ``return: Any`` 解码结果，不存在时返回空
+        """
+        raw = writeBuffer.get((ns, key))
+        if raw is None:
+            raw = await self.get(ns, key)
+        return await runIo(Codec.decode, raw) if raw else None
+
+    async def save(self, ns: str, key: str, data: Any, encode: Callable) -> None:
+        """
+        编码后写入，编码在线程池中进行，编码完成后即返回，同一键的连续写入合并为最后一次
+
+        * ``param ns: str`` 命名空间
+        * ``param key: str`` 键
+        * ``param data: Any`` 写入内容
+        * ``param encode: Callable`` 编码方式
+        """
+        raw = await runIo(encode, data)
+        writeBuffer.put((ns, key), raw, partial(self.put, ns, key))
+
+    async def getBinding(self, qq: str) -> str:
+        raw = await self.get("bind", qq)
+        return raw.decode() if raw else ""
+
+    async def setBinding(self, qq: str, uid: str) -> None:
+        await self.put("bind", qq, uid.encode())
+
+
+class FileStore(Store):
+    """
+    本地文件存储，与此前的缓存文件布局一致，租约仅在本进程内有效
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root, self.cacheDir = root, root / "cache"
+        (self.cacheDir / "list").mkdir(parents=True, exist_ok=True)
+        self._bindLock = threading.Lock()
+        self._leases: Dict[str, Tuple[str, float]] = {}
+
+    def path(self, ns: str, key: str) -> Path:
+        if ns == "list":
+            return self.cacheDir / "list" / f"{key}.json"
+        if ns == "meta":
+            return self.cacheDir / f".{key}"
+        if ns == "bind":
+            return self.root / "qq-uid.json"
+        return self.cacheDir / f"{key}.json"
+
+    def _readBindings(self) -> Dict[str, str]:
+        f = self.path("bind", "")
+        return json.loads(f.read_bytes()) if f.exists() else {}
+
+    def _read(self, ns: str, key: str) -> Optional[bytes]:
+        if ns == "bind":
+            uid = self._readBindings().get(key)
+            return uid.encode() if uid else None
+        f = self.path(ns, key)
+        return f.read_bytes() if f.exists() else None
+
+    def _write(self, ns: str, key: str, raw: bytes) -> None:
+        if ns != "bind":
+            return writeAtomic(self.path(ns, key), raw)
+        with self._bindLock:
+            bindings = self._readBindings()
+            bindings[key] = raw.decode()
+            writeAtomic(self.path(ns, key), Codec().encode(bindings))
+
+    async def get(self, ns: str, key: str) -> Optional[bytes]:
+        return await runIo(self._read, ns, key)
+
+    async def put(self, ns: str, key: str, raw: bytes) -> None:
+        await runIo(self._write, ns, key, raw)
+
+    async def delete(self, ns: str, key: str) -> None:
+        await runIo(lambda: self.path(ns, key).unlink(missing_ok=True))
+
+    async def keys(self, ns: str) -> List[str]:
+        if ns == "bind":
+            return list(await runIo(self._readBindings))
+        folder = self.cacheDir / "list" if ns == "list" else self.cacheDir
+        pattern = ".*" if ns == "meta" else "*.json"
+        return sorted(
+            f.stem.lstrip(".")
+            for f in await runIo(lambda: list(folder.glob(pattern)))
+            # 旧版缓存等待迁移
+            if not f.name.endswith("__data.json")
+        )
+
+    async def exists(self, ns: str, key: str) -> bool:
+        if ns == "bind":
+            return await self.get(ns, key) is not None
+        return await runIo(self.path(ns, key).exists)
+
+    async def modified(self, ns: str, key: str) -> Optional[float]:
+        f = self.path(ns, key)
+        return await runIo(lambda: f.stat().st_mtime if f.exists() else None)
+
+    async def size(self) -> int:
+        def _size() -> int:
+            files = [*self.cacheDir.glob("*"), *(self.cacheDir / "list").glob("*")]
+            return sum(f.stat().st_size for f in files if f.is_file())
+
+        return await runIo(_size)
+
+    async def compact(self) -> int:
+        def _clean() -> int:
+            reclaimed, now = 0, time()
+            for f in [*self.cacheDir.glob("*.tmp"), *self.root.glob("*.tmp")]:
+                # 仍在写入的临时文件不会停留超过一小时
+                if now - f.stat().st_mtime > 3600:
+                    reclaimed += f.stat().st_size
+                    f.unlink(missing_ok=True)
+            return reclaimed
+
+        return await runIo(_clean)
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        holder, expires = self._leases.get(name, ("", 0.0))
+        if holder and holder != owner and expires > monotonic():
+            return False
+        self._leases[name] = (owner, monotonic() + ttl)
+        return True
+
+    async def release(self, name: str, owner: str) -> None:
+        if self._leases.get(name, ("", 0.0))[0] == owner:
+            del self._leases[name]
+
+
+class SqliteStore(Store):
+    """
+    SQLite 数据库存储，数据库文件放在各实例均可访问的共享卷上，租约到期时间以各实例本地时间计算
+    """
+
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 共享卷上的数据库不使用 WAL 模式，其他实例等待写锁最多 10 秒
+        self._conn = sqlite3.connect(
+            str(path), timeout=10, check_same_thread=False, isolation_level=None
+        )
+        self._lock = threading.Lock()
+        self._run(
+            "CREATE TABLE IF NOT EXISTS kv (ns TEXT, key TEXT, value BLOB, "
+            "updated REAL, PRIMARY KEY (ns, key))"
+        )
+        self._run(
+            "CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, owner TEXT, "
+            "expires REAL)"
+        )
+
+    def _run(self, sql: str, *args: Any) -> List[Tuple]:
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def _acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO lease VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE "
+                    "SET owner = excluded.owner, expires = excluded.expires "
+                    "WHERE lease.expires < ? OR lease.owner = excluded.owner",
+                    (name, owner, now + ttl, now),
+                )
+                holder = self._conn.execute(
+                    "SELECT owner FROM lease WHERE name = ?", (name,)
+                ).fetchone()
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+        return bool(holder) and holder[0] == owner
+
+    async def get(self, ns: str, key: str) -> Optional[bytes]:
+        rows = await runIo(
+            self._run, "SELECT value FROM kv WHERE ns = ? AND key = ?", ns, key
+        )
+        return bytes(rows[0][0]) if rows else None
+
+    async def put(self, ns: str, key: str, raw: bytes) -> None:
+        await runIo(
+            self._run, "REPLACE INTO kv VALUES (?, ?, ?, ?)", ns, key, raw, time()
+        )
+
+    async def delete(self, ns: str, key: str) -> None:
+        await runIo(self._run, "DELETE FROM kv WHERE ns = ? AND key = ?", ns, key)
+
+    async def keys(self, ns: str) -> List[str]:
+        rows = await runIo(
+            self._run, "SELECT key FROM kv WHERE ns = ? ORDER BY key", ns
+        )
+        return [r[0] for r in rows]
+
+    async def modified(self, ns: str, key: str) -> Optional[float]:
+        rows = await runIo(
+            self._run, "SELECT updated FROM kv WHERE ns = ? AND key = ?", ns, key
+        )
+        return rows[0][0] if rows else None
+
+    async def size(self) -> int:
+        return await runIo(lambda: self.path.stat().st_size)
+
+    async def compact(self) -> int:
+        before = await self.size()
+        await runIo(self._run, "VACUUM")
+        return max(before - await self.size(), 0)
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        return await runIo(self._acquire, name, owner, ttl)
+
+    async def release(self, name: str, owner: str) -> None:
+        await runIo(
+            self._run, "DELETE FROM lease WHERE name = ? AND owner = ?", name, owner
+        )
+
+    async def close(self) -> None:
+        await runIo(self._conn.close)
+
+
+class RedisStore(Store):
+    """
+    Redis 协议服务存储，键名为 ``gspanel:{命名空间}:{键}``，租约到期时间由服务端计算
+    """
+
+    name = "redis"
+    shared = True
+    prefix = "gspanel"
+
+    def __init__(self, url: str, client: Any = None) -> None:
+        assert client is not None or aioredis is not None, "Redis 存储需要安装 redis"
+        self.client = client or aioredis.from_url(url)
+
+    def _key(self, ns: str, key: str) -> str:
+        return f"{self.prefix}:{ns}:{key}"
+
+    async def get(self, ns: str, key: str) -> Optional[bytes]:
+        return await self.client.get(self._key(ns, key))
+
+    async def put(self, ns: str, key: str, raw: bytes) -> None:
+        await self.client.set(self._key(ns, key), raw)
+
+    async def delete(self, ns: str, key: str) -> None:
+        await self.client.delete(self._key(ns, key))
+
+    async def exists(self, ns: str, key: str) -> bool:
+        return bool(await self.client.exists(self._key(ns, key)))
+
+    async def keys(self, ns: str) -> List[str]:
+        start = len(self._key(ns, ""))
+        keys = [
+            (k.decode() if isinstance(k, bytes) else k)[start:]
+            async for k in self.client.scan_iter(match=self._key(ns, "*"), count=500)
+        ]
+        return sorted(keys)
+
+    async def size(self) -> int:
+        total = 0
+        for ns in ["panel", "list"]:
+            keys = [self._key(ns, k) for k in await self.keys(ns)]
+            if keys:
+                pipe = self.client.pipeline(transaction=False)
+                for k in keys:
+                    pipe.strlen(k)
+                total += sum(await pipe.execute())
+        return total
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        key = self._key("lease", name)
+        if await self.client.set(key, owner, nx=True, px=int(ttl * 1000)):
+            return True
+        # 已持有租约时延长租约，比较持有者与延长在服务端一次完成
+        return bool(
+            await self.client.eval(RENEW_SCRIPT, 1, key, owner, int(ttl * 1000))
+        )
+
+    async def release(self, name: str, owner: str) -> None:
+        key = self._key("lease", name)
+        async with self.client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                holder = await pipe.get(key)
+                if holder is None or holder.decode() != owner:
+                    return
+                pipe.multi()
+                pipe.delete(key)
+                await pipe.execute()
+            except aioredis.WatchError:
+                # 租约已到期并被其他实例获取
+                pass
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def openStore(spec: str, root: Path) -> Store:
+    """
+    根据 ``gspanel_cache_store`` 配置打开存储后端
+
+    * ``param spec: str`` 存储配置，留空或 ``file`` 为本地文件，
+      ``sqlite:///路径`` 为 SQLite 数据库，``redis://`` 开头为 Redis 协议服务
+    * ``param root: Path`` 插件数据目录，SQLite 数据库使用相对路径时以此为基准
+    - ``return: Store`` 存储后端，配置有误或缺少依赖时使用本地文件
+    """
+    try:
+        if spec.startswith("sqlite:///"):
+            # 与 SQLAlchemy 一致，sqlite:////data/gspanel.db 为绝对路径
+            path = Path(spec[len("sqlite:///") :])
+            return SqliteStore(path if path.is_absolute() else root / path)
+        if spec.startswith(("redis://", "rediss://", "unix://")):
+            return RedisStore(spec)
+        if spec not in ["", "file"]:
+            raise ValueError(f"不支持的缓存存储 {spec}")
+    except Exception as e:
+        logger.warning(f"缓存存储 {spec} 无法使用：{e}，已改为本地文件")
+    return FileStore(root)
+
+
+class Lease:
+    """
+    UID 刷新租约，同一时间只有一个持有者，等待期间每隔 0.5 秒重试
+
+    * ``param store: Store`` 存储后端
+    * ``param name: str`` 租约名称
+    * ``param ttl: float`` 租约有效时间（秒）
+    """
+
+    def __init__(self, store: Store, name: str, ttl: float) -> None:
+        self.store, self.name, self.ttl = store, name, ttl
+        self.owner = f"{INSTANCE}-{uuid4().hex[:6]}"
+        self.held = False
+
+    async def acquire(self, wait: bool = True) -> bool:
+        """
+        获取租约，超过租约有效时间或命令处理期限仍未获取到时放弃等待
+
+        * ``param wait: bool = True`` 租约被占用时是否等待
+        - ``return: bool`` 是否获取到租约
+        """
+        # 命令处理期限先到时提前放弃等待
+        deadline = monotonic() + remaining(self.ttl)
+        while True:
+            try:
+                self.held = await self.store.acquire(self.name, self.owner, self.ttl)
+            except Exception as e:
+                logger.warning(f"租约 {self.name} 获取出错：{e}")
+                return False
+            if self.held or not wait or monotonic() > deadline:
+                return self.held
+            await asyncio.sleep(0.5)
+
+    async def renew(self) -> bool:
+        """
+        延长已持有的租约，长时间持有租约时定期调用
+
+        - ``return: bool`` 是否仍持有租约，租约已到期并被其他持有者获取时返回 False
+        """
+        return self.held and await self.acquire(wait=False)
+
+    async def release(self) -> None:
+        if not self.held:
+            return
+        self.held = False
+        try:
+            await self.store.release(self.name, self.owner)
+        except Exception as e:
+            logger.warning(f"租约 {self.name} 释放出错：{e}")
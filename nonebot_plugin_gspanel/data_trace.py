@@ -0,0 +1,137 @@
+"""
+命令处理过程追踪，记录解析输入、查找绑定、读取缓存、请求接口、数据转换、伤害计算、素材下载与图片渲染等阶段的耗时，总耗时超过阈值时输出慢命令记录
+
+追踪上下文保存在 ``contextvars`` 中，命令处理过程中创建的任务同样记录到该命令的追踪中；预渲染等后台任务开始时需要清除追踪上下文
+"""
+
+import json
+from uuid import uuid4
+from time import monotonic
+from contextvars import ContextVar
+from contextlib import contextmanager
+from typing import Any, Dict, List, Iterator, Optional
+
+from nonebot.log import logger
+from nonebot.exception import MatcherException
+
+
+class Trace:
+    """
+    单条命令的追踪记录
+
+    * ``param command: str`` 命令类型，如 ``panel`` ``team``
+    * ``param attrs: Any`` 命令附加信息，如 QQ、UID
+    """
+
+    def __init__(self, command: str, **attrs: Any) -> None:
+        self.id = uuid4().hex[:8]
+        self.command, self.attrs = command, attrs
+        self.start = monotonic()
+        self.spans: List[Dict[str, Any]] = []
+
+    def elapsed(self) -> float:
+        return monotonic() - self.start
+
+    def ordered(self) -> List[Dict[str, Any]]:
+        """按开始时间排列的各阶段，同时开始时外层阶段在前"""
+        return sorted(self.spans, key=lambda s: (s["start"], -s["duration"]))
+
+    def breakdown(self) -> str:
+        """按阶段汇总的耗时，同一阶段多次出现时合计耗时并标注次数"""
+        total: Dict[str, List[float]] = {}
+        for s in self.ordered():
+            acc = total.setdefault(s["name"], [0.0, 0])
+            acc[0] += s["duration"]
+            acc[1] += 1
+        return " / ".join(
+            f"{name} {d:.3f}s" + (f"×{int(c)}" if c > 1 else "")
+            for name, (d, c) in total.items()
+        )
+
+    def record(self, error: str = "") -> Dict[str, Any]:
+        """结构化的追踪记录"""
+        return {
+            "trace": self.id,
+            "command": self.command,
+            **self.attrs,
+            "total": round(self.elapsed(), 3),
+            **({"error": error} if error else {}),
+            "spans": self.ordered(),
+        }
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("gspanel_trace", default=None)
+
+
+def currentTrace() -> Optional[Trace]:
+    """当前追踪记录，不在命令处理过程中时返回空"""
+    return _trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    记录一个阶段的耗时，不在命令处理过程中时不记录
+
+    * ``param name: str`` 阶段名称
+    * ``param attrs: Any`` 阶段附加信息，代码块中可修改返回的字典补充
+    - ``return: Iterator[Dict[str, Any]]`` 阶段附加信息
+    """
+    tr, start = _trace.get(), monotonic()
+    try:
+        yield attrs
+    finally:
+        if tr is not None:
+            tr.spans.append(
+                {
+                    "name": name,
+                    "start": round(start - tr.start, 3),
+                    "duration": round(monotonic() - start, 3),
+                    **attrs,
+                }
+            )
+
+
+@contextmanager
+def traceIn(tr: Optional[Trace]) -> Iterator[None]:
+    """在指定追踪记录下执行，用于将提交者的追踪带入渲染队列等长期运行的任务"""
+    token = _trace.set(tr)
+    try:
+        yield
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def trace(command: str, slow: float, **attrs: Any) -> Iterator[Trace]:
+    """
+    追踪一条命令的处理过程，总耗时不低于 ``slow`` 秒时输出慢命令记录
+
+    * ``param command: str`` 命令类型
+    * ``param slow: float`` 慢命令阈值（秒），不大于 0 时不输出
+    * ``param attrs: Any`` 命令附加信息，代码块中可通过返回的 ``Trace.attrs`` 补充
+    - ``return: Iterator[Trace]`` 本条命令的追踪记录
+    """
+    tr, error = Trace(command, **attrs), ""
+    token = _trace.set(tr)
+    try:
+        yield tr
+    except MatcherException:
+        # finish() 等结束命令处理的流程控制异常，不视为出错
+        raise
+    except Exception as e:
+        error = e.__class__.__name__
+        raise
+    finally:
+        _trace.reset(token)
+        if slow > 0 and tr.elapsed() >= slow:
+            logger.warning(
+                f"{command} 命令处理耗时 {tr.elapsed():.2f} 秒 [{tr.id}]："
+                f"{tr.breakdown() or '无阶段记录'}\n"
+                + json.dumps(tr.record(error), ensure_ascii=False)
+            )
+
+
+def clearTrace() -> None:
+    """清除当前任务的追踪上下文，仅影响当前任务及其之后创建的任务"""
+    _trace.set(None)
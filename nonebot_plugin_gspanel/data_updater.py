@@ -2,90 +2,192 @@
 迁移缓存的面板数据，将在未来某个版本删除
 """
 
-import json
 import asyncio
+from pathlib import Path
 from copy import deepcopy
+from time import monotonic
+from typing import Dict, List, Optional
 
 from nonebot.log import logger
 
-from .__utils__ import LOCAL_DIR
+from .data_io import runIo
+from .data_codec import Codec
+from .data_store import Lease
 from .data_source import queryDamageApi
 from .data_convert import transFromEnka, transToTeyvat, simplDamageRes
+from .__utils__ import STORE, LEASE_TTL, MIGRATE_WORKERS, MIGRATE_INTERVAL
+from .data_cache import (
+    CACHE_SCHEMA,
+    flushUid,
+    schemaOf,
+    markSchema,
+    writeCache,
+    pendingCache,
+    schemaMarked,
+    listCacheFiles,
+)
 
+_migrateTask: Optional[asyncio.Task] = None
 
-async def updateCache() -> None:
-    for f in (LOCAL_DIR / "cache").iterdir():
-        cache = json.loads(f.read_text(encoding="UTF-8"))
-        if f.name.replace(".json", "").isdigit():
-            # 已经迁移的文件中部分数据格式升级
-            uid, wait4Dmg = f.name.replace(".json", ""), {}
-            for aIdx, a in enumerate(cache["avatars"]):
-                cache["avatars"][aIdx]["level"] = int(a["level"])
-                if not a["damage"]:
-                    wait4Dmg[str(aIdx)] = a
-                else:
-                    # 暴击伤害移动至期望伤害
-                    for dIdx, d in enumerate(a["damage"].get("data", [])):
-                        if str(d[1]).isdigit() and d[2] == "-":
-                            cache["avatars"][aIdx]["damage"]["data"][dIdx] = [
-                                d[0],
-                                d[2],
-                                d[1],
-                            ]
-            if wait4Dmg:
-                # 补充角色伤害数据
-                logger.info(
-                    "正在为 UID{} 的 {} 重新请求伤害计算接口".format(
-                        uid, "/".join(a["name"] for _, a in wait4Dmg.items())
-                    )
-                )
-                teyvatBody = await transToTeyvat(
-                    deepcopy([a for _, a in wait4Dmg.items()]), uid
-                )
-                teyvatRaw = await queryDamageApi(teyvatBody)
-                if teyvatRaw.get("code", "x") != 200 or len(wait4Dmg) != len(
-                    teyvatRaw.get("result", [])
-                ):
-                    logger.error(
-                        f"UID{uid} 的 {len(wait4Dmg)} 位角色伤害计算请求失败！"
-                        f"\n>>>> [提瓦特返回] {teyvatRaw}"
-                    )
-                for dmgIdx, dmgData in enumerate(teyvatRaw.get("result", [])):
-                    aRealIdx = int(list(wait4Dmg.keys())[dmgIdx])
-                    cache["avatars"][aRealIdx]["damage"] = await simplDamageRes(dmgData)
-            f.write_text(
-                json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8"
-            )
-            continue
-        # 旧版缓存文件，内容为 Enka.Network 返回
-        uid = f.name.replace("__data.json", "")
-        now, newData = cache["time"], []
-        avatarInfoList = cache.get("avatarInfoList", [])
-        if not avatarInfoList:
-            logger.error(f"UID{uid} 没有角色数据，清除旧版缓存")
-            f.unlink(missing_ok=True)
-            continue
-        for avatarData in avatarInfoList:
-            if avatarData["avatarId"] in [10000005, 10000007]:
-                logger.info(f"UID{uid} 面板中含有旅行者，跳过暂未支持的角色！")
-                continue
-            newData.append(await transFromEnka(avatarData, now))
-        # 补充角色伤害数据
-        teyvatBody = await transToTeyvat(deepcopy(newData), uid)
-        teyvatRaw = await queryDamageApi(teyvatBody)
-        if teyvatRaw.get("code", "x") != 200 or len(newData) != len(
-            teyvatRaw.get("result", [])
-        ):
-            logger.error(
-                f"UID{uid} 的 {len(newData)} 位角色伤害计算请求失败！\n>>>> [提瓦特返回] {teyvatRaw}"
-            )
-        else:
-            for tvtIdx, tvtDmg in enumerate(teyvatRaw["result"]):
-                newData[tvtIdx]["damage"] = await simplDamageRes(tvtDmg)
-        newCache = {"avatars": newData, "next": now + 120}
-        (LOCAL_DIR / "cache" / f"{uid}.json").write_text(
-            json.dumps(newCache, ensure_ascii=False, indent=2), encoding="utf-8"
+
+class RateLimiter:
+    """请求限速，相邻两次请求至少间隔 ``interval`` 秒"""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            delay = self._next - monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next = monotonic() + self.interval
+
+
+async def fillDamage(uid: str, avatars: List[Dict], limiter: RateLimiter) -> None:
+    """为缺少伤害计算数据的角色补充请求伤害计算接口"""
+    wait4Dmg = {str(aIdx): a for aIdx, a in enumerate(avatars) if not a["damage"]}
+    if not wait4Dmg:
+        return
+    logger.info(
+        "正在为 UID{} 的 {} 重新请求伤害计算接口".format(
+            uid, "/".join(a["name"] for _, a in wait4Dmg.items())
         )
+    )
+    teyvatBody = await transToTeyvat(deepcopy([a for _, a in wait4Dmg.items()]), uid)
+    await limiter.wait()
+    teyvatRaw = await queryDamageApi(teyvatBody)
+    if teyvatRaw.get("code", "x") != 200 or len(wait4Dmg) != len(
+        teyvatRaw.get("result", [])
+    ):
+        logger.error(
+            f"UID{uid} 的 {len(wait4Dmg)} 位角色伤害计算请求失败！" f"\n>>>> [提瓦特返回] {teyvatRaw}"
+        )
+        return
+    for dmgIdx, dmgData in enumerate(teyvatRaw["result"]):
+        aRealIdx = int(list(wait4Dmg.keys())[dmgIdx])
+        avatars[aRealIdx]["damage"] = await simplDamageRes(dmgData)
+
+
+async def upgradeV0(uid: str, cache: Dict) -> Optional[Dict]:
+    """旧版缓存（Enka.Network 返回）转换为插件内部格式，伤害计算数据在下一步补充"""
+    now, newData = cache["time"], []
+    for avatarData in cache.get("avatarInfoList", []):
+        if avatarData["avatarId"] in [10000005, 10000007]:
+            logger.info(f"UID{uid} 面板中含有旅行者，跳过暂未支持的角色！")
+            continue
+        newData.append(await transFromEnka(avatarData, now))
+    return {"avatars": newData, "next": now + 120} if newData else None
+
+
+async def upgradeV1(uid: str, cache: Dict, limiter: RateLimiter) -> Dict:
+    """插件内部格式中部分数据格式升级，并补充缺少的伤害计算数据。版本 2 以上的记录重新写入即可生成角色概要"""
+    for a in cache["avatars"]:
+        a["level"] = int(a["level"])
+        # 暴击伤害移动至期望伤害
+        for dIdx, d in enumerate(a["damage"].get("data", []) if a["damage"] else []):
+            if str(d[1]).isdigit() and d[2] == "-":
+                a["damage"]["data"][dIdx] = [d[0], d[2], d[1]]
+    await fillDamage(uid, cache["avatars"], limiter)
+    return cache
+
+
+async def migrateFile(f: Path, limiter: RateLimiter) -> str:
+    """
+    单个本地缓存文件迁移至当前格式版本，共享存储模式下迁移后导入共享存储，共享存储中已有的 UID 跳过
+
+    * ``param f: Path`` 缓存文件
+    * ``param limiter: RateLimiter`` 伤害计算接口请求限速
+    - ``return: str`` 处理结果，``skip`` 无需迁移，``migrated`` 已迁移，``dropped`` 无有效数据已删除
+    """
+    legacy = f.name.endswith("__data.json")
+    uid = f.name.replace("__data.json", "").replace(".json", "")
+    if (legacy or STORE.shared) and await STORE.exists("panel", uid):
+        if not legacy:
+            return "skip"
+        logger.info(f"UID{uid} 已有新版缓存，清除旧版缓存")
+        f.unlink(missing_ok=True)
+        return "dropped"
+    mtime = f.stat().st_mtime_ns
+    raw = await runIo(lambda: Codec.decode(f.read_bytes()))
+    if not legacy and not STORE.shared and schemaOf(raw) >= CACHE_SCHEMA:
+        return "skip"
+    cache = await upgradeV0(uid, raw) if legacy else raw
+    if cache is None:
+        logger.error(f"UID{uid} 没有角色数据，清除旧版缓存")
+        f.unlink(missing_ok=True)
+        return "dropped"
+    if schemaOf(cache) < 2:
+        cache = await upgradeV1(uid, cache, limiter)
+    # 持有刷新租约后再检查并写入，迁移的旧数据不会覆盖同时进行的刷新
+    lease = Lease(STORE, f"refresh:{uid}", LEASE_TTL)
+    if not await lease.acquire():
+        logger.warning(f"UID{uid} 的刷新租约等待超时，将在下次启动时重新迁移")
+        return "failed"
+    try:
+        if not legacy and (f.stat().st_mtime_ns != mtime or pendingCache(uid)):
+            # 迁移期间面板数据已刷新，新写入的记录已是当前版本
+            return "skip"
+        if STORE.shared and await STORE.exists("panel", uid):
+            return "skip"
+        await writeCache(uid, cache)
+        await flushUid(uid)
+    finally:
+        await lease.release()
+    if legacy:
         f.unlink(missing_ok=True)
         logger.info(f"UID{uid} 的角色面板缓存已迁移完毕！")
-        await asyncio.sleep(2)
+    return "migrated"
+
+
+async def migrateCache() -> None:
+    """
+    面板缓存迁移，已是当前格式版本的记录直接跳过，旧版记录以有限并发迁移并限制伤害计算接口请求频率
+
+    全部记录迁移完成后写入版本标记，之后启动时不再扫描缓存
+    """
+    if schemaMarked():
+        return
+    files = listCacheFiles()
+    total, done, start = len(files), 0, monotonic()
+    result: Dict[str, int] = {"skip": 0, "migrated": 0, "dropped": 0, "failed": 0}
+    limiter = RateLimiter(MIGRATE_INTERVAL)
+    sem = asyncio.Semaphore(max(MIGRATE_WORKERS, 1))
+
+    async def _migrate(f: Path) -> str:
+        async with sem:
+            try:
+                return await migrateFile(f, limiter)
+            except Exception as e:
+                logger.opt(exception=e).error(f"面板缓存 {f.name} 迁移出错")
+                return "failed"
+
+    for task in asyncio.as_completed([_migrate(f) for f in files]):
+        status = await task
+        result[status] += 1
+        done += 1
+        if status != "skip" and (done % max(total // 10, 1) == 0 or done == total):
+            logger.info(f"面板缓存迁移进度 {done}/{total}")
+    if result["failed"]:
+        logger.warning(f"{result['failed']} 个面板缓存迁移失败，将在下次启动时重试")
+    else:
+        markSchema()
+    if result["migrated"] or result["dropped"] or result["failed"]:
+        logger.info(
+            "面板缓存迁移完成，耗时 {:.1f} 秒：迁移 {} 个，清除 {} 个，失败 {} 个，无需迁移 {} 个".format(
+                monotonic() - start,
+                result["migrated"],
+                result["dropped"],
+                result["failed"],
+                result["skip"],
+            )
+        )
+
+
+async def updateCache() -> None:
+    """启动面板缓存迁移后台任务，每个进程只执行一次"""
+    global _migrateTask
+    if _migrateTask is None:
+        _migrateTask = asyncio.create_task(migrateCache())
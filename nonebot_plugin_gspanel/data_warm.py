@@ -0,0 +1,139 @@
+"""
+热门 UID 后台刷新，在低峰时段为查询热度最高的 UID 在刷新冷却结束后主动刷新角色展柜数据，之后的查询直接命中缓存
+
+后台刷新与用户查询共用同一 UID 的刷新租约，共享存储模式下同一时间只有一个实例进行后台刷新
+"""
+
+import asyncio
+from time import time
+from typing import Dict, List, Tuple, Optional
+from datetime import datetime, timezone, timedelta
+
+from nonebot.log import logger
+
+from .data_codec import Codec
+from .data_store import Lease
+from .data_cache import saveHits
+from .data_source import getAvatarData
+from .__utils__ import STORE, WARM_UIDS, WARM_HOURS, WARM_BUDGET
+
+# 检查刷新冷却的间隔（秒）
+WARM_TICK = 60
+_warmTask: Optional[asyncio.Task] = None
+
+
+def parseHours(spec: str) -> List[Tuple[int, int]]:
+    """
+    解析低峰时段配置，如 ``2-8`` ``0-6,13-15``，结束时间早于开始时间时跨越零点，如 ``23-6``
+
+    * ``param spec: str`` 低峰时段配置（北京时间，小时）
+    - ``return: List[Tuple[int, int]]`` 各时段的开始、结束小时
+    """
+    hours = []
+    for part in filter(None, spec.replace(" ", "").split(",")):
+        try:
+            start, end = (int(h) for h in part.split("-"))
+            assert 0 <= start < 24 and 0 <= end <= 24
+        except (ValueError, AssertionError):
+            logger.warning(f"后台刷新时段 {part} 格式错误，已忽略")
+            continue
+        hours.append((start, end))
+    return hours
+
+
+def offPeak(hours: List[Tuple[int, int]], now: Optional[datetime] = None) -> bool:
+    """当前是否处于低峰时段"""
+    hour = (now or datetime.now(timezone(timedelta(hours=8)))).hour
+    return any(
+        (start <= hour < end) if start <= end else (hour >= start or hour < end)
+        for start, end in hours
+    )
+
+
+class Budget:
+    """
+    上游接口请求预算，任意一小时内全部实例合计最多刷新 ``perHour`` 次
+
+    刷新时间记录保存在存储后端中，仅在持有后台刷新租约时读写，共享存储模式下各实例共用同一份预算
+
+    * ``param perHour: int`` 每小时刷新次数上限
+    """
+
+    def __init__(self, perHour: int) -> None:
+        self.perHour = perHour
+
+    async def take(self) -> bool:
+        now = time()
+        used = [t for t in await STORE.load("meta", "warm") or [] if now - t < 3600]
+        if len(used) >= self.perHour:
+            return False
+        await STORE.put("meta", "warm", Codec().encode([*used, now]))
+        return True
+
+
+async def dueUids(hits: Dict[str, float], limit: int) -> List[str]:
+    """
+    查询热度最高的 ``limit`` 个 UID 中刷新冷却已结束的 UID，按热度从高到低排列
+
+    * ``param hits: Dict[str, float]`` 各 UID 的查询热度
+    * ``param limit: int`` 保持刷新的 UID 数量
+    - ``return: List[str]`` 需要刷新的 UID
+    """
+    hot = sorted(hits, key=lambda u: hits[u], reverse=True)[:limit]
+    due, now = [], int(time())
+    for uid in hot:
+        # 直接读取角色概要，后台刷新不计入查询时间
+        summary = await STORE.load("list", uid)
+        if summary and now > summary.get("next", 0):
+            due.append(uid)
+    return due
+
+
+async def warmCycle(budget: Budget) -> int:
+    """
+    一轮后台刷新，先保存本实例的查询热度，预算用尽时留到下一轮。每刷新一个 UID 前延长后台刷新租约，租约失效时停止本轮刷新
+
+    * ``param budget: Budget`` 上游接口请求预算
+    - ``return: int`` 本轮刷新的 UID 数量
+    """
+    hits = await saveHits()
+    lease = Lease(STORE, "warm", WARM_TICK * 10)
+    if not await lease.acquire(wait=False):
+        return 0
+    refreshed = 0
+    try:
+        for uid in await dueUids(hits, WARM_UIDS):
+            if not await lease.renew():
+                logger.warning("后台刷新租约已失效，剩余 UID 留到下一轮")
+                break
+            if not await budget.take():
+                logger.debug("后台刷新预算已用尽，剩余 UID 留到下一轮")
+                break
+            data = await getAvatarData(uid, "全部", summary=True, background=True)
+            if data.get("error"):
+                logger.warning(f"UID{uid} 后台刷新失败：{data['error']}")
+            refreshed += 1
+    finally:
+        await lease.release()
+    if refreshed:
+        logger.info(f"后台刷新了 {refreshed} 个热门 UID 的角色展柜数据")
+    return refreshed
+
+
+async def warmLoop() -> None:
+    hours, budget = parseHours(WARM_HOURS), Budget(WARM_BUDGET)
+    while True:
+        await asyncio.sleep(WARM_TICK)
+        if not offPeak(hours):
+            continue
+        try:
+            await warmCycle(budget)
+        except Exception as e:
+            logger.opt(exception=e).error("热门 UID 后台刷新出错")
+
+
+async def startWarm() -> None:
+    """启动热门 UID 后台刷新任务，``gspanel_warm_uids`` 为 0 时不启动"""
+    global _warmTask
+    if WARM_UIDS > 0 and WARM_BUDGET > 0 and _warmTask is None:
+        _warmTask = asyncio.create_task(warmLoop())
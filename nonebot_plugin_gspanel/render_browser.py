@@ -0,0 +1,233 @@
+"""
+渲染页面管理，仅依赖 Playwright，供插件进程与独立渲染进程（``render_worker.py``）共同使用
+"""
+
+import base64
+import asyncio
+from pathlib import Path
+from time import monotonic
+from mimetypes import guess_type
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from urllib.parse import unquote, urlparse
+from typing import Dict, List, Tuple, Callable, Optional, Awaitable, AsyncIterator
+
+from playwright.async_api import Page, Route, Browser
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+# 模板中的相对路径素材均由此虚拟地址请求，经拦截后从内存缓存或本地文件返回
+ASSET_ORIGIN = "http://gspanel.local"
+ASSET_TYPES = {
+    ".ttf": "font/ttf",
+    ".woff2": "font/woff2",
+    ".webp": "image/webp",
+    ".js": "text/javascript",
+}
+MOUNT_START, MOUNT_END = "<!-- gspanel:mount -->", "<!-- /gspanel:mount -->"
+# 缺失的图片素材（如超出命令处理期限未下载）以 1x1 透明图片代替，不显示破损图标
+PLACEHOLDER = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAA"
+    "SUVORK5CYII="
+)
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp")
+# 各模板共用的就绪通知与内容替换脚本，页面载入模板后注入
+READY_SCRIPT = """
+// 字体加载、图片解码完毕后通知截图
+let readyToken = 0;
+function gspanelWait() {
+    const token = ++readyToken;
+    window.gspanelReady = false;
+    const waitImgs = Array.from(document.images).map((img) => img.decode());
+    const waitBgs = Array.from(document.querySelectorAll("body *"))
+        .map((el) => getComputedStyle(el).backgroundImage)
+        .filter((bg) => bg.startsWith("url("))
+        .map((bg) => {
+            const img = new Image();
+            img.src = bg.slice(5, -2);
+            return img.decode();
+        });
+    Promise.allSettled([document.fonts.ready, ...waitImgs, ...waitBgs]).then(() => {
+        if (token === readyToken) window.gspanelReady = true;
+    });
+}
+// 渲染页面复用时通过此入口替换为新的模板内容，样式、字体、脚本无需重新加载
+function gspanelMount(html) {
+    document.body.firstElementChild.outerHTML = html;
+    gspanelWait();
+}
+gspanelWait();
+"""
+
+
+def timeoutMs(timeout: float) -> float:
+    """Playwright 超时时间（毫秒），0 在 Playwright 中表示不限时，已无剩余时间时改为 1 毫秒"""
+    return max(timeout, 0.001) * 1000
+
+
+class AssetCache:
+    """
+    模板静态素材内存缓存，总大小超出 ``maxBytes`` 时淘汰最久未使用的素材
+    """
+
+    def __init__(self, root: Path, maxBytes: int) -> None:
+        self.root, self.maxBytes = root.resolve(), maxBytes
+        self._cache: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+        self._bytes = 0
+
+    def _load(self, path: str) -> Optional[Tuple[bytes, str]]:
+        f = (self.root / path).resolve()
+        if self.root not in f.parents or not f.is_file():
+            return None
+        return (
+            f.read_bytes(),
+            ASSET_TYPES.get(f.suffix)
+            or guess_type(f.name)[0]
+            or "application/octet-stream",
+        )
+
+    async def read(self, path: str) -> Optional[Tuple[bytes, str]]:
+        """
+        模板静态素材读取，优先从内存缓存返回，未缓存的素材在线程池中读取，不阻塞事件循环
+
+        * ``param path: str`` 素材相对插件资源目录的路径，如 ``font/HYWH-65W.ttf``
+        - ``return: Optional[Tuple[bytes, str]]`` 素材内容与 MIME 类型，文件不存在时返回空
+        """
+        if path in self._cache:
+            self._cache.move_to_end(path)
+            return self._cache[path]
+        loop = asyncio.get_running_loop()
+        asset = await loop.run_in_executor(None, self._load, path)
+        # 读取期间同一素材可能已由其他请求写入缓存
+        if asset is None or path in self._cache:
+            return asset
+        if len(asset[0]) <= self.maxBytes:
+            self._cache[path] = asset
+            self._bytes += len(asset[0])
+            while self._bytes > self.maxBytes:
+                _, (evicted, _) = self._cache.popitem(last=False)
+                self._bytes -= len(evicted)
+        return asset
+
+    async def serve(self, route: Route) -> None:
+        """渲染页面素材请求拦截，允许浏览器长期缓存以便常驻页面跨渲染复用"""
+        path = unquote(urlparse(route.request.url).path).lstrip("/")
+        if not path:
+            await route.fulfill(status=200, content_type="text/html", body="")
+            return
+        asset = await self.read(path)
+        if asset is None and path.lower().endswith(IMAGE_SUFFIXES):
+            # 不写入缓存，素材下载完成后即可正常显示
+            await route.fulfill(status=200, body=PLACEHOLDER, content_type="image/png")
+            return
+        if asset is None:
+            await route.fulfill(status=404)
+            return
+        await route.fulfill(
+            status=200,
+            body=asset[0],
+            headers={
+                "Content-Type": asset[1],
+                "Cache-Control": "public, max-age=31536000, immutable",
+            },
+        )
+
+
+class PagePool:
+    """
+    常驻渲染页面池，按模板文件划分，每个模板最多保持 ``size`` 个页面
+
+    页面首次创建时完整加载模板，之后复用时仅通过注入的 ``gspanelMount()`` 替换内容，
+    样式、字体与脚本无需重新加载。页面累计渲染 ``recycle`` 次后关闭以控制浏览器内存占用
+    """
+
+    def __init__(
+        self,
+        getBrowser: Callable[[], Awaitable[Browser]],
+        assets: AssetCache,
+        scale: float,
+        size: int,
+        recycle: int,
+    ) -> None:
+        self.getBrowser, self.assets, self.scale = getBrowser, assets, scale
+        self.size, self.recycle = size, recycle
+        self._idle: Dict[str, List[Tuple[Page, int]]] = {}
+        self._sems: Dict[str, asyncio.Semaphore] = {}
+
+    async def newPage(self, html: str, timeout: float) -> Page:
+        """创建新页面，注册素材拦截，载入完整模板内容后注入 ``READY_SCRIPT``，载入时间不超过 ``timeout`` 秒"""
+        end = monotonic() + timeout
+        browser = await self.getBrowser()
+        page = await browser.new_page(
+            device_scale_factor=self.scale,
+            viewport={"width": 600, "height": 300},
+            base_url=ASSET_ORIGIN,
+        )
+        try:
+            await page.route(f"{ASSET_ORIGIN}/**", self.assets.serve)
+            await page.goto(f"{ASSET_ORIGIN}/", timeout=timeoutMs(timeout))
+            await page.set_content(
+                html, timeout=timeoutMs(end - monotonic()), wait_until="load"
+            )
+            await page.add_script_tag(content=READY_SCRIPT)
+        except BaseException:
+            await page.close()
+            raise
+        return page
+
+    @asynccontextmanager
+    async def fresh(self, html: str, timeout: float) -> AsyncIterator[Page]:
+        """获取不参与复用的一次性页面，页面载入时间不超过 ``timeout`` 秒"""
+        page = await self.newPage(html, timeout)
+        try:
+            yield page
+        finally:
+            await page.close()
+
+    @asynccontextmanager
+    async def page(
+        self, tplName: str, html: str, timeout: float
+    ) -> AsyncIterator[Page]:
+        """获取已载入指定模板内容的页面，页面全部占用时等待其他渲染归还，新页面载入时间不超过 ``timeout`` 秒"""
+        idle = self._idle.setdefault(tplName, [])
+        sem = self._sems.setdefault(tplName, asyncio.Semaphore(self.size))
+        async with sem:
+            page, uses = idle.pop() if idle else (None, 0)
+            healthy = False
+            try:
+                if page is None or page.is_closed():
+                    page, uses = await self.newPage(html, timeout), 0
+                else:
+                    mount = html.split(MOUNT_START)[-1].split(MOUNT_END)[0]
+                    await page.evaluate("(html) => gspanelMount(html)", mount)
+                yield page
+                healthy = True
+            finally:
+                uses += 1
+                if healthy and uses < self.recycle and not page.is_closed():
+                    idle.append((page, uses))
+                elif page and not page.is_closed():
+                    await page.close()
+
+
+async def capture(
+    page: Page, timeout: float, imgType: str = "jpeg", quality: int = 100
+) -> Tuple[bytes, bool]:
+    """
+    等待模板中的字体、图片、图表全部就绪后截图，超时后照常截图
+
+    * ``param page: Page`` 已载入模板内容的页面
+    * ``param timeout: float`` 等待就绪的最长时间（秒），不大于 0 时不等待
+    * ``param imgType: str`` 截图格式，可选 ``jpeg`` ``png``
+    * ``param quality: int`` 截图质量，仅 ``jpeg`` 格式有效
+    - ``return: Tuple[bytes, bool]`` 图片字节、是否在超时前就绪
+    """
+    ready = True
+    try:
+        await page.wait_for_function(
+            "window.gspanelReady === true", timeout=timeoutMs(timeout)
+        )
+    except PlaywrightTimeoutError:
+        ready = False
+    if imgType == "png":
+        return await page.screenshot(full_page=True, type="png"), ready
+    return await page.screenshot(full_page=True, type="jpeg", quality=quality), ready
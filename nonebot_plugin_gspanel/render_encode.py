@@ -0,0 +1,85 @@
+"""
+渲染图片编码，Pillow 为可选依赖，未安装时仅能使用浏览器直接输出的 JPEG / PNG 图片
+"""
+
+from io import BytesIO
+from pathlib import Path
+from typing import Union, Optional
+
+from .data_io import writeAtomic
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 图片格式对应的文件扩展名
+IMAGE_EXT = {"jpeg": "jpg", "webp": "webp", "png": "png"}
+
+
+def hasPillow() -> bool:
+    return Image is not None
+
+
+def _save(img, fmt: str, quality: int) -> bytes:
+    buf = BytesIO()
+    if fmt == "png":
+        img.save(buf, "PNG", optimize=True)
+    elif fmt == "webp":
+        img.save(buf, "WEBP", quality=quality, method=4)
+    else:
+        img.save(buf, "JPEG", quality=quality, optimize=True, subsampling=0)
+    return buf.getvalue()
+
+
+def encodeImage(
+    raw: Union[bytes, "Image.Image"],
+    fmt: str,
+    quality: int,
+    budget: int = 0,
+    minQuality: int = 40,
+) -> bytes:
+    """
+    浏览器截图重新编码，设置大小预算时二分查找不超出预算的最高质量
+
+    * ``param raw: Union[bytes, Image.Image]`` 浏览器截图（一般为无损 PNG）或 Pillow 绘制的图片
+    * ``param fmt: str`` 输出格式，可选 ``jpeg`` ``webp`` ``png``
+    * ``param quality: int`` 最高质量，``png`` 格式无效
+    * ``param budget: int`` 图片大小预算（字节），为 0 时不限制
+    * ``param minQuality: int`` 查找质量的下限，下限质量仍超出预算时返回下限质量的图片
+    - ``return: bytes`` 编码后的图片字节
+    """
+    assert Image is not None, "图片重新编码需要安装 Pillow"
+    img = Image.open(BytesIO(raw)) if isinstance(raw, bytes) else raw
+    img = img.convert("RGB") if fmt != "png" else img
+    best = _save(img, fmt, quality)
+    if fmt == "png" or not budget or len(best) <= budget:
+        return best
+
+    fit: Optional[bytes] = None
+    lo, hi = minQuality, quality - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        out = _save(img, fmt, mid)
+        if len(out) <= budget:
+            fit, lo = out, mid + 1
+        else:
+            best, hi = out, mid - 1
+    return fit or best
+
+
+def resizeImage(src: Path, dst: Path, width: int) -> None:
+    """
+    图片等比缩小至指定宽度并保存为 WebP 格式，原图不大于指定宽度时仅转换格式
+
+    * ``param src: Path`` 原图路径
+    * ``param dst: Path`` 保存路径
+    * ``param width: int`` 目标宽度（像素）
+    """
+    assert Image is not None, "图片缩放需要安装 Pillow"
+    img = Image.open(src)
+    if img.width > width:
+        img = img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    # 先写入临时文件，避免同时进行的渲染读取到不完整的图片，同一图标同时缩放时各自写入
+    writeAtomic(dst, _save(img, "webp", 90))
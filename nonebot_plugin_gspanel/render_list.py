@@ -0,0 +1,310 @@
+"""
+角色列表卡片的 Pillow 渲染，按 ``list`` 模板的样式直接绘制图片，无需启动浏览器
+
+尺寸均以模板中的 CSS 像素表示，绘制时乘以缩放比例
+"""
+
+from math import ceil
+from pathlib import Path
+from threading import local
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageDraw, ImageFont, ImageFilter
+
+RGBA = Tuple[int, int, int, int]
+WIDTH, PER_ROW = 960, 8
+ELEM_BG = {
+    "火": "pyro",
+    "水": "hydro",
+    "风": "anemo",
+    "雷": "electro",
+    "草": "dendro",
+    "冰": "cryo",
+    "岩": "geo",
+}
+CHAR_RARITY = {5: (200, 124, 36, 173), 4: (148, 112, 187, 173)}
+CHAR_CONS = {
+    1: (92, 186, 194, 255),
+    2: (51, 157, 97, 255),
+    3: (62, 149, 185, 255),
+    4: (57, 85, 183, 255),
+    5: (83, 27, 169, 207),
+    6: (255, 87, 34, 255),
+}
+MARK_COLOR = {
+    "A": (214, 153, 255, 255),
+    "S": (214, 153, 255, 255),
+    "SS": (255, 230, 153, 255),
+    "SSS": (255, 230, 153, 255),
+    "ACE": (255, 87, 34, 255),
+    "ACE²": (255, 87, 34, 255),
+}
+TIME_TIPS = {
+    "warning": ("刷新可用时间 ", (255, 124, 55, 255)),
+    "error": ("本次刷新失败 ", (255, 86, 82, 255)),
+}
+AMBR_LIGHT, NOTE_BG = (233, 229, 220, 255), (46, 53, 62, 255)
+# 字体的 ascent / 行高（以字号为单位），与浏览器 line-height: normal 的排版一致
+PANEL_FONT, PANEL_METRICS = "HYWH-65W.ttf", (0.916, 1.217)
+NUM_FONT, NUM_METRICS = "tttgbnumber.ttf", ((220 + 23) / 256, 302 / 256)
+
+
+class ListCard:
+    """角色列表卡片绘制"""
+
+    def __init__(self, root: Path, scale: float) -> None:
+        self.root, self.scale = root, scale
+        self._local = local()
+
+    def s(self, v: float) -> int:
+        return round(v * self.scale)
+
+    def font(self, name: str, size: float) -> ImageFont.FreeTypeFont:
+        """字体对象按线程分别缓存，编码线程池中的多个线程不共用 FreeType 字体对象"""
+        fonts: Dict[Tuple[str, float], ImageFont.FreeTypeFont] = getattr(
+            self._local, "fonts", {}
+        )
+        self._local.fonts = fonts
+        if (name, size) not in fonts:
+            fonts[(name, size)] = ImageFont.truetype(
+                str(self.root / "font" / name), self.s(size)
+            )
+        return fonts[(name, size)]
+
+    def image(self, path: str, width: int) -> Image.Image:
+        """读取素材图片，优先使用已生成的缩略图，素材缺失时返回透明占位图"""
+        f = self.root / path
+        thumb = f.parent / "thumb" / f"{f.stem}-{self.s(width)}.webp"
+        if not thumb.exists() and not f.exists():
+            return Image.new("RGBA", (self.s(width), self.s(width)), (0,) * 4)
+        img = Image.open(thumb if thumb.exists() else f).convert("RGBA")
+        return img.resize((self.s(width), self.s(width * img.height / img.width)))
+
+    def text(
+        self,
+        layer: Image.Image,
+        xy: Tuple[float, float],
+        text: str,
+        font: Tuple[str, Tuple[float, float]],
+        size: float,
+        fill: RGBA,
+        anchor: str = "ls",
+        stroke: int = 0,
+    ) -> float:
+        """按行框顶部坐标绘制单行文字，返回文字宽度（CSS 像素）"""
+        x, top = xy
+        ascent = font[1][0] * size
+        ImageDraw.Draw(layer).text(
+            (self.s(x), self.s(top + ascent)),
+            text,
+            font=self.font(font[0], size),
+            fill=fill,
+            anchor=anchor,
+            stroke_width=stroke,
+            stroke_fill=fill,
+        )
+        return self.font(font[0], size).getlength(text) / self.scale
+
+    @lru_cache(maxsize=16)
+    def shadowPatch(
+        self, w: float, h: float, radius: float, blur: float, color: RGBA
+    ) -> Image.Image:
+        pad = blur * 2
+        patch = Image.new("RGBA", (self.s(w + pad * 2), self.s(h + pad * 2)), (0,) * 4)
+        ImageDraw.Draw(patch).rounded_rectangle(
+            (self.s(pad), self.s(pad), self.s(pad + w), self.s(pad + h)),
+            self.s(radius),
+            fill=color,
+        )
+        return patch.filter(ImageFilter.GaussianBlur(self.s(blur / 2)))
+
+    def shadow(
+        self,
+        canvas: Image.Image,
+        box: Tuple[float, float, float, float],
+        radius: float,
+        offset: float,
+        blur: float,
+        color: RGBA,
+    ) -> None:
+        """绘制圆角矩形投影，对应 CSS ``box-shadow: 0 offset blur color``"""
+        x0, y0, x1, y1 = box
+        patch = self.shadowPatch(x1 - x0, y1 - y0, radius, blur, color)
+        pos = (self.s(x0 - blur * 2), self.s(y0 - blur * 2 + offset))
+        # 投影超出画布的部分直接裁去
+        crop = (max(-pos[0], 0), max(-pos[1], 0))
+        canvas.alpha_composite(
+            patch.crop((*crop, patch.width, patch.height)),
+            (pos[0] + crop[0], pos[1] + crop[1]),
+        )
+
+    @lru_cache(maxsize=8)
+    def background(self, elem: str, height: float) -> Image.Image:
+        """元素背景图，对应 CSS ``background-size: cover; background-position: center``"""
+        size = (self.s(WIDTH), self.s(height))
+        bg = Image.open(self.root / "imgs" / f"bg-{ELEM_BG.get(elem, 'pyro')}.jpg")
+        ratio = max(size[0] / bg.width, size[1] / bg.height)
+        bg = bg.convert("RGBA").resize(
+            (ceil(bg.width * ratio), ceil(bg.height * ratio)), Image.LANCZOS
+        )
+        left, top = (bg.width - size[0]) // 2, (bg.height - size[1]) // 2
+        return bg.crop((left, top, left + size[0], top + size[1]))
+
+    def avatar(self, avatar: Dict) -> Image.Image:
+        """单个角色头像与等级、命座、圣遗物评分，对应 ``div.avatar``，占位 100x126.4"""
+        # 图层额外留出投影的高度
+        layer = Image.new("RGBA", (self.s(100), self.s(136)), (0,) * 4)
+        draw = ImageDraw.Draw(layer)
+        # 头像：72px 图片 + 2px 白色边框，圆形裁切
+        x0, x1 = 12, 88
+        self.shadow(layer, (x0, 0, x1, 76), 38, 3, 3, (0, 0, 0, 255))
+        draw.ellipse((self.s(x0), 0, self.s(x1), self.s(76)), fill=(255,) * 4)
+        inner = (self.s(x0 + 2), self.s(2), self.s(x1 - 2), self.s(74))
+        draw.ellipse(inner, fill=CHAR_RARITY.get(avatar["rarity"], CHAR_RARITY[4]))
+        icon = self.image(f"{avatar['name']}/{avatar['icon']}.png", 72)
+        mask = Image.new("L", icon.size, 0)
+        ImageDraw.Draw(mask).ellipse((0, 0, *icon.size), fill=255)
+        icon.putalpha(Image.composite(icon.getchannel("A"), mask, mask))
+        layer.alpha_composite(icon, inner[:2])
+
+        # 信息框：图片行框高度为 76 + 字体 descent，框体上移 5px
+        top = 76 + 16 * (PANEL_METRICS[1] - PANEL_METRICS[0]) - 5
+        lineH = NUM_METRICS[1] * 13
+        box = (10, top, 90, top + 5 + lineH + 10 + lineH)
+        self.shadow(layer, box, 5, 5, 5, (0, 0, 0, 102))
+        draw.rounded_rectangle(tuple(self.s(v) for v in box), self.s(5), fill=NOTE_BG)
+
+        # 等级与命座，整体水平居中
+        font = self.font(NUM_FONT, 13)
+        lvl, cons = f"Lv{avatar['level']}", avatar["cons"]
+        consText = f"C{cons}"
+        consW = font.getlength(consText) / self.scale + (8 if cons else 0)
+        lineW = font.getlength(lvl) / self.scale + 13 * 0.7 + consW
+        x, y = 50 - lineW / 2, top + 5
+        x += self.text(layer, (x, y), lvl, (NUM_FONT, NUM_METRICS), 13, AMBR_LIGHT)
+        x += 13 * 0.7
+        if cons:
+            # 行内元素背景覆盖字体 ascent + descent 区域及上下 2px 内边距
+            bgTop = y + 23 / 256 * 13 - 2
+            bgBottom = bgTop + 13 + 4
+            draw.rounded_rectangle(
+                (self.s(x), self.s(bgTop), self.s(x + consW), self.s(bgBottom)),
+                self.s(3),
+                fill=CHAR_CONS.get(cons, CHAR_CONS[6]),
+            )
+            x += 4
+        self.text(layer, (x, y), consText, (NUM_FONT, NUM_METRICS), 13, AMBR_LIGHT)
+
+        # 圣遗物评级与总分
+        rank, total = avatar["relicCalc"]["rank"], avatar["relicCalc"]["total"]
+        color = MARK_COLOR.get(rank, (255,) * 4)
+        if rank == "NaN":
+            color = AMBR_LIGHT[:3] + (128,)
+        # 数字字体不含空格，评级与总分之间的 3 个空格按正文字体宽度留空
+        rank, total = rank.replace("²", "2"), str(total)
+        gap = self.font(PANEL_FONT, 13).getlength("   ") / self.scale
+        rankW = font.getlength(rank) / self.scale
+        totalW = font.getlength(total) / self.scale
+        x = 50 - (rankW + gap + totalW) / 2
+        y += lineH + 5
+        self.text(layer, (x, y), rank, (NUM_FONT, NUM_METRICS), 13, color)
+        x += rankW + gap
+        self.text(layer, (x, y), total, (NUM_FONT, NUM_METRICS), 13, color)
+        return layer
+
+    def draw(self, uid: str, data: Dict) -> Image.Image:
+        avatars: List[Dict] = data.get("avatars", [])
+        tip, tipTime = (data.get("timetips") or ["", ""])[:2]
+        rows = ceil(len(avatars) / PER_ROW)
+        titleH = 32 + PANEL_METRICS[1] * 32
+        listTop = titleH + 20
+        listH = 10 + rows * 126.4 + max(rows - 1, 0) * 10 + 10
+        noteTop = listTop + listH
+        copyTop = noteTop + 50 + 20
+        height = copyTop + PANEL_METRICS[1] * 20 + 20
+
+        elem = avatars[0]["element"] if avatars else ""
+        canvas = self.background(elem, height).copy()
+        panelFont = (PANEL_FONT, PANEL_METRICS)
+
+        # 标题，粗体以描边近似
+        title = [(f"UID {uid}", 64), (f"查询可用角色 {len(avatars)} 位", 0)]
+        titleFont = self.font(PANEL_FONT, 32)
+        widths = [titleFont.getlength(t) / self.scale + gap for t, gap in title]
+        shadow = Image.new("RGBA", (canvas.width, self.s(listTop)), (0,) * 4)
+        x = (WIDTH - sum(widths)) / 2
+        for (t, _), w in zip(title, widths):
+            self.text(shadow, (x + 2, 34), t, panelFont, 32, (0, 0, 0, 178), stroke=1)
+            x += w
+        canvas.alpha_composite(shadow.filter(ImageFilter.GaussianBlur(self.s(2))))
+        x = (WIDTH - sum(widths)) / 2
+        for (t, _), w in zip(title, widths):
+            self.text(canvas, (x, 32), t, panelFont, 32, (255,) * 4, stroke=1)
+            x += w
+
+        # 列表与底部说明的背景、投影
+        listBox = (30, listTop, 930, noteTop + 50)
+        self.shadow(canvas, listBox, 15, 15, 15, (0, 0, 0, 102))
+        panel = Image.new("RGBA", canvas.size, (0,) * 4)
+        ImageDraw.Draw(panel).rounded_rectangle(
+            (self.s(30), self.s(listTop), self.s(930) - 1, self.s(noteTop) - 1),
+            self.s(15),
+            fill=(51, 51, 51, 153),
+            corners=(True, True, False, False),
+        )
+        canvas.alpha_composite(panel)
+        note = Image.new("RGBA", canvas.size, (0,) * 4)
+        ImageDraw.Draw(note).rounded_rectangle(
+            (self.s(30), self.s(noteTop), self.s(930) - 1, self.s(noteTop + 50) - 1),
+            self.s(15),
+            fill=NOTE_BG,
+            corners=(False, False, True, True),
+        )
+        noteY = noteTop + (50 - PANEL_METRICS[1] * 18) / 2
+        tipText = "· 透明显示的角色为本地缓存，数据可能过时"
+        self.text(note, (50, noteY), tipText, panelFont, 18, AMBR_LIGHT)
+        label, color = TIME_TIPS.get(tip, ("刷新完成时间 ", (144, 232, 0, 255)))
+        tipTime = f"{label}{tipTime}"
+        self.text(note, (910, noteY), tipTime, panelFont, 18, color, anchor="rs")
+        note.putalpha(note.getchannel("A").point(lambda a: round(a * 0.9)))
+        canvas.alpha_composite(note)
+
+        # 角色，透明显示未刷新的角色
+        for idx, avatar in enumerate(avatars):
+            row, col = divmod(idx, PER_ROW)
+            layer = self.avatar(avatar)
+            if not avatar.get("refreshed"):
+                layer.putalpha(layer.getchannel("A").point(lambda a: a // 2))
+            canvas.alpha_composite(
+                layer, (self.s(35 + col * 110), self.s(listTop + 10 + row * 136.4))
+            )
+
+        # 版权信息
+        text = "Data from Enka.Network × Powered by NoneBot2 × Inspired by Miao-Plugin"
+        footer = Image.new("RGBA", (canvas.width, canvas.height - self.s(copyTop)))
+        shadowColor = (51, 51, 51, 173)
+        self.text(footer, (WIDTH / 2 + 3, 5), text, panelFont, 20, shadowColor, "ms")
+        footer = footer.filter(ImageFilter.GaussianBlur(self.s(2)))
+        self.text(footer, (WIDTH / 2, 0), text, panelFont, 20, (255,) * 4, "ms")
+        footer.putalpha(footer.getchannel("A").point(lambda a: round(a * 0.68)))
+        canvas.alpha_composite(footer, (0, self.s(copyTop)))
+        return canvas
+
+
+@lru_cache(maxsize=4)
+def _card(root: Path, scale: float) -> ListCard:
+    return ListCard(root, scale)
+
+
+def drawList(root: Path, scale: float, uid: str, data: Dict) -> Image.Image:
+    """
+    角色列表卡片绘制
+
+    * ``param root: Path`` 插件资源目录
+    * ``param scale: float`` 缩放比例
+    * ``param uid: str`` 查询用户 UID
+    * ``param data: Dict`` 角色列表数据，与 ``list`` 模板上下文中的 ``data`` 相同
+    - ``return: Image.Image`` RGBA 图片
+    """
+    return _card(root, scale).draw(uid, data)
@@ -0,0 +1,88 @@
+"""
+独立渲染进程，``gspanel_render_processes`` 大于 0 时由插件启动，自行管理浏览器并通过标准输入输出通信
+
+每帧均为 4 字节大端长度 + 内容：
+
+- 请求：JSON ``{"tpl": "list-0.2.26.html", "html": "...", "type": "jpeg", "quality": 100}``
+  可选 ``"timeout": 10.0`` 为页面载入与等待就绪的总时间（秒），缺省时使用 ``--timeout``
+- 响应：JSON ``{"ok": true, "ready": true, "error": ""}``，紧随其后为图片字节（出错时为空）
+"""
+
+import sys
+import json
+import struct
+import asyncio
+import argparse
+from pathlib import Path
+from typing import BinaryIO
+
+from playwright.async_api import async_playwright
+
+# 作为脚本运行，不经过插件包的 __init__.py（其依赖 NoneBot 初始化）
+sys.path.insert(0, str(Path(__file__).parent))
+from render_browser import PagePool, AssetCache, capture  # noqa: E402
+
+
+async def readFrame(reader: asyncio.StreamReader) -> bytes:
+    (size,) = struct.unpack(">I", await reader.readexactly(4))
+    return await reader.readexactly(size)
+
+
+def writeFrame(out: BinaryIO, data: bytes) -> None:
+    out.write(struct.pack(">I", len(data)) + data)
+    out.flush()
+
+
+async def serve(args: argparse.Namespace, out: BinaryIO) -> None:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=2**26)
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+    )
+    async with async_playwright() as p:
+        browser = await p.chromium.launch()
+
+        async def getBrowser():
+            return browser
+
+        pool = PagePool(
+            getBrowser,
+            AssetCache(Path(args.root), args.asset_cache),
+            args.scale,
+            args.pool,
+            args.recycle,
+        )
+        while True:
+            try:
+                req = json.loads(await readFrame(reader))
+            except asyncio.IncompleteReadError:
+                break
+            end = loop.time() + req.get("timeout", args.timeout)
+            try:
+                async with pool.page(
+                    req["tpl"], req["html"], end - loop.time()
+                ) as page:
+                    img, ready = await capture(
+                        page, end - loop.time(), req["type"], req["quality"]
+                    )
+                header = {"ok": True, "ready": ready, "error": ""}
+            except Exception as e:
+                img, error = b"", f"[{e.__class__.__name__}] {e}"
+                header = {"ok": False, "ready": False, "error": error}
+            writeFrame(out, json.dumps(header).encode("utf-8"))
+            writeFrame(out, img)
+        await browser.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", required=True, help="插件资源目录")
+    parser.add_argument("--scale", type=float, default=1.5)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--pool", type=int, default=2)
+    parser.add_argument("--recycle", type=int, default=50)
+    parser.add_argument("--asset-cache", type=int, default=64 * 1024 * 1024)
+    args = parser.parse_args()
+    # 标准输出专用于传输结果，其他输出一律转向标准错误
+    out, sys.stdout = sys.stdout.buffer, sys.stderr
+    asyncio.run(serve(args, out))
@@ -0,0 +1,25 @@
+"""
+角色列表卡片 Pillow 绘制与 HTML 模板渲染结果的像素差异检查，需要已安装 Playwright 浏览器与 Pillow
+
+    python -m pytest tests
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("PIL")
+sys.path.insert(0, str(Path(__file__).parent.parent / "benchmarks"))
+import bench_list  # noqa: E402
+
+
+def test_pillow_list_matches_template() -> None:
+    server, resDir = bench_list.setup()
+    try:
+        _, browser, pillow = asyncio.run(bench_list.render(resDir, 1))
+    finally:
+        server.shutdown()
+    diff = bench_list.pixelDiff(browser, pillow)
+    assert diff["mean"] <= bench_list.MAX_DIFF, diff